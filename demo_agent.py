@@ -1,109 +1,512 @@
-import requests
+"""
+Saturn Browser MCP agent: demo client and load generator for the Electron MCP server.
+
+    python demo_agent.py                       # one session: handshake, run the accessibility audit
+    python demo_agent.py load --sessions 50 --calls 20 --inflight 4 [--tool NAME --args JSON]
+    python demo_agent.py stub [--port 3005]    # offline stand-in for electron/mcp-server.ts
+    python demo_agent.py load --stub           # load test against an in-process stub
+
+The client speaks MCP over the SSE transport: GET /sse opens the event
+stream, and its first `endpoint` event names the URL (with sessionId)
+that JSON-RPC messages are POSTed to. Responses come back as `message`
+events on the stream and are matched to their request by `id`, so one
+session can have many calls in flight. All sessions share the HTTP
+clients: each stream holds a connection of its own, and POSTs share a
+small pool of keep-alive connections (--connections).
+
+The load mode reports handshake and per-method round-trip latency
+histograms (POST sent to response event received), errors, throughput
+and the client's own CPU use. httpx costs over a millisecond of CPU per
+POST, so one process tops out at a few hundred calls/s; past that the
+latencies measure the client. The stub answers initialize, tools/list
+and tools/call for the tools mcp-server.ts registers, after a
+configurable delay.
+"""
+
+import argparse
+import asyncio
+import itertools
 import json
-import threading
-import time
+import random
 import sys
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+import httpx
 
 # Configuration
-MCP_SERVER_URL = "http://localhost:3005/sse"
-POST_URL = "http://localhost:3005/messages"
-
-def listen_for_events():
-    print("[Agent] Connecting to SSE stream...")
-    
-    with requests.get(MCP_SERVER_URL, stream=True) as response:
-        if response.status_code != 200:
-            print(f"[Agent] Failed to connect: {response.status_code}")
-            return
+MCP_SERVER_URL = "http://localhost:3005"
+SSE_PATH = "/sse"
+PROTOCOL_VERSION = "2024-11-05"
+CALL_TIMEOUT = 30.0 # The server gives up on the renderer after 30 s
+STUB_TOOLS = ["browser_run_tests", "browser_get_content", "browser_check_links", "browser_execution"]
+
+# ============================================================================
+# SSE
+# ============================================================================
 
-        print("[Agent] Connected! Listening for events...")
-        
-        for line in response.iter_lines():
-            if line:
-                decoded_line = line.decode('utf-8')
-                
-                # Check for "event: endpoint" which carries the session ID path
-                # Standard SSE format: 
-                # event: endpoint
-                # data: /messages?sessionId=...
-                
-                # Note: iter_lines yields lines. We need to track state.
-                # But for this simple demo, we can just look for the data line containing sessionId
-                
-                if decoded_line.startswith("data: /messages?sessionId="):
-                    # Found it!
-                    endpoint_data = decoded_line.replace("data: ", "").strip()
-                    session_id = endpoint_data.split("sessionId=")[1]
-                    
-                    print(f"\n[Agent] ✅ Handshake Successful!")
-                    print(f"[Agent] Session ID: {session_id}")
-                    
-                    # Start the test sequence in a separate thread so we don't block the stream reader
-                    threading.Thread(target=run_demo_sequence, args=(session_id,)).start()
-
-                elif decoded_line.startswith("data:"):
-                    # Handle normal messages (JSON-RPC)
-                    try:
-                        json_str = decoded_line.replace("data: ", "")
-                        data = json.loads(json_str)
-                        
-                        print(f"\n[Agent] 📩 Received Message:")
-                        print(json.dumps(data, indent=2))
-                        
-                        # Verify what we got back
-                        if "result" in data and "content" in data["result"]:
-                            content = data["result"]["content"][0]["text"]
-                            print("\n[Agent] 📊 Test Results parsed:")
-                            print(content[:500] + "..." if len(content) > 500 else content)
-                            
-                            print("\n[Agent] Demo Complete. Use Ctrl+C to exit.")
-                            
-                    except json.JSONDecodeError:
-                        pass # Ignore heartbeat or raw data
-
-def run_demo_sequence(session_id):
+@dataclass
+class SSEEvent:
+    event: str = "message"
+    data: str = ""
+    id: Optional[str] = None
+
+class SSEParser:
+    """Incremental text/event-stream parser (WHATWG rules).
+
+    Feed it decoded text in chunks of any size; it returns the events
+    completed so far. Lines end in CRLF, LF or CR; data lines accumulate
+    joined by newlines; comments (":") are ignored; a blank line
+    dispatches; an event with no data is dropped.
     """
-    Simulates the AI Agent action
+    def __init__(self):
+        self._buffer = ""
+        self._event, self._data, self.last_id = "", [], None
+        self.retry_ms = None
+
+    def feed(self, text: str) -> List[SSEEvent]:
+        self._buffer += text
+        events = []
+        while True:
+            cut = min((i for i in (self._buffer.find("\r"), self._buffer.find("\n")) if i >= 0), default=-1)
+            if cut < 0: break
+            # A CR at the end of the buffer may be the first half of a CRLF
+            if self._buffer[cut] == "\r" and cut == len(self._buffer) - 1: break
+            line = self._buffer[:cut]
+            skip = 2 if self._buffer.startswith("\r\n", cut) else 1
+            self._buffer = self._buffer[cut + skip :]
+            event = self._line(line)
+            if event is not None: events.append(event)
+        return events
+
+    def _line(self, line: str) -> Optional[SSEEvent]:
+        if not line:
+            if not self._data:
+                self._event = ""
+                return None
+            event = SSEEvent(self._event or "message", "\n".join(self._data), self.last_id)
+            self._event, self._data = "", []
+            return event
+        if line.startswith(":"): return None
+        field, _, value = line.partition(":")
+        if value.startswith(" "): value = value[1:]
+        if field == "event": self._event = value
+        elif field == "data": self._data.append(value)
+        elif field == "id" and "\0" not in value: self.last_id = value
+        elif field == "retry" and value.isdigit(): self.retry_ms = int(value)
+        return None
+
+# ============================================================================
+# MCP client
+# ============================================================================
+
+class JsonRpcError(Exception):
+    def __init__(self, error: Dict[str, Any]):
+        super().__init__(f"{error.get('code')}: {error.get('message')}")
+        self.code = error.get("code")
+
+class McpSession:
+    """One SSE session. call() may be awaited concurrently; responses are matched by id."""
+    def __init__(self, pool: "ClientPool", base_url: str):
+        self.pool = pool
+        self.base_url = base_url
+        self.endpoint: Optional[str] = None
+        self.server_info: Dict[str, Any] = {}
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._endpoint_ready: Optional[asyncio.Future] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self, timeout: float = 10.0):
+        """Open the stream and wait for the endpoint event."""
+        self._endpoint_ready = asyncio.get_running_loop().create_future()
+        self._reader = asyncio.create_task(self._read_stream())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._endpoint_ready), timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def initialize(self, client_name: str = "saturn-demo-agent"):
+        result = await self.call("initialize", {
+            "protocolVersion": PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": client_name, "version": "1.0.0"},
+        })
+        self.server_info = result.get("serverInfo", {})
+        await self.notify("notifications/initialized")
+        return result
+
+    async def call(self, method: str, params: Optional[Dict[str, Any]] = None, timeout: float = CALL_TIMEOUT):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._post({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}})
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def notify(self, method: str, params: Optional[Dict[str, Any]] = None):
+        await self._post({"jsonrpc": "2.0", "method": method, **({"params": params} if params else {})})
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+
+    async def _post(self, message: Dict[str, Any]):
+        if self.endpoint is None: raise ConnectionError("Session is not connected")
+        response = await self.pool.post(self.endpoint, message)
+        if response.status_code >= 300:
+            raise ConnectionError(f"POST {response.status_code}: {response.text[:200]}")
+
+    async def _read_stream(self):
+        error: BaseException = ConnectionError("SSE stream closed")
+        try:
+            async with self.pool.streams.stream("GET", urljoin(self.base_url, SSE_PATH),
+                                          headers={"Accept": "text/event-stream"}) as response:
+                if response.status_code != 200:
+                    raise ConnectionError(f"SSE connect failed: {response.status_code}")
+                parser = SSEParser()
+                async for text in response.aiter_text():
+                    for event in parser.feed(text):
+                        await self._dispatch(event)
+        except asyncio.CancelledError:
+            error = ConnectionError("Session closed")
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            # Nothing else will answer these
+            if self._endpoint_ready is not None and not self._endpoint_ready.done():
+                self._endpoint_ready.set_exception(error)
+            for future in self._pending.values():
+                if not future.done(): future.set_exception(error)
+
+    async def _dispatch(self, event: SSEEvent):
+        if event.event == "endpoint":
+            self.endpoint = urljoin(self.base_url, event.data.strip())
+            if not self._endpoint_ready.done(): self._endpoint_ready.set_result(self.endpoint)
+            return
+        if event.event != "message": return
+        try:
+            message = json.loads(event.data)
+        except json.JSONDecodeError:
+            return
+        if "method" in message:
+            # Server-initiated request; ping is the only one a tools client must answer
+            if message.get("method") == "ping" and "id" in message:
+                asyncio.create_task(self._post({"jsonrpc": "2.0", "id": message["id"], "result": {}}))
+            return
+        future = self._pending.get(message.get("id"))
+        if future is None or future.done(): return
+        if "error" in message: future.set_exception(JsonRpcError(message["error"]))
+        else: future.set_result(message.get("result", {}))
+
+class ClientPool:
+    """HTTP clients shared by every session.
+
+    Streams get a client of their own: they hold their connection for the
+    session's lifetime, and httpx scans every pooled connection when it
+    places a request, so mixing them in would slow every POST down. POSTs
+    wait on a semaphore sized to the pool rather than in httpx's own queue,
+    which it rescans in full each time a connection frees up.
     """
-    time.sleep(2) # Give the connection a moment to stabilize
-    
-    print(f"\n[Agent] 🤖 Requesting Accessibility Audit...")
-    
-    # JSON-RPC Payload
-    payload = {
-        "jsonrpc": "2.0",
-        "method": "tools/call",
-        "id": 1,
-        "params": {
+    def __init__(self, connections: int = 8):
+        self.streams = httpx.AsyncClient(limits=httpx.Limits(max_connections=None, max_keepalive_connections=0),
+                                         timeout=httpx.Timeout(10.0, read=None))
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        self.posts = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(10.0, pool=None))
+        self._slots = asyncio.Semaphore(connections)
+
+    async def post(self, url: str, message: Dict[str, Any]) -> httpx.Response:
+        async with self._slots:
+            return await self.posts.post(url, json=message)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.streams.aclose()
+        await self.posts.aclose()
+
+# ============================================================================
+# Latency reporting
+# ============================================================================
+
+class LatencyHistogram:
+    BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+    def __init__(self):
+        self.samples: List[float] = []
+
+    def add(self, seconds: float):
+        self.samples.append(seconds * 1000)
+
+    def percentile(self, p: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] if ordered else 0.0
+
+    def render(self, width: int = 40) -> str:
+        counts = [0] * (len(self.BOUNDS_MS) + 1)
+        for ms in self.samples:
+            counts[next((i for i, b in enumerate(self.BOUNDS_MS) if ms <= b), len(self.BOUNDS_MS))] += 1
+        peak = max(counts) or 1
+        lines = []
+        for i, n in enumerate(counts):
+            if not n: continue
+            label = f"<= {self.BOUNDS_MS[i]} ms" if i < len(self.BOUNDS_MS) else f"> {self.BOUNDS_MS[-1]} ms"
+            lines.append(f"  {label:>12} {n:7} {'#' * max(1, round(n / peak * width))}")
+        return "\n".join(lines)
+
+class LoadReport:
+    def __init__(self):
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, int] = {}
+
+    def ok(self, name: str, seconds: float):
+        self.latency.setdefault(name, LatencyHistogram()).add(seconds)
+
+    def error(self, name: str, exc: BaseException):
+        key = f"{name}: {type(exc).__name__}"
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def print(self, elapsed: float, cpu: float):
+        calls = sum(len(h.samples) for name, h in self.latency.items() if name != "handshake")
+        print(f"\n{calls} calls in {elapsed:.1f}s, {calls / elapsed:.1f} calls/s, client CPU {cpu / elapsed:.0%}")
+        if cpu / elapsed > 0.9: print("(the client is saturated: latencies include its own queueing)")
+        for name, hist in self.latency.items():
+            print(f"\n{name}: n={len(hist.samples)} p50={hist.percentile(50):.1f} ms "
+                  f"p90={hist.percentile(90):.1f} ms p99={hist.percentile(99):.1f} ms max={max(hist.samples):.1f} ms")
+            print(hist.render())
+        if self.errors:
+            print("\nerrors:")
+            for key, n in sorted(self.errors.items()): print(f"  {n:7}  {key}")
+
+# ============================================================================
+# Modes
+# ============================================================================
+
+async def run_demo(base_url: str):
+    async with ClientPool(1) as pool:
+        session = McpSession(pool, base_url)
+        print("[Agent] Connecting to SSE stream...")
+        await session.connect()
+        print(f"[Agent] ✅ Handshake successful, endpoint {session.endpoint}")
+        await session.initialize()
+        print(f"[Agent] Server: {session.server_info.get('name')} {session.server_info.get('version', '')}")
+        tools = await session.call("tools/list")
+        print(f"[Agent] Tools: {', '.join(t['name'] for t in tools.get('tools', []))}")
+
+        print("\n[Agent] 🤖 Requesting Accessibility Audit...")
+        result = await session.call("tools/call", {
             "name": "browser_run_tests",
-            "arguments": {
-                "category": "accessibility",
-                "url": "https://example.com"
-            }
-        }
-    }
-    
+            "arguments": {"category": "accessibility", "url": "https://example.com"},
+        })
+        content = result["content"][0]["text"] if result.get("content") else json.dumps(result)
+        print("\n[Agent] 📊 Test Results:")
+        print(content[:500] + "..." if len(content) > 500 else content)
+        await session.close()
+
+async def run_session(pool: ClientPool, base_url: str, args, report: LoadReport, stagger: float):
+    await asyncio.sleep(stagger)
+    session = McpSession(pool, base_url)
+    start = time.perf_counter()
     try:
-        res = requests.post(
-            POST_URL, 
-            params={"sessionId": session_id},
-            json=payload
-        )
-        
-        if res.status_code == 200:
-            print("[Agent] Command sent! Waiting for browser response...")
-        else:
-            print(f"[Agent] ❌ Error sending command: {res.status_code} - {res.text}")
-            
+        await session.connect()
+        await session.initialize()
     except Exception as e:
-        print(f"[Agent] Connection error during POST: {e}")
+        report.error("handshake", e)
+        await session.close()
+        return
+    report.ok("handshake", time.perf_counter() - start)
 
-if __name__ == "__main__":
-    print("--- Saturn Browser MCP Demo Agent (Raw Stream) ---")
+    calls = iter(range(args.calls))
+    async def worker():
+        for _ in calls:
+            start = time.perf_counter()
+            try:
+                await session.call("tools/call", {"name": args.tool, "arguments": args.arguments}, args.timeout)
+                report.ok(f"tools/call {args.tool}", time.perf_counter() - start)
+            except Exception as e:
+                report.error(f"tools/call {args.tool}", e)
+    await asyncio.gather(*(worker() for _ in range(args.inflight)))
+    await session.close()
+
+async def run_load(base_url: str, args):
+    report = LoadReport()
+    print(f"[Load] {args.sessions} sessions x {args.calls} calls of {args.tool}, "
+          f"{args.inflight} in flight per session, {args.connections} connections, against {base_url}")
+    async with ClientPool(args.connections) as pool:
+        start, cpu = time.perf_counter(), time.process_time()
+        await asyncio.gather(*(run_session(pool, base_url, args, report, i * args.ramp / max(args.sessions, 1))
+                               for i in range(args.sessions)))
+        elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+    report.print(elapsed, cpu)
+
+# ============================================================================
+# Stub server
+# ============================================================================
+
+class StubMcpServer:
+    """Minimal HTTP/1.1 server with mcp-server.ts's routes, for offline runs.
+
+    Events go out in chunked encoding like Express, each split across two
+    chunks so clients must reassemble them. Tool calls are answered after
+    `latency_ms` (exponentially distributed around it).
+    """
+    def __init__(self, latency_ms: float = 20.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.rng = random.Random(seed)
+        self.streams: Dict[str, asyncio.StreamWriter] = {}
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.server = await asyncio.start_server(self._handle, host, port)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def close(self):
+        for writer in self.streams.values(): writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True: # Keep-alive: one request after another
+                request_line = await reader.readline()
+                if not request_line: break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := (await reader.readline()).decode("latin-1").strip()):
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                url = urlsplit(target)
+                if method == "GET" and url.path == SSE_PATH:
+                    await self._open_stream(reader, writer)
+                    return
+                if method == "POST" and url.path == "/messages":
+                    session_id = parse_qs(url.query).get("sessionId", [""])[0]
+                    if session_id not in self.streams:
+                        self._respond(writer, 404, b"Session not found")
+                    else:
+                        self._respond(writer, 202, b"Accepted")
+                        asyncio.create_task(self._answer(session_id, json.loads(body)))
+                else:
+                    self._respond(writer, 404, b"Not found")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            if not writer.is_closing(): writer.close()
+
+    @staticmethod
+    def _respond(writer, status: int, body: bytes):
+        reason = {202: "Accepted", 404: "Not Found"}.get(status, "OK")
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+
+    async def _open_stream(self, reader, writer):
+        session_id = str(uuid.uuid4())
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Connection: keep-alive\r\nTransfer-Encoding: chunked\r\n\r\n")
+        self.streams[session_id] = writer
+        try:
+            self._send(session_id, f"event: endpoint\ndata: /messages?sessionId={session_id}\n\n")
+            while True: # Comment every 15 s until the client hangs up
+                try:
+                    if not await asyncio.wait_for(reader.read(1024), 15): break
+                except asyncio.TimeoutError:
+                    self._send(session_id, ": keep-alive\n\n")
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.streams.pop(session_id, None)
+
+    def _send(self, session_id: str, text: str):
+        writer = self.streams.get(session_id)
+        if writer is None or writer.is_closing(): return
+        data = text.encode()
+        for part in (data[: len(data) // 2], data[len(data) // 2 :]):
+            if part: writer.write(b"%x\r\n%s\r\n" % (len(part), part))
+
+    async def _answer(self, session_id: str, message: Dict[str, Any]):
+        if "id" not in message: return # Notification
+        method, params = message.get("method"), message.get("params") or {}
+        if method == "initialize":
+            result = {"protocolVersion": PROTOCOL_VERSION, "capabilities": {"tools": {}},
+                      "serverInfo": {"name": "Saturn Browser (stub)", "version": "1.0.0"}}
+        elif method == "tools/list":
+            result = {"tools": [{"name": name, "inputSchema": {"type": "object"}} for name in STUB_TOOLS]}
+        elif method == "tools/call" and params.get("name") in STUB_TOOLS:
+            await asyncio.sleep(self.rng.expovariate(1 / self.latency_ms) / 1000 if self.latency_ms else 0)
+            text = json.dumps({"tool": params["name"], "arguments": params.get("arguments", {}), "passed": True})
+            result = {"content": [{"type": "text", "text": text}]}
+        else:
+            error = f"Unknown tool: {params.get('name')}" if method == "tools/call" else f"Method not found: {method}"
+            self._send(session_id, "event: message\ndata: " + json.dumps({
+                "jsonrpc": "2.0", "id": message["id"], "error": {"code": -32601, "message": error},
+            }) + "\n\n")
+            return
+        self._send(session_id, "event: message\ndata: "
+                   + json.dumps({"jsonrpc": "2.0", "id": message["id"], "result": result}) + "\n\n")
+
+async def serve_stub(port: int, latency_ms: float):
+    stub = StubMcpServer(latency_ms)
+    url = await stub.start(port=port)
+    print(f"[Stub] MCP stub listening on {url}{SSE_PATH}")
+    await asyncio.Event().wait()
+
+async def with_stub(latency_ms: float, run):
+    stub = StubMcpServer(latency_ms)
+    url = await stub.start()
+    try:
+        await run(url)
+    finally:
+        await stub.close()
+
+# ============================================================================
+# Entry point
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("mode", nargs="?", default="demo", choices=["demo", "load", "stub"])
+    parser.add_argument("--url", default=MCP_SERVER_URL, help="MCP server base URL")
+    parser.add_argument("--stub", action="store_true", help="Run against an in-process stub server")
+    parser.add_argument("--stub-latency", type=float, default=20.0, help="Stub tool-call delay, ms (mean)")
+    parser.add_argument("--port", type=int, default=3005, help="Port for `stub`")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=20, help="Tool calls per session")
+    parser.add_argument("--inflight", type=int, default=4, help="Concurrent calls per session")
+    parser.add_argument("--connections", type=int, default=8, help="Keep-alive connections for POSTs")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds over which sessions connect")
+    parser.add_argument("--tool", default="browser_get_content")
+    parser.add_argument("--args", default='{"format": "text"}', help="Tool arguments, JSON")
+    parser.add_argument("--timeout", type=float, default=CALL_TIMEOUT)
+    args = parser.parse_args()
+    args.arguments = json.loads(args.args)
+
+    if args.mode == "stub":
+        coro = serve_stub(args.port, args.stub_latency)
+    else:
+        run = (lambda url: run_demo(url)) if args.mode == "demo" else (lambda url: run_load(url, args))
+        coro = with_stub(args.stub_latency, run) if args.stub else run(args.url)
+    print("--- Saturn Browser MCP Agent ---")
     try:
-        listen_for_events()
+        asyncio.run(coro)
     except KeyboardInterrupt:
         print("\n[Agent] Exiting...")
-        sys.exit(0)
-    except Exception as e:
-        print(f"[Agent] Fatal Error: {e}")
+    except (httpx.HTTPError, ConnectionError, asyncio.TimeoutError) as e:
+        print(f"[Agent] Fatal Error: {type(e).__name__}: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
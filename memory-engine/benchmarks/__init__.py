@@ -0,0 +1,5 @@
+"""
+Saturn Memory Engine - Benchmarks
+=================================
+Run from the memory-engine folder, e.g. `python -m benchmarks.bench_extract`.
+"""
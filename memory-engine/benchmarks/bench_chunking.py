@@ -0,0 +1,63 @@
+"""
+Chunking benchmark: offset-sliced chunks vs the decode-per-window chunker.
+
+    python -m benchmarks.bench_chunking [--corpus DIR] [--pages N] [--tokenizer NAME_OR_DIR]
+
+Pages are extracted first (extraction is not timed), then chunked with the
+model's tokenizer. Without --corpus the synthetic corpus is used with large
+pages. Besides time, reports how many chunks end on a sentence break and
+how many reproduce their source text exactly.
+"""
+
+import argparse
+import time
+
+from transformers import AutoTokenizer
+
+from memory_engine import MODEL_NAME, ContentExtractor, SemanticChunker
+from benchmarks.corpus import iter_html_files, synthetic_pages
+
+def run(chunk, texts, repeat: int):
+    best, chunks = float("inf"), []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [chunk(t) for t in texts]
+        best = min(best, time.perf_counter() - start)
+    return best, chunks
+
+def quality(texts, chunks):
+    """Share of chunks ending on a sentence break, and share found verbatim in their page."""
+    total = sum(len(c) for c in chunks) or 1
+    ends = sum(c.rstrip().endswith((".", "!", "?")) for page in chunks for c in page[:-1])
+    exact = sum(c in text for text, page in zip(texts, chunks) for c in page)
+    inner = sum(max(len(c) - 1, 0) for c in chunks) or 1
+    return ends / inner, exact / total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", help="Directory of saved .html pages")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--paragraphs", type=int, default=200, help="Paragraphs per synthetic page")
+    parser.add_argument("--tokenizer", default=MODEL_NAME)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        pages = list(iter_html_files(args.corpus))[: args.pages]
+    else:
+        pages = synthetic_pages(args.pages, min_paragraphs=args.paragraphs, max_paragraphs=args.paragraphs)
+    extractor = ContentExtractor()
+    texts = [extractor.extract(html) for html in pages]
+    chunker = SemanticChunker(AutoTokenizer.from_pretrained(args.tokenizer))
+    mb = sum(len(t) for t in texts) / 1e6
+    print(f"{len(texts)} pages, {mb:.1f} MB of text, fast tokenizer: {chunker.has_offsets}")
+
+    for name, chunk in (("decode", chunker._chunk_decoded), ("offsets", chunker.chunk)):
+        seconds, chunks = run(chunk, texts, args.repeat)
+        on_sentence, exact = quality(texts, chunks)
+        count = sum(len(c) for c in chunks)
+        print(f"{name:8} {seconds * 1000 / len(texts):7.2f} ms/page  {mb / seconds:6.2f} MB/s  "
+              f"{count / len(texts):5.1f} chunks/page  {on_sentence:6.1%} end on a sentence  {exact:6.1%} verbatim")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Embedding backend benchmark: equivalence with the torch model and throughput.
+
+    python -m benchmarks.bench_embedding [--backends torch,onnx,onnx-int8] [--model DIR_OR_NAME]
+                                         [--small BAAI/bge-small-en-v1.5] [--passages N]
+
+The first backend on --model is the reference. For every backend it reports
+the cosine between its passage embeddings and the reference ones (same
+model only), how many of the reference top-10 passages per query it
+retrieves, passages/s for batched ingest, p50 query latency, load time and
+resident memory added (all backends share one process, so run a single
+--backends value for exact memory numbers). --small adds the smaller model
+(torch and onnx-int8), which needs its own store dimension and a re-embed
+to switch to.
+
+A backend whose minimum cosine to the reference falls below its
+MIN_COSINE entry fails the run (exit status 1, after the full report), so
+a conversion or quantization regression cannot pass as a slower row.
+
+Passages are chunks of the synthetic corpus, or of saved pages with --corpus.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+import memory_engine
+from benchmarks.corpus import load_pages, sentence
+
+# Least cosine to the reference model's embedding of every passage: the same
+# graph in ONNX Runtime only differs by float rounding, int8 weights by more
+MIN_COSINE = {"torch": 0.999, "onnx": 0.999, "onnx-int8": 0.95}
+
+def rss_mb() -> float:
+    """Resident set size of this process (Linux /proc, else psutil, else 0)."""
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss / 1e6
+        except ImportError:
+            return 0.0
+
+def load_engine(backend: str, path: str):
+    start, rss = time.perf_counter(), rss_mb()
+    model = memory_engine.EMBEDDING_BACKENDS[backend](path)
+    memory_engine.EMBEDDING_DIM = model.dim
+    engine = memory_engine.EmbeddingEngine(model_name=path, backend=backend)
+    engine.model, engine.tokenizer = model, model.tokenizer
+    engine.state = "ready" # Loaded above, where the dimension is known
+    engine.ready.set()
+    engine.embed_passages(["warm-up"])
+    return engine, time.perf_counter() - start, rss_mb() - rss
+
+def top_k(queries: np.ndarray, passages: np.ndarray, k: int = 10) -> np.ndarray:
+    return np.argsort(-(queries @ passages.T), axis=1)[:, :k]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--model", default=memory_engine.MODEL_DIR or memory_engine.MODEL_NAME)
+    parser.add_argument("--small", help="Smaller model to compare, e.g. BAAI/bge-small-en-v1.5")
+    parser.add_argument("--corpus", help="Directory of saved .html pages")
+    parser.add_argument("--passages", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    configs = [(b, args.model) for b in args.backends.split(",")]
+    if args.small: configs += [("torch", args.small), ("onnx-int8", args.small)]
+
+    extractor = memory_engine.ContentExtractor()
+    texts = [extractor.extract(html) for html in load_pages(args.corpus, max(args.passages // 10, 1), args.seed)]
+    rng = random.Random(args.seed)
+    queries = [sentence(rng, rng.randint(3, 8)) for _ in range(args.queries)]
+    print(f"{len(configs)} configurations, {args.queries} queries")
+
+    reference, passages, failures = None, None, []
+    header = f"{'backend':10} {'model':28} {'dim':>4} {'cos min':>8} {'cos mean':>8} {'top10':>6} " \
+             f"{'pass/s':>7} {'query ms':>8} {'load s':>6} {'+RSS MB':>8}"
+    for backend, path in configs:
+        engine, load_s, rss = load_engine(backend, path)
+        if passages is None:
+            chunker = memory_engine.SemanticChunker(engine.tokenizer)
+            passages = [c for t in texts for c in chunker.chunk(t)][: args.passages]
+            print(f"{len(passages)} passages\n{header}")
+
+        start = time.perf_counter()
+        vecs = engine.embed_passages(passages)
+        per_sec = len(passages) / (time.perf_counter() - start)
+        latencies, q_vecs = [], []
+        for q in queries:
+            engine.query_cache.clear()
+            start = time.perf_counter()
+            q_vecs.append(engine.embed_query(q))
+            latencies.append(time.perf_counter() - start)
+        hits = top_k(np.array(q_vecs), vecs)
+
+        if reference is None: reference = (path, vecs, hits)
+        cos = (vecs * reference[1]).sum(axis=1) if path == reference[0] else None
+        overlap = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(hits, reference[2])])
+        cos_min = f"{cos.min():8.4f}" if cos is not None else f"{'-':>8}"
+        cos_mean = f"{cos.mean():8.4f}" if cos is not None else f"{'-':>8}"
+        print(f"{backend:10} {path[-28:]:28} {vecs.shape[1]:4} {cos_min} {cos_mean} {overlap:6.1%} "
+              f"{per_sec:7.1f} {np.median(latencies) * 1000:8.2f} {load_s:6.1f} {rss:8.0f}")
+        if cos is not None and cos.min() < MIN_COSINE.get(backend, 0.0):
+            failures.append(f"{backend} on {path}: cosine {cos.min():.4f} < {MIN_COSINE[backend]}")
+        del engine
+
+    if failures: sys.exit("Backends diverge from the reference:\n  " + "\n  ".join(failures))
+
+if __name__ == "__main__":
+    main()
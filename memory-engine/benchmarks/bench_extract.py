@@ -0,0 +1,53 @@
+"""
+Extraction benchmark: lxml ContentExtractor vs the original BeautifulSoup one.
+
+    python -m benchmarks.bench_extract [--corpus DIR] [--pages N]
+
+Without --corpus a synthetic corpus is generated (see benchmarks.corpus).
+"""
+
+import argparse
+import time
+
+from bs4 import BeautifulSoup
+
+from memory_engine import ContentExtractor
+from benchmarks.corpus import load_pages
+
+class BaselineExtractor:
+    """The extractor this engine shipped with (html.parser, no main-content detection)."""
+    def extract(self, html: str) -> str:
+        if not html: return ""
+        soup = BeautifulSoup(html, "html.parser")
+        for tag in soup(["script", "style", "nav", "footer", "iframe", "noscript"]):
+            tag.decompose()
+        return soup.get_text(separator=" ", strip=True)
+
+def run(extractor, pages, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chars = sum(len(extractor.extract(html)) for html in pages)
+        best = min(best, time.perf_counter() - start)
+    return best, chars
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", help="Directory of saved .html pages")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.corpus, args.pages)
+    mb = sum(len(p) for p in pages) / 1e6
+    print(f"{len(pages)} pages, {mb:.1f} MB of HTML")
+
+    baseline_time, baseline_chars = run(BaselineExtractor(), pages, args.repeat)
+    lxml_time, lxml_chars = run(ContentExtractor(), pages, args.repeat)
+    for name, seconds, chars in (("baseline (bs4)", baseline_time, baseline_chars),
+                                 ("lxml", lxml_time, lxml_chars)):
+        print(f"{name:16} {seconds * 1000:8.1f} ms  {len(pages) / seconds:8.1f} pages/s  {chars / len(pages):8.0f} chars/page")
+    print(f"speedup: {baseline_time / lxml_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
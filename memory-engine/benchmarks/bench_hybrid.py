@@ -0,0 +1,107 @@
+"""
+Retrieval benchmark: vector-only search vs hybrid (vector + BM25, fused by RRF).
+
+    python -m benchmarks.bench_hybrid [--chunks N] [--queries Q] [--model]
+
+Builds a throwaway store of synthetic chunks, a fraction of which carry a
+unique identifier (error code / part number). Each query names one
+identifier plus a few words from its chunk; a query is a hit when that
+chunk is in the top 10. Reports hit rate and store-side latency (query
+embedding excluded, it is the same for both paths).
+
+The default embedder is the hashing stand-in (benchmarks.embedder), so
+the latency numbers are real but recall is only indicative; pass --model
+to embed with the real sentence model.
+"""
+
+import os
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+# The store reads its data directory at import time
+DATA_DIR = tempfile.mkdtemp(prefix="memory-bench-")
+os.environ["MEMORY_DATA_DIR"] = DATA_DIR
+
+import numpy as np
+
+import memory_engine
+from benchmarks.corpus import sentence
+from benchmarks.embedder import HashingEmbedder
+
+def identifier(rng: random.Random) -> str:
+    return rng.choice(("err", "sku", "kb", "cve")) + "".join(rng.choice("0123456789abcdef") for _ in range(6))
+
+def build_store(embedder, chunks: int, tagged: float, seed: int, batch: int = 1000):
+    rng = random.Random(seed)
+    store = memory_engine.SimpleMemoryStore()
+    targets = [] # (identifier, chunk text)
+    for start in range(0, chunks, batch):
+        metas = []
+        for i in range(start, min(start + batch, chunks)):
+            text = " ".join(sentence(rng) for _ in range(6))
+            if rng.random() < tagged:
+                code = identifier(rng)
+                text = f"{text} Reference {code}. {sentence(rng)}"
+                targets.append((code, text, i))
+            metas.append({
+                "id": f"c{i}", "parent_id": f"p{i}", "url": f"https://bench.local/{i}", "title": f"Page {i}",
+                "summary": text[:200], "content": text, "engagement_score": 1.0, "timestamp": i,
+                "chunk_index": 0, "total_chunks": 1, "content_hash": str(i),
+            })
+        store.add_batch(embedder.embed_passages([m["content"] for m in metas]), metas)
+        store.flush()
+    return store, targets
+
+def run(search, queries, k: int):
+    hits, latencies = 0, []
+    for text, vec, target in queries:
+        start = time.perf_counter()
+        results = search(text, vec, k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(r["id"] == f"c{target}" for r in results)
+    return hits / len(queries), np.array(latencies) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--tagged", type=float, default=0.05, help="Fraction of chunks with an identifier")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--model", action="store_true", help="Embed with the real sentence model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        if args.model:
+            embedder = memory_engine.EmbeddingEngine()
+            embedder.load()
+        else:
+            embedder = HashingEmbedder()
+        start = time.perf_counter()
+        store, targets = build_store(embedder, args.chunks, args.tagged, args.seed)
+        print(f"{store.live_count} chunks ({len(targets)} tagged) indexed in {time.perf_counter() - start:.1f}s, "
+              f"index: {memory_engine.index_kind(store.index)}, keyword terms: {len(store.lexical._terms)}")
+
+        rng = random.Random(args.seed + 1)
+        queries = []
+        for code, text, target in rng.sample(targets, min(args.queries, len(targets))):
+            query = f"{code} " + " ".join(rng.sample(text.split()[:40], 3))
+            queries.append((query, embedder.embed_query(query), target))
+
+        paths = (
+            ("vector", lambda text, vec, k: store.search(vec, k)),
+            ("hybrid", lambda text, vec, k: store.search(vec, k, query_text=text)),
+        )
+        for name, search in paths:
+            search(*queries[0][:2], args.k) # Warm-up
+            recall, ms = run(search, queries, args.k)
+            print(f"{name:8} hit@{args.k} {recall:6.1%}  p50 {np.percentile(ms, 50):7.2f} ms  "
+                  f"p99 {np.percentile(ms, 99):7.2f} ms")
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Vector storage report: recall@10 and RAM per 100k chunks for each
+VECTOR_STORAGE mode (float32, float16, int8, pq), with and without exact
+re-scoring.
+
+    python -m benchmarks.bench_quantization [--chunks N] [--backend flat|hnsw|ivf_flat] [--vectors FILE.npy]
+
+Each mode builds a real SimpleMemoryStore in a throwaway directory and
+searches it through SimpleMemoryStore.search. Recall is measured against
+exact float32 search. Without --vectors the data is a clustered synthetic
+set (unit vectors around a few hundred topics); real embeddings (an
+(n, 768) float32 .npy) give more trustworthy recall numbers.
+
+RAM is what stays resident per chunk: the index (codes plus graph or list
+overhead, measured from its serialized size) and the hot metadata columns.
+Full-precision vectors are memory-mapped and only paged in for re-scoring.
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import memory_engine
+
+def synthetic_vectors(n: int, seed: int, topics: int = 300) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, memory_engine.EMBEDDING_DIM)).astype('float32')
+    vecs = centers[rng.integers(0, topics, n)] + 0.9 * rng.standard_normal((n, memory_engine.EMBEDDING_DIM)).astype('float32')
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+def build_store(directory: Path, vectors: np.ndarray, batch: int = 10000):
+    memory_engine.DATA_DIR = directory
+    memory_engine.INDEX_PATH = directory / "faiss.index"
+    store = memory_engine.SimpleMemoryStore()
+    for start in range(0, len(vectors), batch):
+        stop = min(start + batch, len(vectors))
+        metas = [{
+            "id": f"c{i}", "parent_id": f"p{i}", "url": f"https://bench.local/{i}", "title": "", "summary": "",
+            "content": "", "engagement_score": 1.0, "timestamp": i, "chunk_index": 0, "total_chunks": 1,
+            "content_hash": "",
+        } for i in range(start, stop)]
+        store.add_batch(vectors[start:stop], metas)
+        store.flush()
+    # Flushes start background rebuilds as the store grows; wait for the final index
+    while True:
+        thread = store._rebuild_thread
+        if thread is None:
+            store.maybe_rebuild_index()
+            thread = store._rebuild_thread
+            if thread is None: return store
+        thread.join()
+
+def measure(store, queries: np.ndarray, truth: np.ndarray, k: int):
+    found, latencies = 0, []
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = store.search(q, k)
+        latencies.append(time.perf_counter() - start)
+        found += len({int(h["id"][1:]) for h in hits} & set(expected.tolist()))
+    return found / truth.size, np.median(latencies) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backend", default="flat", help="Index kind to build (MEMORY_INDEX_BACKEND)")
+    parser.add_argument("--vectors", help="(n, 768) float32 .npy of real embeddings")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors, mmap_mode='r')[: args.chunks].astype('float32')
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    else:
+        vectors = synthetic_vectors(args.chunks + args.queries, args.seed)
+    queries, vectors = vectors[: args.queries], vectors[args.queries :]
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, : args.k]
+
+    memory_engine.INDEX_BACKEND = args.backend
+    hot_bytes = sum(np.dtype(t).itemsize for t in memory_engine.HOT_COLUMNS.values())
+    print(f"{len(vectors)} chunks, {len(queries)} queries, backend {args.backend}; "
+          f"hot columns {hot_bytes} B/chunk, full vectors {memory_engine.EMBEDDING_DIM * 4} B/chunk on disk")
+    print(f"{'storage':8} {'index':12} {'B/chunk':>8} {'MB/100k':>8} {'recall':>7} {'p50 ms':>7} "
+          f"{'rescored':>9} {'p50 ms':>7}")
+
+    root = Path(tempfile.mkdtemp(prefix="memory-bench-"))
+    try:
+        for storage in ("float32", "float16", "int8", "pq"):
+            memory_engine.VECTOR_STORAGE = storage
+            store = build_store(root / storage, vectors)
+            index_bytes = len(memory_engine.faiss.serialize_index(store.index)) / store.live_count
+            memory_engine.RESCORE_FACTOR = 1
+            recall, ms = measure(store, queries, truth, args.k)
+            memory_engine.RESCORE_FACTOR = 4
+            rescored, rescored_ms = measure(store, queries, truth, args.k)
+            per_100k = (index_bytes + hot_bytes) * 100_000 / 1e6
+            kind = f"{memory_engine.index_kind(store.index)}/{memory_engine.index_storage(store.index)}"
+            print(f"{storage:8} {kind:12} {index_bytes:8.0f} {per_100k:8.1f} {recall:7.1%} {ms:7.2f} "
+                  f"{rescored:9.1%} {rescored_ms:7.2f}")
+            store._db.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Batch search benchmark: N sequential searches vs one SimpleMemoryStore.search_batch.
+
+    python -m benchmarks.bench_search_batch [--chunks N] [--batch 8] [--backend flat|hnsw|ivf_flat] [--model DIR_OR_NAME]
+
+The store is built from the clustered synthetic vectors of
+bench_quantization. Every third query of a batch carries a timestamp
+filter, so batches mix one shared index search with filtered groups. Both
+paths re-rank with MMR, as /search does; the report checks that they
+return the same chunks and times the store side per batch. With --model
+the query embedding side is timed as well: one embed_query per query
+against one embed_queries call.
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import memory_engine
+from benchmarks.bench_quantization import build_store, synthetic_vectors
+
+def make_queries(n: int, k: int, chunks: int):
+    return [dict(k=k, filters={"since": chunks // 4, "until": chunks // 2} if i % 3 == 2 else None)
+            for i in range(n)]
+
+def time_store(store, vecs: np.ndarray, queries, batch: int, repeat: int):
+    sequential, batched, same = [], [], 0
+    for start in range(0, len(vecs), batch):
+        q_vecs, q_args = vecs[start : start + batch], queries[start : start + batch]
+        for _ in range(repeat):
+            t = time.perf_counter()
+            one_by_one = [store.search(v, rerank=True, **a) for v, a in zip(q_vecs, q_args)]
+            sequential.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            together = store.search_batch(q_vecs, q_args, rerank=True)
+            batched.append(time.perf_counter() - t)
+        same += sum([h["id"] for h in a] == [h["id"] for h in b] for a, b in zip(one_by_one, together))
+    return np.median(sequential) * 1000, np.median(batched) * 1000, same
+
+def time_model(path: str, texts, batch: int, repeat: int):
+    engine = memory_engine.EmbeddingEngine(model_name=path, model_dir=None)
+    engine.load()
+    engine.embed_query("warm-up")
+    sequential, batched = [], []
+    for start in range(0, len(texts), batch):
+        part = texts[start : start + batch]
+        for _ in range(repeat):
+            engine.query_cache.clear()
+            t = time.perf_counter()
+            for text in part: engine.embed_query(text)
+            sequential.append(time.perf_counter() - t)
+            engine.query_cache.clear()
+            t = time.perf_counter()
+            engine.embed_queries(part)
+            batched.append(time.perf_counter() - t)
+    return np.median(sequential) * 1000, np.median(batched) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=96)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", default="flat", help="Index kind to build (MEMORY_INDEX_BACKEND)")
+    parser.add_argument("--model", help="Also time query embedding with this model (name or folder)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.chunks + args.queries, args.seed)
+    q_vecs, vectors = vectors[: args.queries], vectors[args.queries :]
+    queries = make_queries(args.queries, args.k, args.chunks)
+    memory_engine.INDEX_BACKEND = args.backend
+
+    root = Path(tempfile.mkdtemp(prefix="memory-bench-"))
+    try:
+        store = build_store(root, vectors)
+        kind = f"{memory_engine.index_kind(store.index)}/{memory_engine.index_storage(store.index)}"
+        print(f"{store.live_count} chunks ({kind}), {args.queries} queries in batches of {args.batch}")
+        sequential, batched, same = time_store(store, q_vecs, queries, args.batch, args.repeat)
+        print(f"store   sequential {sequential:8.2f} ms/batch   batched {batched:8.2f} ms/batch   "
+              f"x{sequential / batched:4.1f}   identical results {same}/{args.queries}")
+        store._db.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.model:
+        texts = [f"memory lookup {i} about topic {i % 7}" for i in range(args.queries)]
+        sequential, batched = time_model(args.model, texts, args.batch, args.repeat)
+        print(f"model   sequential {sequential:8.2f} ms/batch   batched {batched:8.2f} ms/batch   "
+              f"x{sequential / batched:4.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Sharded vs single store: search latency, result equality and memory.
+
+    python -m benchmarks.bench_shards [--chunks N] [--queries Q] [--period month|week]
+                                      [--loaded L] [--k K] [--seed S]
+
+The same synthetic chunks (a year of them, benchmarks.corpus) are built
+once into one SimpleMemoryStore and once into a ShardedMemoryStore of
+--period shards, in a throwaway directory. Both then answer the same
+hybrid, re-ranked queries of three kinds:
+
+    all      no time filter, so every shard is searched
+    recent   the last 30 days, the newest one or two shards
+    window   a random 30-day window within the year
+
+Per kind the report gives p50/p99 latency for each layout, the shards a
+sharded query reached, and how many queries returned identical results
+(ids and similarities). Unbounded queries match exactly while both
+layouts search exactly (under ANN_THRESHOLD chunks; past it the single
+store's ANN index misses some of what the smaller, exact shards find);
+time-bounded hybrid ones can differ a little in order, as their BM25
+statistics only cover the shards reached. Recency is scored against the corpus's fixed
+"now" (CORPUS_EPOCH_MS), so both layouts score it alike.
+
+Last, the sharded store is reopened with at most --loaded shards kept
+and only recent queries are run: the report gives the shards and
+chunks then held in memory and the process RSS.
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import memory_engine
+from benchmarks.bench_stages import load_engine
+from benchmarks.build_store import build_synthetic_store, open_store
+from benchmarks.corpus import CORPUS_EPOCH_MS, query_text
+
+DAY_MS = 86_400_000
+KINDS = ("all", "recent", "window")
+
+def score_recency_at_corpus_epoch():
+    """Make re-ranking treat CORPUS_EPOCH_MS as now, in both layouts."""
+    rerank_scores = memory_engine.rerank_scores
+    memory_engine.rerank_scores = lambda relevance, engagement, timestamps, now_ms=None: rerank_scores(
+        relevance, engagement, timestamps, CORPUS_EPOCH_MS)
+
+def make_queries(count: int, seed: int):
+    """(kind, text, filters) triples, `count` of each kind."""
+    rng, queries = random.Random(seed), []
+    for kind in KINDS:
+        for _ in range(count):
+            filters = None
+            if kind == "recent":
+                filters = {"since": CORPUS_EPOCH_MS - 30 * DAY_MS}
+            elif kind == "window":
+                since = CORPUS_EPOCH_MS - rng.randrange(30, 365) * DAY_MS
+                filters = {"since": since, "until": since + 30 * DAY_MS}
+            queries.append((kind, query_text(rng), filters))
+    return queries
+
+def run_queries(store, queries, vecs, k: int):
+    """Results (id, similarity) and latency of each query."""
+    results, latencies = [], []
+    for (_, text, filters), vec in zip(queries, vecs):
+        start = time.perf_counter()
+        hits = store.search(vec, k, filters=filters, query_text=text, rerank=True)
+        latencies.append(time.perf_counter() - start)
+        results.append([(h["id"], round(h["similarity"], 5)) for h in hits])
+    return results, np.array(latencies) * 1000
+
+def report(queries, single, sharded, reached):
+    print(f"{'kind':8} {'single p50':>11} {'p99':>8} {'sharded p50':>12} {'p99':>8} {'shards':>7} {'identical':>10}")
+    kinds = np.array([kind for kind, _, _ in queries])
+    for kind in KINDS:
+        mine = np.flatnonzero(kinds == kind)
+        same = sum(single[0][i] == sharded[0][i] for i in mine)
+        print(f"{kind:8} {np.percentile(single[1][mine], 50):11.2f} {np.percentile(single[1][mine], 99):8.2f} "
+              f"{np.percentile(sharded[1][mine], 50):12.2f} {np.percentile(sharded[1][mine], 99):8.2f} "
+              f"{np.mean([reached[i] for i in mine]):7.1f} {same:>5}/{len(mine)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=30000)
+    parser.add_argument("--queries", type=int, default=100, help="Queries of each kind")
+    parser.add_argument("--period", default="month", choices=("month", "week"))
+    parser.add_argument("--loaded", type=int, default=2, help="Shards kept loaded in the memory run")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    memory_engine.SHARD_PERIOD = args.period
+    score_recency_at_corpus_epoch()
+    root = Path(tempfile.mkdtemp(prefix="memory-bench-"))
+    try:
+        single = build_synthetic_store(root / "single", args.chunks, args.seed, verbose=False)
+        build_synthetic_store(root / "sharded", args.chunks, args.seed, verbose=False, sharded=True).close()
+        sharded = open_store(root / "sharded", sharded=True)
+        queries = make_queries(args.queries, args.seed)
+        vecs = load_engine(None, memory_engine.EMBEDDING_BACKEND).embed_queries([text for _, text, _ in queries])
+        print(f"{single.live_count} chunks, {len(sharded.shards)} {args.period} shards, "
+              f"{len(queries)} queries, k={args.k}, latency in ms")
+
+        reached = [len(sharded._shards_between(**(filters or {}))) for _, _, filters in queries]
+        run_queries(sharded, queries[: len(queries) // 3], vecs, args.k) # Loads every shard before timing
+        report(queries, run_queries(single, queries, vecs, args.k), run_queries(sharded, queries, vecs, args.k), reached)
+        single.close()
+        sharded.close()
+
+        memory_engine.SHARDS_LOADED, memory_engine.SHARD_IDLE_SECONDS = args.loaded, 0
+        start = time.perf_counter()
+        sharded = open_store(root / "sharded", sharded=True)
+        opened = time.perf_counter() - start
+        recent = [i for i, (kind, _, _) in enumerate(queries) if kind == "recent"]
+        _, latencies = run_queries(sharded, [queries[i] for i in recent], vecs[recent], args.k)
+        resident = sum(store.live_count for store in sharded.loaded_shards)
+        print(f"recent only, --loaded {args.loaded}: opened in {opened:.2f}s, p50 {np.percentile(latencies, 50):.2f} ms, "
+              f"{len(sharded.loaded_shards)}/{len(sharded.shards)} shards and {resident}/{sharded.live_count} chunks "
+              f"in memory, RSS {memory_engine.process_rss_bytes() / 1e6:.0f} MB")
+        sharded.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Per-stage micro-benchmarks of the ingest and search paths.
+
+    python -m benchmarks.bench_stages [--chunks N | --data-dir DIR] [--pages P] [--queries Q]
+                                      [--model NAME_OR_DIR] [--backend torch|onnx|onnx-int8]
+
+Each stage is timed call by call, in the order ingest and /search run it:
+
+    extract      ContentExtractor.extract, one synthetic page
+    chunk        SemanticChunker.chunk_tokens on the extracted text
+    embed        EmbeddingEngine.embed_passages, one page's chunks (from token ids)
+    add          SimpleMemoryStore.add_batch, one page's chunks
+    flush        SimpleMemoryStore.flush after each add
+    embed_query  EmbeddingEngine.embed_query, query cache cleared
+    search       SimpleMemoryStore.search, vector only, re-ranked
+    hybrid       the same with BM25 fused in (the /search default)
+    filtered     hybrid with a domain filter
+    fetch        get_metas of 10 random chunks
+    list         list_pages, 50 pages
+
+The store is a synthetic one of --chunks chunks (benchmarks.build_store)
+in a throwaway directory, or the store in --data-dir, which the ingest
+stages write to, so pass a copy. Embedding uses the hashing stand-in
+unless --model is given. The stand-in also brings its own tokenizer,
+so chunk and embed timings only mean something with --model.
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import memory_engine
+from benchmarks.build_store import build_synthetic_store, open_store
+from benchmarks.corpus import DOMAINS, query_text, synthetic_pages
+from benchmarks.embedder import HashingBackend
+
+class Stages:
+    """Latencies and item counts per stage, reported in first-seen order."""
+    def __init__(self):
+        self.latencies, self.items = {}, {}
+
+    def run(self, name: str, fn, *args, items: int = 1, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        self.items[name] = self.items.get(name, 0) + items
+        return result
+
+    def report(self):
+        print(f"{'stage':12} {'calls':>6} {'p50 ms':>9} {'p99 ms':>9} {'items/s':>10}")
+        for name, latencies in self.latencies.items():
+            ms = np.array(latencies) * 1000
+            per_sec = self.items[name] / max(ms.sum() / 1000, 1e-9)
+            print(f"{name:12} {len(ms):6} {np.percentile(ms, 50):9.3f} {np.percentile(ms, 99):9.3f} {per_sec:10.1f}")
+
+def load_engine(model, backend: str):
+    """A ready EmbeddingEngine: the given model, or the hashing stand-in."""
+    if model is None:
+        memory_engine.EMBEDDING_BACKENDS["hashing"] = HashingBackend
+        engine = memory_engine.EmbeddingEngine(model_name="hashing", backend="hashing", model_dir=None)
+    else:
+        engine = memory_engine.EmbeddingEngine(model_name=model, backend=backend, model_dir=None)
+    engine.load()
+    if engine.state != "ready": raise SystemExit(f"Model failed to load: {engine.load_error}")
+    return engine
+
+def bench_ingest(stages: Stages, store, engine, pages):
+    extractor, chunker = memory_engine.ContentExtractor(), memory_engine.SemanticChunker(engine.tokenizer)
+    for n, html in enumerate(pages):
+        text = stages.run("extract", extractor.extract, html)
+        chunks, token_ids = stages.run("chunk", chunker.chunk_tokens, text)
+        if not chunks: continue
+        vecs = stages.run("embed", engine.embed_passages, chunks, token_ids=token_ids, items=len(chunks))
+        metas = [{
+            "id": f"bench{n}_{i}", "parent_id": f"bench{n}", "url": f"https://bench.local/{n}", "title": "",
+            "summary": c[:200], "content": c, "engagement_score": 1.0, "timestamp": int(time.time() * 1000),
+            "chunk_index": i, "total_chunks": len(chunks), "content_hash": str(n),
+        } for i, c in enumerate(chunks)]
+        stages.run("add", store.add_batch, vecs, metas, items=len(chunks))
+        stages.run("flush", store.flush)
+
+def bench_search(stages: Stages, store, engine, queries, k: int, seed: int):
+    for text in queries:
+        engine.query_cache.clear()
+        q = stages.run("embed_query", engine.embed_query, text)
+        stages.run("search", store.search, q, k, rerank=True)
+        stages.run("hybrid", store.search, q, k, query_text=text, rerank=True)
+        stages.run("filtered", store.search, q, k, query_text=text, rerank=True, filters={"domain": DOMAINS[0]})
+    rng = np.random.default_rng(seed)
+    vids = store._col('vid')[store._col('alive')]
+    for _ in queries:
+        stages.run("fetch", store.get_metas, rng.choice(vids, min(10, len(vids)), replace=False), items=10)
+        stages.run("list", store.list_pages, 50, items=50)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000, help="Size of the synthetic store")
+    parser.add_argument("--data-dir", help="Use this store instead (it is written to)")
+    parser.add_argument("--pages", type=int, default=50, help="Pages through the ingest stages")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--model", help="Embed with this model instead of the stand-in")
+    parser.add_argument("--backend", default=memory_engine.EMBEDDING_BACKEND)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    root = None if args.data_dir else Path(tempfile.mkdtemp(prefix="memory-bench-"))
+    try:
+        if root is None:
+            store = open_store(Path(args.data_dir))
+        else:
+            store = build_synthetic_store(root, args.chunks, args.seed, verbose=False)
+        engine = load_engine(args.model, args.backend)
+        kind = f"{memory_engine.index_kind(store.index)}/{memory_engine.index_storage(store.index)}"
+        print(f"{store.live_count} chunks ({kind}), embedder {args.model or 'hashing stand-in'}, "
+              f"{args.pages} pages, {args.queries} queries")
+
+        rng = random.Random(args.seed)
+        stages = Stages()
+        bench_ingest(stages, store, engine, synthetic_pages(args.pages, args.seed))
+        bench_search(stages, store, engine, [query_text(rng) for _ in range(args.queries)], args.k, args.seed)
+        stages.report()
+        print(f"RSS {memory_engine.process_rss_bytes() / 1e6:.0f} MB")
+        store._db.close()
+    finally:
+        if root is not None: shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Startup benchmark: how soon a fresh engine process answers, and when it is warm.
+
+    python -m benchmarks.bench_startup [--runs N] [--data-dir DIR] [--port P]
+
+Per run, a new server process (uvicorn on memory_engine:app) is started and
+timed to: `import memory_engine`, first /health response, model ready
+(/health ai_ready), and the first /search once ready. The data directory
+defaults to an empty temporary one; point --data-dir at a copy of a real
+store to include store loading.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+def request(url: str, body=None, timeout: float = 2):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+def import_time() -> float:
+    code = "import time; t = time.perf_counter(); import memory_engine; print(time.perf_counter() - t)"
+    return float(subprocess.check_output([sys.executable, "-c", code], env=os.environ, text=True).split()[-1])
+
+def poll(fn, deadline: float):
+    while time.perf_counter() < deadline:
+        try:
+            result = fn()
+            if result: return result
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(0.01)
+    raise TimeoutError("engine did not come up")
+
+def one_run(port: int, data_dir: str, timeout: float):
+    env = dict(os.environ, MEMORY_DATA_DIR=data_dir)
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "memory_engine:app", "--port", str(port), "--log-level", "warning"],
+        env=env)
+    try:
+        deadline = start + timeout
+        poll(lambda: request(f"{base}/health"), deadline)
+        health = time.perf_counter() - start
+        poll(lambda: request(f"{base}/health")["ai_ready"], deadline)
+        ready = time.perf_counter() - start
+        search_start = time.perf_counter()
+        request(f"{base}/search", {"query": "startup benchmark", "top_k": 5}, timeout=timeout)
+        return health, ready, time.perf_counter() - search_start
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--data-dir", help="Store to start on (default: empty)")
+    parser.add_argument("--port", type=int, default=7431)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    print(f"import memory_engine  {np.median(imports) * 1000:8.0f} ms (median of {args.runs})")
+    rows = []
+    for _ in range(args.runs):
+        data_dir = args.data_dir or tempfile.mkdtemp(prefix="memory-bench-")
+        try:
+            rows.append(one_run(args.port, data_dir, args.timeout))
+        finally:
+            if not args.data_dir: shutil.rmtree(data_dir, ignore_errors=True)
+    health, ready, search = np.median(np.array(rows), axis=0)
+    print(f"first /health        {health * 1000:8.0f} ms")
+    print(f"model ready          {ready * 1000:8.0f} ms")
+    print(f"first /search        {search * 1000:8.0f} ms (after ready)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Synthetic store of any size, for benchmarks and load tests at scale.
+
+    python -m benchmarks.build_store --chunks 1000000 --out DIR [--seed S] [--batch 10000] [--sharded]
+
+Chunks come from corpus.synthetic_chunks and are embedded with the hashing
+stand-in (benchmarks.embedder), so no model is needed. The store goes
+through SimpleMemoryStore.add_batch / flush like real ingest, including
+the switch to an ANN index past ANN_THRESHOLD chunks. With --sharded it
+goes through ShardedMemoryStore instead, as the app does, into time
+shards of MEMORY_SHARD_PERIOD (one shard unless that is set); otherwise
+it is one store. Pass a copy of
+DIR as --data-dir to bench_stages or load_test (both write to the
+store). Expect about 11 KB per chunk on disk (3 KB of it full-precision
+vectors); 200k chunks took 9 minutes and 2.2 GB, so 1M takes the better
+part of an hour.
+"""
+
+import argparse
+import itertools
+import time
+from pathlib import Path
+
+import memory_engine
+from benchmarks.corpus import synthetic_chunks
+from benchmarks.embedder import HashingBackend
+
+def open_store(directory: Path, sharded: bool = False):
+    """A SimpleMemoryStore, or a ShardedMemoryStore, in `directory`, which also becomes the app's DATA_DIR."""
+    directory.mkdir(parents=True, exist_ok=True)
+    memory_engine.DATA_DIR = directory
+    memory_engine.INDEX_PATH = directory / "faiss.index"
+    store_class = memory_engine.ShardedMemoryStore if sharded else memory_engine.SimpleMemoryStore
+    return store_class(directory)
+
+def wait_for_index(store):
+    """Let background index rebuilds finish, starting the final one if it is due."""
+    if isinstance(store, memory_engine.ShardedMemoryStore):
+        for shard in store.loaded_shards: wait_for_index(shard)
+        return
+    while True:
+        thread = store._rebuild_thread
+        if thread is None:
+            store.maybe_rebuild_index()
+            thread = store._rebuild_thread
+            if thread is None: return
+        thread.join()
+
+def build_synthetic_store(directory: Path, chunks: int, seed: int = 0, batch: int = 10000, verbose: bool = True,
+                          sharded: bool = False):
+    store, backend = open_store(directory, sharded), HashingBackend()
+    records = synthetic_chunks(chunks, seed)
+    start, done = time.perf_counter(), 0
+    while True:
+        metas = list(itertools.islice(records, batch))
+        if not metas: break
+        store.add_batch(backend.encode([m["content"] for m in metas]), metas)
+        store.flush()
+        done += len(metas)
+        if verbose:
+            rate = done / (time.perf_counter() - start)
+            print(f"\r{done}/{chunks} chunks, {rate:,.0f}/s", end="", flush=True)
+    wait_for_index(store)
+    if verbose:
+        if sharded: kind = f"{len(store.shards)} shards"
+        else: kind = f"index {memory_engine.index_kind(store.index)}/{memory_engine.index_storage(store.index)}"
+        print(f"\n{store.live_count} chunks, {store.page_count} pages, {kind}, {time.perf_counter() - start:.0f}s")
+    return store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--sharded", action="store_true", help="Go through ShardedMemoryStore, as the app does")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    if out.exists() and any(out.iterdir()): parser.error(f"{out} is not empty")
+    build_synthetic_store(out, args.chunks, args.seed, args.batch, sharded=args.sharded).close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Synthetic corpus for benchmarks.
+
+Generates article-like HTML pages wrapped in realistic boilerplate (nav,
+sidebar, footer, scripts) so extraction has something to throw away, and
+ready-made chunk records for filling a store directly (see build_store).
+Output is deterministic for a given seed. To save pages as files:
+
+    python -m benchmarks.corpus --pages N --out DIR [--seed S]
+"""
+
+import argparse
+import functools
+import itertools
+import random
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+WORDS = (
+    "memory browser index vector search model page content agent session query "
+    "network latency cache thread tab history result score engine embedding token "
+    "python server request response document article user time data system value"
+).split()
+
+# Browsing history is dominated by a few sites; weights fall off as 1 / rank
+DOMAINS = (
+    "github.com stackoverflow.com en.wikipedia.org docs.python.org news.ycombinator.com developer.mozilla.org "
+    "medium.com arxiv.org reddit.com youtube.com docs.rs pytorch.org huggingface.co blog.example.com "
+    "learn.microsoft.com dev.to nytimes.com bbc.co.uk theverge.com lwn.net"
+).split()
+DOMAIN_WEIGHTS = [1 / (rank + 1) for rank in range(len(DOMAINS))]
+CORPUS_EPOCH_MS = 1_760_000_000_000 # Fixed "now", so timestamps do not depend on the clock
+
+def sentence(rng: random.Random, words: int = 14) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text.capitalize() + ", " + " ".join(rng.choice(WORDS) for _ in range(4)) + "."
+
+def paragraph(rng: random.Random, sentences: int = 5) -> str:
+    return " ".join(sentence(rng, rng.randint(6, 24)) for _ in range(sentences))
+
+def html_page(rng: random.Random, paragraphs: int = 20) -> str:
+    """One page: an <article> body surrounded by typical site chrome."""
+    nav = "".join(f'<li><a href="/{w}">{w}</a></li>' for w in rng.sample(WORDS, 8))
+    side = "".join(f'<a href="/r/{i}">{sentence(rng, 5)}</a>' for i in range(10))
+    body = "".join(f"<p>{paragraph(rng)}</p>" for _ in range(paragraphs))
+    script = "<script>" + "var x = 1;" * 200 + "</script>"
+    return (
+        f"<html><head><title>{sentence(rng, 6)}</title>{script}<style>body{{margin:0}}</style></head>"
+        f"<body><nav><ul>{nav}</ul></nav><div class=\"layout\"><div class=\"content\">"
+        f"<h1>{sentence(rng, 8)}</h1><div class=\"post\">{body}</div></div>"
+        f"<div class=\"sidebar\">{side}</div></div><footer>{sentence(rng)}</footer></body></html>"
+    )
+
+def synthetic_pages(count: int, seed: int = 0, min_paragraphs: int = 5, max_paragraphs: int = 80) -> List[str]:
+    rng = random.Random(seed)
+    return [html_page(rng, rng.randint(min_paragraphs, max_paragraphs)) for _ in range(count)]
+
+@functools.lru_cache(maxsize=None)
+def vocabulary(size: int = 20000):
+    """WORDS then made-up words, with Zipf cumulative weights, so keyword postings thin out like real text."""
+    rng = random.Random(size)
+    syllables = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+    words = dict.fromkeys(WORDS)
+    while len(words) < size:
+        words["".join(rng.choices(syllables, k=rng.randint(2, 4)))] = None
+    return list(words), list(itertools.accumulate(1 / (rank + 1) for rank in range(size)))
+
+def chunk_text(rng: random.Random, words: int = 250) -> str:
+    """Sentences of 6-24 Zipf-distributed words, about `words` words in all (one chunk's worth by default)."""
+    vocab, cum_weights = vocabulary()
+    out, count = [], 0
+    while count < words:
+        n = rng.randint(6, 24)
+        out.append(" ".join(rng.choices(vocab, cum_weights=cum_weights, k=n)).capitalize() + ".")
+        count += n
+    return " ".join(out)
+
+def query_text(rng: random.Random) -> str:
+    """A 3-8 word search drawn from the chunk vocabulary, so it mixes common and rare terms."""
+    vocab, cum_weights = vocabulary()
+    return " ".join(rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(3, 8)))
+
+def synthetic_chunks(count: int, seed: int = 0, days: int = 365) -> Iterator[Dict[str, Any]]:
+    """Chunk records as ingest stores them, for `count` chunks.
+
+    Pages have 1-12 chunks, a domain drawn from DOMAINS, a timestamp in the
+    `days` before CORPUS_EPOCH_MS and a log-normal engagement score.
+    """
+    rng = random.Random(seed)
+    made = page = 0
+    while made < count:
+        total = min(rng.randint(1, 12), count - made)
+        domain = rng.choices(DOMAINS, DOMAIN_WEIGHTS)[0]
+        title = sentence(rng, 6)
+        timestamp = CORPUS_EPOCH_MS - rng.randrange(days * 86_400_000)
+        engagement = round(rng.lognormvariate(0, 1), 3)
+        for i in range(total):
+            text = chunk_text(rng)
+            yield {
+                "id": f"p{page}_{i}", "parent_id": f"p{page}", "url": f"https://{domain}/{page}", "title": title,
+                "summary": text[:200] + "...", "content": text, "engagement_score": engagement,
+                "timestamp": timestamp, "chunk_index": i, "total_chunks": total, "content_hash": f"h{page}",
+            }
+        made += total
+        page += 1
+
+def load_pages(directory: Optional[str], count: int = 200, seed: int = 0) -> List[str]:
+    """Saved *.html pages from `directory`, or a synthetic corpus when it is None."""
+    if directory is None:
+        return synthetic_pages(count, seed)
+    return list(iter_html_files(Path(directory)))[:count]
+
+def iter_html_files(directory: Path) -> Iterator[str]:
+    for path in sorted(directory.rglob("*.htm*")):
+        yield path.read_text(encoding="utf-8", errors="replace")
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic HTML pages to a folder")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    size = 0
+    for i, html in enumerate(synthetic_pages(args.pages, args.seed)):
+        (out / f"page{i:06d}.html").write_text(html, encoding="utf-8")
+        size += len(html)
+    print(f"{args.pages} pages, {size / 1e6:.1f} MB in {out}")
+
+if __name__ == "__main__":
+    main()
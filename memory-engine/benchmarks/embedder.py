@@ -0,0 +1,130 @@
+"""
+Deterministic stand-in for the sentence model.
+
+No weights and no torch: text maps to the normalised mean of fixed random
+vectors, one per 3-character piece of each word (a crude WordPiece), so
+texts sharing words land close together. Good enough to drive the store
+and index at realistic sizes; quality numbers need the real model.
+
+HashingBackend wraps the same idea as an EmbeddingEngine backend, with a
+fast-tokenizer stand-in (HashingTokenizer) that the chunker can slice by,
+so ingest and search run end to end without downloading anything:
+
+    memory_engine.EMBEDDING_BACKENDS["hashing"] = HashingBackend
+    engine = memory_engine.EmbeddingEngine(backend="hashing")
+"""
+
+import hashlib
+import re
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from memory_engine import EMBEDDING_DIM, tokenize
+
+def piece_hash(piece: str) -> int:
+    return int.from_bytes(hashlib.blake2b(piece.encode("utf-8"), digest_size=8).digest(), "little")
+
+class HashingEmbedder:
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self._pieces: Dict[str, np.ndarray] = {}
+
+    def _piece(self, piece: str) -> np.ndarray:
+        vec = self._pieces.get(piece)
+        if vec is None:
+            rng = np.random.default_rng(piece_hash(piece))
+            vec = self._pieces[piece] = rng.standard_normal(self.dim).astype('float32')
+        return vec
+
+    def embed(self, text: str) -> np.ndarray:
+        pieces = [w[i : i + 3] for w in tokenize(text) for i in range(0, len(w), 3)]
+        if not pieces: return np.zeros(self.dim, dtype='float32')
+        vec = np.mean([self._piece(p) for p in pieces], axis=0)
+        return vec / np.linalg.norm(vec)
+
+    def embed_passages(self, texts: List[str]) -> np.ndarray:
+        return np.array([self.embed(t) for t in texts], dtype='float32').reshape(-1, self.dim)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed(text)
+
+class HashingTokenizer:
+    """Offsets-capable tokenizer: punctuation and lowercased 3-character pieces of each word, ids hashed
+    into a fixed vocabulary."""
+    is_fast, do_lower_case = True, True
+    pad_token_id, cls_token_id, sep_token_id = 0, 1, 2
+    VOCAB = 1 << 20
+    WORD = re.compile(r"\w+|[^\w\s]")
+
+    def __init__(self):
+        self._words: Dict[str, Tuple[List[int], List[Tuple[int, int]]]] = {} # word -> piece ids, spans
+        self._pieces: Dict[int, str] = {} # For decode()
+
+    def _split(self, word: str):
+        ids, spans = [], []
+        for start in range(0, len(word), 3):
+            piece = word[start : start + 3].lower()
+            token_id = 3 + piece_hash(piece) % self.VOCAB
+            self._pieces.setdefault(token_id, piece)
+            ids.append(token_id)
+            spans.append((start, min(start + 3, len(word))))
+        self._words[word] = ids, spans
+        return ids, spans
+
+    def __call__(self, text: str, add_special_tokens: bool = False, return_offsets_mapping: bool = False, **_):
+        ids, offsets, known = [], [], self._words.get
+        if return_offsets_mapping:
+            for m in self.WORD.finditer(text):
+                word_ids, spans = known(m.group()) or self._split(m.group())
+                ids += word_ids
+                offsets += [(m.start() + a, m.start() + b) for a, b in spans]
+        else:
+            for word in self.WORD.findall(text):
+                ids += (known(word) or self._split(word))[0]
+        if add_special_tokens: ids = [self.cls_token_id] + ids + [self.sep_token_id]
+        encoded = {"input_ids": ids}
+        if return_offsets_mapping: encoded["offset_mapping"] = offsets
+        return encoded
+
+    def encode(self, text: str, add_special_tokens: bool = False) -> List[int]:
+        return self(text, add_special_tokens=add_special_tokens)["input_ids"]
+
+    def decode(self, ids: Sequence[int], skip_special_tokens: bool = True) -> str:
+        return " ".join(self._pieces.get(i, "") for i in ids if i > self.sep_token_id)
+
+class HashingBackend:
+    """EmbeddingEngine backend over HashingTokenizer: the mean of one fixed random vector per token id."""
+    max_length = 512
+
+    def __init__(self, path: str = "", dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.tokenizer = HashingTokenizer()
+        self._vectors: Dict[int, np.ndarray] = {}
+
+    def _vector(self, token_id: int) -> np.ndarray:
+        vec = self._vectors.get(token_id)
+        if vec is None:
+            rng = np.random.default_rng(token_id)
+            vec = self._vectors[token_id] = rng.standard_normal(self.dim).astype('float32')
+        return vec
+
+    def _embed_rows(self, rows: List[np.ndarray]) -> np.ndarray:
+        """Mean token vector per row of ids, normalised; token counts times a vector table, 256 rows at a time."""
+        out = np.zeros((len(rows), self.dim), dtype='float32')
+        rows = [r[r > self.tokenizer.sep_token_id][: self.max_length - 2] for r in rows]
+        for start in range(0, len(rows), 256):
+            part = rows[start : start + 256]
+            unique, inverse = np.unique(np.concatenate(part), return_inverse=True)
+            if not len(unique): continue
+            counts = np.zeros((len(part), len(unique)), dtype='float32')
+            np.add.at(counts, (np.repeat(np.arange(len(part)), [len(r) for r in part]), inverse), 1.0)
+            vecs = counts @ np.stack([self._vector(int(i)) for i in unique])
+            out[start : start + len(part)] = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return out
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self._embed_rows([np.asarray(self.tokenizer.encode(t), dtype=np.int64) for t in texts])
+
+    def encode_ids(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        return self._embed_rows([ids[mask > 0] for ids, mask in zip(input_ids, attention_mask)])
@@ -0,0 +1,178 @@
+"""
+Offline load test: mixed /store and /search traffic against the FastAPI app, in-process.
+
+    python -m benchmarks.load_test [--chunks N | --data-dir DIR] [--seconds S] [--concurrency C | --rate R]
+                                   [--mix search=0.75,store=0.2,batch=0.03,list=0.02] [--model NAME_OR_DIR]
+
+Requests go through httpx's ASGI transport to memory_engine.app (with its
+lifespan), so routing, validation, the bounded executors and the ingest
+queue are all exercised without a socket. By default C clients each send
+their next request as soon as the last one returns. With --rate, requests
+instead arrive as a Poisson stream of R per second, and latency counts
+from each request's scheduled time, so a stalled server shows up in p99
+instead of slowing the test down.
+
+/store sends pages drawn from a pool of synthetic pages (--pages). A
+repeated URL is a revisit, and most of those are unchanged. It waits for
+the page to be stored unless --no-wait is given. Searches are 3-8 word
+queries from corpus.query_text; batch sends 4 of them to /search/batch.
+
+The store is a synthetic one of --chunks chunks in a throwaway directory,
+or the store in --data-dir (pass a copy: the test writes to it), opened
+as the app opens it (in time shards if MEMORY_SHARD_PERIOD is set).
+Embedding uses the hashing stand-in unless --model is given. The report
+gives, per endpoint, the request count, errors (503 = shed by a queue
+limit), p50/p99 latency and throughput. It also gives the process's
+peak RSS, sampled every 50 ms.
+"""
+
+import argparse
+import asyncio
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+import memory_engine
+from benchmarks.bench_stages import load_engine
+from benchmarks.build_store import build_synthetic_store, open_store
+from benchmarks.corpus import DOMAINS, query_text, synthetic_pages
+
+class Recorder:
+    def __init__(self):
+        self.latencies, self.errors = {}, {}
+        self.peak_rss = 0
+
+    def add(self, op: str, seconds: float, status: int):
+        self.latencies.setdefault(op, []).append(seconds)
+        if status >= 400:
+            errors = self.errors.setdefault(op, {})
+            errors[status] = errors.get(status, 0) + 1
+
+    async def sample_rss(self, interval: float = 0.05):
+        while True:
+            self.peak_rss = max(self.peak_rss, memory_engine.process_rss_bytes() or 0)
+            await asyncio.sleep(interval)
+
+    def report(self, elapsed: float):
+        total = sum(len(v) for v in self.latencies.values())
+        print(f"{'endpoint':8} {'requests':>9} {'errors':>14} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+        for op, latencies in sorted(self.latencies.items()):
+            ms = np.array(latencies) * 1000
+            errors = ",".join(f"{n}x{code}" for code, n in sorted(self.errors.get(op, {}).items())) or "0"
+            print(f"{op:8} {len(ms):9} {errors:>14} {np.percentile(ms, 50):9.2f} {np.percentile(ms, 99):9.2f} "
+                  f"{len(ms) / elapsed:8.1f}")
+        print(f"total {total} requests in {elapsed:.1f}s, {total / elapsed:.1f} req/s, "
+              f"peak RSS {self.peak_rss / 1e6:.0f} MB")
+
+class Traffic:
+    """Builds the next request for a randomly chosen endpoint."""
+    def __init__(self, mix, pages, seed: int, wait: bool):
+        self.ops, self.weights = zip(*mix.items())
+        self.pages, self.wait = pages, wait
+        self.rng = random.Random(seed)
+
+    def query(self) -> dict:
+        query = {"query": query_text(self.rng), "top_k": 10}
+        if self.rng.random() < 0.1: query["domain"] = self.rng.choice(DOMAINS[:5])
+        return query
+
+    def next(self):
+        op = self.rng.choices(self.ops, self.weights)[0]
+        if op == "search":
+            return op, "POST", "/search", {"json": self.query()}
+        if op == "batch":
+            return op, "POST", "/search/batch", {"json": [self.query() for _ in range(4)]}
+        if op == "list":
+            return op, "GET", "/memories", {"params": {"limit": 50}}
+        n = self.rng.randrange(len(self.pages))
+        page = {"url": f"https://load.test/{n}", "title": f"Page {n}", "content": self.pages[n]}
+        return op, "POST", "/store", {"json": page, "params": {"wait": str(self.wait).lower()}}
+
+async def send(client, recorder: Recorder, request, started: float):
+    op, method, path, kwargs = request
+    try:
+        status = (await client.request(method, path, **kwargs)).status_code
+    except httpx.HTTPError:
+        status = 599
+    recorder.add(op, time.perf_counter() - started, status)
+
+async def closed_loop(client, recorder, traffic: Traffic, clients: int, deadline: float):
+    async def one_client():
+        while time.perf_counter() < deadline:
+            await send(client, recorder, traffic.next(), time.perf_counter())
+    await asyncio.gather(*(one_client() for _ in range(clients)))
+
+async def open_loop(client, recorder, traffic: Traffic, rate: float, deadline: float):
+    tasks, due = [], time.perf_counter()
+    while due < deadline:
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        tasks.append(asyncio.create_task(send(client, recorder, traffic.next(), due)))
+        due += traffic.rng.expovariate(rate)
+    await asyncio.gather(*tasks)
+
+async def run(args, traffic: Traffic) -> Recorder:
+    recorder = Recorder()
+    app = memory_engine.app
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://memory.test", timeout=None) as client:
+            sampler = asyncio.create_task(recorder.sample_rss())
+            start = time.perf_counter()
+            deadline = start + args.seconds
+            if args.rate: await open_loop(client, recorder, traffic, args.rate, deadline)
+            else: await closed_loop(client, recorder, traffic, args.concurrency, deadline)
+            elapsed = time.perf_counter() - start
+            sampler.cancel()
+            jobs = (await client.get("/jobs")).json()
+    recorder.report(elapsed)
+    print(f"ingest queue: {jobs['completed']} jobs done, {jobs['failed']} failed, "
+          f"{jobs['avg_batch_pages']:.1f} pages per batch")
+    return recorder
+
+def parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        if op not in ("search", "store", "batch", "list"): raise SystemExit(f"Unknown endpoint in --mix: {op}")
+        mix[op] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000, help="Size of the synthetic store")
+    parser.add_argument("--data-dir", help="Use this store instead (it is written to)")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=16, help="Closed-loop clients")
+    parser.add_argument("--rate", type=float, help="Open-loop arrivals per second (overrides --concurrency)")
+    parser.add_argument("--mix", default="search=0.75,store=0.2,batch=0.03,list=0.02")
+    parser.add_argument("--pages", type=int, default=200, help="Pool of pages /store draws from")
+    parser.add_argument("--no-wait", action="store_true", help="Time /store until queued, not until stored")
+    parser.add_argument("--model", help="Embed with this model instead of the stand-in")
+    parser.add_argument("--backend", default=memory_engine.EMBEDDING_BACKEND)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    root = None if args.data_dir else Path(tempfile.mkdtemp(prefix="memory-bench-"))
+    try:
+        if root is None:
+            store = open_store(Path(args.data_dir), sharded=True)
+        else:
+            store = build_synthetic_store(root, args.chunks, args.seed, verbose=False, sharded=True)
+        # The app's getters return these instead of loading the configured model and store
+        memory_engine.embedding_engine = load_engine(args.model, args.backend)
+        memory_engine.memory_store = store
+        mode = f"rate {args.rate}/s" if args.rate else f"{args.concurrency} clients"
+        print(f"{store.live_count} chunks, embedder {args.model or 'hashing stand-in'}, {mode}, {args.seconds:.0f}s")
+        traffic = Traffic(parse_mix(args.mix), synthetic_pages(args.pages, args.seed), args.seed, not args.no_wait)
+        asyncio.run(run(args, traffic))
+        store.close()
+    finally:
+        if root is not None: shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
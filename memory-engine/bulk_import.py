@@ -0,0 +1,311 @@
+"""
+Saturn Memory Engine - Bulk Import
+==================================
+Backfills the store without going through /store page by page.
+
+    python bulk_import.py history.jsonl          # one PageContent JSON object per line
+    python bulk_import.py saved_pages/           # a folder of .html files
+    python bulk_import.py --reembed              # re-embed every stored chunk (after a model change)
+
+Pages are extracted, chunked and embedded in a process pool, one model copy
+per worker pinned to its share of the cores, and written straight
+into the store's segments (each time shard's, if sharded). Progress is checkpointed after every batch, so
+rerunning the same command after a crash resumes where it stopped. Stop the
+engine first: the store must have a single writer.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+import memory_engine
+from memory_engine import DATA_DIR, EMBEDDING_DIM, PageContent
+
+ENGINE_PORT = 7420
+
+# ============================================================================
+# Workers (one model copy per process)
+# ============================================================================
+
+_engine = None
+_chunker = None
+
+def _init_worker(threads: int):
+    """Pin inference to `threads` cores and load the model once per process."""
+    global _engine, _chunker
+    memory_engine.EMBED_THREADS = threads
+    _engine = memory_engine.EmbeddingEngine()
+    _engine.load()
+    _chunker = memory_engine.SemanticChunker(_engine.tokenizer)
+
+def _page_info(html: str) -> Dict[str, str]:
+    """Title and canonical URL declared by a saved HTML page."""
+    try:
+        root = memory_engine.lxml_html.fromstring(html[:200000])
+    except (memory_engine.etree.ParserError, ValueError):
+        return {}
+    info = {}
+    title = root.findtext(".//title")
+    if title: info["title"] = " ".join(title.split())
+    for xpath in ('//link[@rel="canonical"]/@href', '//meta[@property="og:url"]/@content'):
+        found = root.xpath(xpath)
+        if found:
+            info["url"] = found[0].strip()
+            break
+    return info
+
+def _process_pages(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Extract, chunk and embed a batch of pages with one model pass."""
+    results, texts, token_ids = [], [], []
+    for record in records:
+        if "error" in record:
+            results.append({"error": record["error"], "url": None})
+            continue
+        if record.get("path"):
+            html = Path(record.pop("path")).read_text(encoding="utf-8", errors="replace")
+            # The page's own canonical URL wins over the file:// fallback
+            record = {**record, "content": html, "is_html": True, **_page_info(html)}
+            record.setdefault("title", record["url"])
+        try:
+            page = PageContent(**record)
+            content, content_hash = memory_engine.page_text(page)
+        except Exception as e:
+            results.append({"error": getattr(e, "detail", None) or str(e), "url": record.get("url")})
+            continue
+        chunks, ids = _chunker.chunk_tokens(content)
+        page.content = "" # Only the chunks go back to the writer
+        results.append({"page": page, "chunks": chunks, "content_hash": content_hash})
+        texts.extend(chunks)
+        token_ids.extend(ids or [])
+    vectors = _engine.embed_passages(texts, token_ids=token_ids if len(token_ids) == len(texts) else None)
+    offset = 0
+    for result in results:
+        if "chunks" in result:
+            result["vectors"] = vectors[offset : offset + len(result["chunks"])]
+            offset += len(result["chunks"])
+    return results
+
+def _embed_texts(texts: List[str]) -> np.ndarray:
+    return _engine.embed_passages(texts)
+
+# ============================================================================
+# Sources
+# ============================================================================
+
+def iter_records(source: Path) -> Iterator[Dict[str, Any]]:
+    """Pages to import, in a stable order so a checkpoint position stays valid."""
+    if source.is_dir():
+        for path in sorted(source.rglob("*.htm*")):
+            yield {"path": str(path), "url": path.resolve().as_uri(),
+                   "timestamp": int(path.stat().st_mtime * 1000)}
+        return
+    with open(source, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                yield {}
+                continue
+            # Bad lines pass through as failed records: counted as skipped, and the checkpoint moves past them
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"error": f"line {number}: {e}"}
+                continue
+            yield record if isinstance(record, dict) else {"error": f"line {number}: not a JSON object"}
+
+def batched(items: Iterator[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+# ============================================================================
+# Checkpoints and progress
+# ============================================================================
+
+class Checkpoint:
+    """Records committed so far for one source, rewritten atomically after each batch."""
+    def __init__(self, name: str, restart: bool):
+        self.path = DATA_DIR / f"import-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:12]}.json"
+        self.state = {"source": name, "done": 0, "pages": 0, "chunks": 0, "skipped": 0}
+        if self.path.exists() and not restart:
+            with open(self.path, "r") as f: self.state.update(json.load(f))
+
+    def save(self):
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        memory_engine._atomic_write(self.path, lambda f: f.write(json.dumps(self.state).encode()))
+
+class Progress:
+    """Throttled progress lines: state["done"] in `unit`s, plus the state `counts` named."""
+    def __init__(self, total_done: int, unit: str, counts: Tuple[str, ...] = ()):
+        self.start = time.perf_counter()
+        self.start_done = total_done
+        self.unit, self.counts = unit, counts
+        self.last_report = 0.0
+
+    def report(self, state: Dict[str, Any], final: bool = False):
+        now = time.perf_counter()
+        if not final and now - self.last_report < 5: return
+        self.last_report = now
+        elapsed = max(now - self.start, 1e-9)
+        rate = (state["done"] - self.start_done) / elapsed
+        counts = f" ({', '.join(f'{state[name]} {name}' for name in self.counts)})" if self.counts else ""
+        print(f"[Import] {state['done']} {self.unit}{counts} in {elapsed:.0f}s: {rate:.1f} {self.unit}/sec", flush=True)
+
+# ============================================================================
+# Import
+# ============================================================================
+
+def engine_running() -> bool:
+    with socket.socket() as s:
+        s.settimeout(0.2)
+        return s.connect_ex(("127.0.0.1", ENGINE_PORT)) == 0
+
+def write_results(store, results: List[Dict[str, Any]], state: Dict[str, Any]):
+    """Add a batch's pages to the store, replacing changed versions and skipping unchanged ones."""
+    for result in results:
+        if "error" in result:
+            state["skipped"] += 1
+            continue
+        page = result["page"]
+        previous = store.find_page(page.url)
+        if previous is not None and previous.get("content_hash") == result["content_hash"]:
+            state["skipped"] += 1
+            continue
+        metas = memory_engine.build_chunk_metas({"page": page, "chunks": result["chunks"],
+                                                 "content_hash": result["content_hash"]})
+        store.add_batch(result["vectors"], metas)
+        if previous is not None: store.delete(previous["parent_id"])
+        state["pages"] += 1
+        state["chunks"] += len(metas)
+    store.flush()
+
+def run_pool(workers: int, threads: int, tasks: Iterator, fn, on_result, inflight: int):
+    """Run fn over tasks in a process pool; results are handed to on_result in submission order."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append((task, pool.submit(fn, task[1])))
+            if len(pending) >= inflight:
+                done_task, future = pending.popleft()
+                on_result(done_task, future.result())
+        while pending:
+            done_task, future = pending.popleft()
+            on_result(done_task, future.result())
+
+def import_pages(source: Path, args):
+    checkpoint = Checkpoint(str(source.resolve()), args.restart)
+    state = checkpoint.state
+    if state["done"]: print(f"[Import] Resuming after {state['done']} records")
+    store = memory_engine.ShardedMemoryStore()
+    # A record is one JSONL line or HTML file, imported as a page or skipped
+    progress = Progress(state["done"], "records", ("pages", "chunks", "skipped"))
+
+    def tasks():
+        records = iter_records(source)
+        for _ in range(state["done"]): next(records, None)
+        for batch in batched(records, args.batch_pages):
+            yield len(batch), [r for r in batch if r]
+
+    def on_result(task, results):
+        write_results(store, results, state)
+        state["done"] += task[0]
+        checkpoint.save() # After the flush, so a resumed run never skips unwritten pages
+        progress.report(state)
+
+    run_pool(args.workers, args.threads, tasks(), _process_pages, on_result, args.workers * 2)
+    store.compact()
+    store.close()
+    progress.report(state, final=True)
+
+def store_dirs() -> List[Path]:
+    """Directories of the root store (if any) and every time shard, each a SimpleMemoryStore."""
+    shards = DATA_DIR / memory_engine.SHARDS_DIR
+    dirs = [DATA_DIR]
+    if shards.exists(): dirs += sorted(p for p in shards.iterdir() if memory_engine.shard_span(p.name))
+    return [d for d in dirs if (d / memory_engine.CHUNK_DB_FILE).exists()]
+
+def reembed_store(args):
+    """Re-embed every stored chunk, shard by shard; indexes are rebuilt on next start."""
+    for directory in store_dirs():
+        print(f"[Import] Re-embedding {directory.relative_to(DATA_DIR)}")
+        reembed_dir(directory, args)
+
+def reembed_dir(directory: Path, args):
+    """Re-embed one store's chunks into a new snapshot."""
+    db = memory_engine.sqlite3.connect(str(directory / memory_engine.CHUNK_DB_FILE))
+    total = db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+    model = memory_engine.MODEL_DIR or memory_engine.MODEL_NAME
+    checkpoint = Checkpoint(f"reembed:{model}:{directory.relative_to(DATA_DIR)}:{total}", args.restart)
+    state = checkpoint.state
+    out_path = directory / "vectors.reembed.npy"
+    if state["done"] and out_path.exists():
+        print(f"[Import] Resuming after {state['done']} of {total} chunks")
+        vectors = np.load(out_path, mmap_mode="r+")
+    else:
+        state["done"] = 0
+        vectors = np.lib.format.open_memmap(out_path, mode="w+", dtype="float32", shape=(total, EMBEDDING_DIM))
+    vids = np.fromiter((r[0] for r in db.execute("SELECT vid FROM chunks ORDER BY vid")), dtype="int64", count=total)
+    progress = Progress(state["done"], "chunks")
+
+    def tasks():
+        cursor = db.execute("SELECT content FROM chunks ORDER BY vid LIMIT -1 OFFSET ?", (state["done"],))
+        for batch in batched((r[0] or "" for r in cursor), args.batch_pages * 16):
+            yield len(batch), batch
+
+    def on_result(task, embedded, out=vectors):
+        out[state["done"] : state["done"] + task[0]] = embedded
+        out.flush()
+        state["done"] += task[0]
+        checkpoint.save()
+        progress.report(state)
+
+    run_pool(args.workers, args.threads, tasks(), _embed_texts, on_result, args.workers * 2)
+    del vectors, on_result # The only references to the memmap, so its file is closed before the swap
+    db.close()
+    # Swap the snapshot in; stale segments and index go, and the next start rebuilds the index
+    memory_engine.write_snapshot(directory, out_path, vids)
+    for name in (memory_engine.VECTOR_SEGMENT_FILE, memory_engine.VID_SEGMENT_FILE,
+                 memory_engine.TOMBSTONES_FILE, memory_engine.INDEX_PATH.name):
+        (directory / name).unlink(missing_ok=True)
+    progress.report(state, final=True)
+    checkpoint.path.unlink(missing_ok=True)
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Bulk import pages into the memory store.")
+    parser.add_argument("source", nargs="?", help="JSONL file of pages or a folder of .html files")
+    parser.add_argument("--reembed", action="store_true", help="Re-embed all stored chunks instead of importing")
+    parser.add_argument("--workers", type=int, default=max(1, min(4, cpus // 2)), help="Embedding processes")
+    parser.add_argument("--threads", type=int, default=0, help="Inference threads per worker (default: cores / workers)")
+    parser.add_argument("--batch-pages", type=int, default=16, help="Pages per worker task")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over")
+    parser.add_argument("--force", action="store_true", help="Run even if the engine seems to be running")
+    args = parser.parse_args()
+    args.threads = args.threads or max(1, cpus // args.workers)
+
+    if not args.reembed and not args.source:
+        parser.error("a source is required unless --reembed is given")
+    if engine_running() and not args.force:
+        sys.exit(f"[Import] The engine is listening on port {ENGINE_PORT}; stop it first (or pass --force).")
+    print(f"[Import] {args.workers} workers x {args.threads} threads, data in {DATA_DIR}")
+    if args.reembed:
+        reembed_store(args)
+    else:
+        import_pages(Path(args.source), args)
+
+if __name__ == "__main__":
+    main()
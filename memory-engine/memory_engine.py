@@ -11,34 +11,63 @@ This engine provides:
 """
 
 import os
+import re
+import importlib
+import importlib.util
+import math
 import json
+import sqlite3
 import uuid
+import hashlib
+import time
 import logging
+import queue
+import asyncio
+import threading
 import shutil
 import pickle
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+import bisect
+import heapq
+import itertools
+import cProfile
+from array import array
+from typing import List, Optional, Dict, Any, Callable
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from urllib.parse import urlparse
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import numpy as np
-try:
-    import faiss
-except ImportError:
-    # Fallback for dev environments without faiss-cpu
-    class MockFaiss:
-        def IndexFlatL2(self, d): return self
-        def add(self, x): pass
-        def search(self, q, k): return np.array([[0.0]*k]), np.array([[-1]*k])
-        def ntotal(self): return 0
-        def write_index(self, idx, path): pass
-        def read_index(self, path): return self
-    faiss = MockFaiss()
-
-from fastapi import FastAPI, HTTPException
+
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-from bs4 import BeautifulSoup
+
+class LazyModule:
+    """Imports a module on first attribute access, so the server binds before heavy imports."""
+    def __init__(self, name: str, package: str):
+        self._name = name
+        self._package = package # pip name, for the error when it is missing
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module(self._name)
+            except ImportError as e:
+                raise ImportError(f"{self._package} is required: pip install {self._package}") from e
+        return getattr(self._module, attr)
+
+    def check(self):
+        """Raise now if the module is missing, without paying for the import."""
+        if self._module is None and importlib.util.find_spec(self._name.split(".")[0]) is None:
+            raise ImportError(f"{self._package} is required: pip install {self._package}")
+
+faiss = LazyModule("faiss", "faiss-cpu")
+lxml_html = LazyModule("lxml.html", "lxml")
+etree = LazyModule("lxml.etree", "lxml")
 
 # Configure logging
 logging.basicConfig(
@@ -47,24 +76,130 @@ logging.basicConfig(
     datefmt='%H:%M:%S'
 )
 logger = logging.getLogger(__name__)
+# faiss logs each CPU-specific build it probes at INFO
+logging.getLogger("faiss.loader").setLevel(logging.WARNING)
 
 # ============================================================================
 # Configuration
 # ============================================================================
 
-MODEL_NAME = "BAAI/bge-base-en-v1.5"
-EMBEDDING_DIM = 768
+# Embedding model. Switching to one with another dimension needs `bulk_import.py --reembed`
+MODEL_NAME = os.environ.get("MEMORY_MODEL", "BAAI/bge-base-en-v1.5")
+MODEL_DIMS = {"BAAI/bge-base-en-v1.5": 768, "BAAI/bge-small-en-v1.5": 384}
+EMBEDDING_DIM = int(os.environ.get("MEMORY_EMBEDDING_DIM", MODEL_DIMS.get(MODEL_NAME, 768)))
+# Local copy of the model (a sentence-transformers folder); loads with no network access
+MODEL_DIR = os.environ.get("MEMORY_MODEL_DIR")
+if MODEL_DIR: os.environ.setdefault("HF_HUB_OFFLINE", "1")
+# Inference backend: torch | onnx | onnx-int8 (ONNX Runtime, dynamically quantized weights)
+EMBEDDING_BACKEND = os.environ.get("MEMORY_EMBEDDING_BACKEND", "torch")
+# Inference threads per process; 0 leaves the runtime default (all cores)
+EMBED_THREADS = int(os.environ.get("MEMORY_EMBED_THREADS", "0"))
+QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages: "
+# Load the model and store in the background at startup; requests wait this long for them
+WARM_UP = os.environ.get("MEMORY_WARM_UP", "1") == "1"
+MODEL_READY_TIMEOUT = float(os.environ.get("MEMORY_MODEL_READY_TIMEOUT", "120"))
 # Store data locally in the project folder
 SCRIPT_DIR = Path(__file__).parent.resolve()
 DATA_DIR = Path(os.environ.get("MEMORY_DATA_DIR", str(SCRIPT_DIR / "data")))
 INDEX_PATH = DATA_DIR / "faiss.index"
 METADATA_PATH = DATA_DIR / "metadata.json"
+# Raw HTML beyond this many characters is ignored by the extractor
+MAX_HTML_CHARS = int(os.environ.get("MEMORY_MAX_HTML_CHARS", "2000000"))
+# Passages per model forward pass during ingest
+EMBED_BATCH_SIZE = int(os.environ.get("MEMORY_EMBED_BATCH_SIZE", "32"))
+# Vector rows appended between snapshot compactions
+VECTOR_SEGMENT_FILE = "vectors.seg"
+VID_SEGMENT_FILE = "vids.seg"
+VID_SNAPSHOT_FILE = "vids.npy"
+SNAPSHOT_PENDING_FILE = "snapshot.pending" # Marks a written snapshot pair whose renames may not have finished
+CHUNK_DB_FILE = "chunks.db"
+METADATA_LOG_FILE = "metadata.log" # Pre-chunks.db stores only; migrated on load
+COMPACT_MIN_ROWS = int(os.environ.get("MEMORY_COMPACT_MIN_ROWS", "1024"))
+# Index backend: auto | flat | ivf_flat | ivf_pq | hnsw
+# "auto" stays exact (flat) until the store reaches ANN_THRESHOLD chunks
+INDEX_BACKEND = os.environ.get("MEMORY_INDEX_BACKEND", "auto")
+ANN_BACKEND = os.environ.get("MEMORY_ANN_BACKEND", "ivf_flat")
+ANN_THRESHOLD = int(os.environ.get("MEMORY_ANN_THRESHOLD", "50000"))
+IVF_MIN_ROWS = 1024 # Below this IVF cannot be trained meaningfully
+IVF_TRAIN_PER_LIST = 64
+PQ_M = 48 # Sub-quantizers for IVF-PQ (16 dims each)
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# Vector codes kept in the index: float32 | float16 | int8 (scalar quantized) | pq.
+# Full-precision vectors stay on disk, memory-mapped, for exact re-scoring
+VECTOR_STORAGE = os.environ.get("MEMORY_VECTOR_STORAGE", "float32")
+QUANTIZE_MIN_ROWS = 4096 # int8/pq codebooks are trained once the store has this many chunks
+PQ_MIN_ROWS = 256 # An index needs a training row per PQ centroid at least
+QUANTIZE_TRAIN_ROWS = 16384
+# Lossy indexes return this many candidates per hit, re-ranked by exact cosine; 1 disables
+RESCORE_FACTOR = int(os.environ.get("MEMORY_RESCORE_FACTOR", "4"))
+# Recall vs latency defaults, overridable per /search
+DEFAULT_NPROBE = int(os.environ.get("MEMORY_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.environ.get("MEMORY_EF_SEARCH", "64"))
+# CPU-bound work runs in bounded pools off the event loop; beyond the
+# queue limit requests are rejected with 503 instead of piling up
+INGEST_QUEUE_LIMIT = int(os.environ.get("MEMORY_INGEST_QUEUE_LIMIT", "32"))
+SEARCH_WORKERS = int(os.environ.get("MEMORY_SEARCH_WORKERS", "2"))
+SEARCH_QUEUE_LIMIT = int(os.environ.get("MEMORY_SEARCH_QUEUE_LIMIT", "64"))
+SEARCH_BATCH_LIMIT = int(os.environ.get("MEMORY_SEARCH_BATCH_LIMIT", "64")) # Queries per /search/batch
+# /store queues pages; the ingest worker embeds up to INGEST_BATCH_PAGES
+# queued pages per model pass, waiting at most INGEST_BATCH_WAIT_MS to fill a batch
+INGEST_BATCH_PAGES = int(os.environ.get("MEMORY_INGEST_BATCH_PAGES", "8"))
+INGEST_BATCH_WAIT_MS = int(os.environ.get("MEMORY_INGEST_BATCH_WAIT_MS", "50"))
+JOB_HISTORY = 1000 # Finished jobs kept for /jobs/{id}
+# Repeat queries (typing in the memory panel) skip the model and the index
+QUERY_CACHE_SIZE = int(os.environ.get("MEMORY_QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.environ.get("MEMORY_QUERY_CACHE_TTL", "600"))
+RESULT_CACHE_SIZE = int(os.environ.get("MEMORY_RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.environ.get("MEMORY_RESULT_CACHE_TTL", "60"))
+# Deleted vids still present in an HNSW graph; rebuilt away past this fraction
+TOMBSTONES_FILE = "tombstones.json"
+TOMBSTONE_REBUILD_RATIO = 0.2
+# Hybrid retrieval: BM25 over chunk text fused with the vector hits
+HYBRID_SEARCH = os.environ.get("MEMORY_HYBRID_SEARCH", "1") == "1"
+LEXICAL_INDEX_FILE = "lexical.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_MAX_DF_RATIO = 0.5 # Terms in more documents than this are skipped when rarer ones exist
+RRF_K = 60 # Reciprocal rank fusion damping
+# /search re-ranking: candidates per result, score blend and MMR trade-off
+RERANK_CANDIDATES = 4
+RERANK_ENGAGEMENT_WEIGHT = float(os.environ.get("MEMORY_RERANK_ENGAGEMENT_WEIGHT", "0.1"))
+RERANK_RECENCY_WEIGHT = float(os.environ.get("MEMORY_RERANK_RECENCY_WEIGHT", "0.1"))
+RECENCY_HALF_LIFE_DAYS = float(os.environ.get("MEMORY_RECENCY_HALF_LIFE_DAYS", "30"))
+MMR_LAMBDA = float(os.environ.get("MEMORY_MMR_LAMBDA", "0.7")) # 1.0 = relevance only
+# Chunks are split into one store per SHARD_PERIOD of their timestamps: none | month | week.
+# Beyond SHARDS_LOADED loaded shards, any unused for SHARD_IDLE_SECONDS are unloaded,
+# and a search fans out over the shards it reaches on SHARD_SEARCH_THREADS threads.
+# Opt-in: searches without a since/until reach, and load, every shard
+SHARD_PERIOD = os.environ.get("MEMORY_SHARD_PERIOD", "none")
+SHARDS_DIR = "shards"
+SHARD_INDEX_FILE = "shards.db" # Which shards hold which vids and URLs
+SHARDS_LOADED = int(os.environ.get("MEMORY_SHARDS_LOADED", "4"))
+SHARD_IDLE_SECONDS = float(os.environ.get("MEMORY_SHARD_IDLE_SECONDS", "300"))
+SHARD_SEARCH_THREADS = int(os.environ.get("MEMORY_SHARD_SEARCH_THREADS", str(min(4, os.cpu_count() or 1))))
+# Filtered searches matching at most this many chunks are scored exactly in
+# NumPy; larger selections go to FAISS with an ID bitmap
+FILTER_EXACT_ROWS = int(os.environ.get("MEMORY_FILTER_EXACT_ROWS", "20000"))
+
+# Searches and ingest batches slower than this dump a profile to DATA_DIR/profiles; 0 disables
+PROFILE_SLOW_MS = float(os.environ.get("MEMORY_PROFILE_SLOW_MS", "0"))
+PROFILER = os.environ.get("MEMORY_PROFILER", "cprofile") # cprofile | pyinstrument
+PROFILES_KEPT = 50
 
 # ============================================================================
 # App Implementation
 # ============================================================================
 
-app = FastAPI(title="Saturn Memory Engine")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Missing dependencies stop startup here rather than failing the first request
+    for module in (faiss, lxml_html): module.check()
+    # Bind and answer /health at once; the model and store load behind it
+    if WARM_UP: threading.Thread(target=warm_up, name="memory-warm-up", daemon=True).start()
+    yield
+
+app = FastAPI(title="Saturn Memory Engine", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -72,6 +207,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # ============================================================================
@@ -91,7 +227,19 @@ class SearchQuery(BaseModel):
     """Semantic search query."""
     query: str
     top_k: int = 10
-    min_score: float = 0.0
+    min_score: float = 0.0  # Cosine similarity
+    nprobe: Optional[int] = None  # IVF lists to visit (higher = better recall)
+    ef_search: Optional[int] = None  # HNSW candidate list size
+    hybrid: Optional[bool] = None  # Fuse BM25 keyword hits in (default: HYBRID_SEARCH)
+    # Filters, applied before ranking so they never cut results short
+    since: Optional[int] = None  # Timestamp (ms), inclusive
+    until: Optional[int] = None  # Timestamp (ms), inclusive
+    domain: Optional[str] = None  # e.g. "github.com"; "www." is ignored
+    min_engagement: Optional[float] = None
+
+    def filters(self) -> Optional[Dict[str, Any]]:
+        filters = {"since": self.since, "until": self.until, "domain": self.domain, "min_engagement": self.min_engagement}
+        return filters if any(v is not None for v in filters.values()) else None
 
 class Memory(BaseModel):
     """A stored memory with metadata."""
@@ -106,6 +254,24 @@ class Memory(BaseModel):
     chunk_index: int = 0
     total_chunks: int = 1
 
+class IngestJobStatus(BaseModel):
+    """Progress of a queued /store request."""
+    job_id: str
+    url: str
+    status: str  # queued | running | done | failed
+    memory_id: Optional[str] = None
+    error: Optional[str] = None
+    created: int
+    finished: Optional[int] = None
+
+class IngestQueueStats(BaseModel):
+    queued: int
+    running: int
+    completed: int
+    failed: int
+    batches: int
+    avg_batch_pages: float
+
 class MemoryStats(BaseModel):
     total_memories: int
     total_chunks: int
@@ -115,28 +281,406 @@ class MemoryStats(BaseModel):
 # Core Components
 # ============================================================================
 
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry time to live."""
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None: del self._items[key]
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_size <= 0: return
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock: self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+# Histogram upper bounds: stage latency in seconds, model batch size in passages
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot: above every bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """Process-wide counters and histograms, rendered in the Prometheus text format."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {} # (name, labels) -> value
+        self._histograms = {} # (name, labels) -> Histogram
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock: self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None: hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time a pipeline stage into memory_stage_seconds; also usable as a decorator."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("memory_stage_seconds", time.perf_counter() - start, stage=stage)
+
+    def render(self, gauges: Dict[str, Any]) -> str:
+        """Exposition text. `gauges` maps a name (or (name, labels) pair) to a value read now;
+        names ending in _total are exposed as counters."""
+        lines, typed = [], set()
+        def sample(name, labels, value, kind):
+            family = name if kind != "histogram" else name.rsplit("_", 1)[0]
+            if family not in typed:
+                typed.add(family)
+                lines.append(f"# TYPE {family} {kind}")
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (h.buckets, list(h.counts), h.sum, h.count)) for k, h in self._histograms.items())
+        for (name, labels), value in counters:
+            sample(name, labels, value, "counter")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                sample(f"{name}_bucket", labels + (("le", bound),), cumulative, "histogram")
+            sample(f"{name}_sum", labels, total, "histogram")
+            sample(f"{name}_count", labels, count, "histogram")
+        for key, value in gauges.items():
+            if value is None: continue
+            name, labels = key if isinstance(key, tuple) else (key, ())
+            sample(name, labels, value, "counter" if name.endswith("_total") else "gauge")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def process_rss_bytes() -> Optional[int]:
+    """Resident memory of this process, or None where it cannot be read without psutil."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+@contextmanager
+def profiled(name: str):
+    """Profile the enclosed work on this thread; keep the trace if it ran over PROFILE_SLOW_MS."""
+    profiler = None
+    if PROFILE_SLOW_MS > 0:
+        try:
+            if PROFILER == "pyinstrument":
+                from pyinstrument import Profiler
+                profiler = Profiler(async_mode="disabled")
+                profiler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+        except (ImportError, ValueError, RuntimeError):
+            profiler = None # Not installed, or another thread holds the process-wide profiler
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if PROFILER == "pyinstrument": profiler.stop()
+            else: profiler.disable()
+            if elapsed_ms > PROFILE_SLOW_MS: _save_profile(profiler, name, elapsed_ms)
+
+def _save_profile(profiler, name: str, elapsed_ms: float):
+    folder = DATA_DIR / "profiles"
+    folder.mkdir(parents=True, exist_ok=True)
+    stem = f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{elapsed_ms:.0f}ms"
+    if PROFILER == "pyinstrument":
+        path = folder / f"{stem}.html"
+        path.write_text(profiler.output_html(), encoding="utf-8")
+    else:
+        path = folder / f"{stem}.prof" # python -m pstats, or snakeviz
+        profiler.dump_stats(str(path))
+    metrics.inc("memory_slow_operations_total", operation=name)
+    logger.warning(f"Slow {name} ({elapsed_ms:.0f} ms), profile written to {path}")
+    for old in sorted(folder.iterdir(), key=lambda p: p.stat().st_mtime)[:-PROFILES_KEPT]:
+        old.unlink(missing_ok=True)
+
+def normalize_query(text: str, lowercase: bool = False) -> str:
+    """A query as its cache key: spacing never changes the embedding, case only for a cased tokenizer."""
+    text = " ".join(text.split())
+    return text.lower() if lowercase else text
+
+def tokenizer_lowercases(tokenizer) -> bool:
+    """Whether a (Hugging Face) tokenizer lowercases its input, as bge's uncased WordPiece one does."""
+    if getattr(tokenizer, "do_lower_case", None) is not None: return bool(tokenizer.do_lower_case)
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is None or backend.normalizer is None: return False
+    normalizer = json.dumps(json.loads(backend.to_str()).get("normalizer"))
+    return '"lowercase": true' in normalizer or '"type": "Lowercase"' in normalizer
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens for the keyword index; very long runs are noise (hashes, base64)."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if len(t) <= 40]
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """Merge ranked id lists; each id scores sum(1 / (k + rank)) over the lists it is in.
+
+    Returns (ids, scores) as arrays, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, vid in enumerate(ranking, start=1):
+            vid = int(vid)
+            scores[vid] = scores.get(vid, 0.0) + 1.0 / (k + rank)
+    ids = sorted(scores, key=scores.get, reverse=True)
+    return np.array(ids, dtype='int64'), np.array([scores[i] for i in ids], dtype='float32')
+
+def rerank_scores(relevance: np.ndarray, engagement: np.ndarray, timestamps: np.ndarray,
+                  now_ms: Optional[float] = None) -> np.ndarray:
+    """Blend relevance with engagement and recency, vectorised over the candidates.
+
+    Engagement saturates as e / (1 + e); recency halves every RECENCY_HALF_LIFE_DAYS.
+    """
+    now_ms = time.time() * 1000 if now_ms is None else now_ms
+    engagement = np.clip(engagement, 0, None)
+    engagement = engagement / (1.0 + engagement)
+    age_days = np.clip(now_ms - timestamps, 0, None) / 86_400_000
+    recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    weight = 1.0 - RERANK_ENGAGEMENT_WEIGHT - RERANK_RECENCY_WEIGHT
+    return (weight * relevance + RERANK_ENGAGEMENT_WEIGHT * engagement
+            + RERANK_RECENCY_WEIGHT * recency).astype('float32')
+
+def mmr_select(scores: np.ndarray, vectors: np.ndarray, k: int, lam: float = MMR_LAMBDA,
+               groups: Optional[np.ndarray] = None) -> np.ndarray:
+    """Maximal marginal relevance: indices of k candidates, in pick order.
+
+    Pairwise similarities are one matrix product up front; each pick is then
+    a vectorised argmax of lam * score - (1 - lam) * max similarity to the
+    picks so far. Candidates sharing a `groups` value with a pick are skipped.
+    """
+    n = len(scores)
+    if n == 0: return np.zeros(0, dtype='int64')
+    pairwise = vectors @ vectors.T
+    closest = np.zeros(n, dtype='float32') # Max similarity to anything picked
+    available = np.ones(n, dtype=bool)
+    picked = []
+    while len(picked) < k and available.any():
+        i = int(np.argmax(np.where(available, lam * scores - (1.0 - lam) * closest, -np.inf)))
+        picked.append(i)
+        available[i] = False
+        if groups is not None: available &= groups != groups[i]
+        np.maximum(closest, pairwise[i], out=closest)
+    return np.array(picked, dtype='int64')
+
+def url_domain(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def normalize_domain(domain: str) -> str:
+    """A user-supplied domain ("www.GitHub.com", "github.com:443") as url_domain() spells it."""
+    return url_domain("//" + domain) or domain.lower()
+
+WHITESPACE = re.compile(r"\s+")
+
 class ContentExtractor:
-    """Extracts clean text from HTML."""
+    """Extracts the main readable text from HTML.
+
+    Parses with lxml, strips non-content elements, then keeps the block that
+    scores best on paragraph text density (a reduced Readability heuristic).
+    Falls back to the whole body when no block clearly dominates. Block
+    elements end lines of the output, which the chunker prefers to break at.
+    """
+    # Not <form>: ASP.NET and similar pages wrap the whole body in one; only its controls go
+    JUNK_TAGS = ("script", "style", "nav", "footer", "aside", "iframe", "noscript", "svg", "template",
+                 "input", "button", "select", "textarea")
+    # Site headers; an article's own <header> holds its title and byline
+    JUNK_HEADERS = "//header[not(ancestor::article or ancestor::main or ancestor::*[@role='main'])]"
+    JUNK_ROLES = {"navigation", "banner", "contentinfo", "complementary"}
+    PARAGRAPH_TAGS = {"p", "pre", "td", "blockquote", "li", "dd"}
+    # Elements that start a new line of extracted text, so the chunker sees paragraph breaks
+    BLOCK_TAGS = {"address", "article", "aside", "blockquote", "br", "dd", "details", "div", "dl", "dt",
+                  "figcaption", "figure", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "li", "main", "ol",
+                  "p", "pre", "section", "summary", "table", "tr", "ul"}
+    MIN_PARAGRAPH_CHARS = 25
+    # A candidate must hold this share of the page text to replace the body
+    MIN_MAIN_SHARE = 0.2
+
+    def __init__(self, max_chars: int = MAX_HTML_CHARS):
+        self.max_chars = max_chars
+
     def extract(self, html: str) -> str:
         if not html: return ""
-        soup = BeautifulSoup(html, "html.parser")
-        
+        try:
+            # Bytes, so pages with an XML encoding declaration still parse
+            root = lxml_html.fromstring(html[: self.max_chars].encode("utf-8", "replace"),
+                                        parser=lxml_html.HTMLParser(encoding="utf-8"))
+        except (etree.ParserError, ValueError):
+            return ""
+
         # Remove junk
-        for tag in soup(["script", "style", "nav", "footer", "iframe", "noscript"]):
-            tag.decompose()
-            
-        text = soup.get_text(separator=" ", strip=True)
-        return text
+        etree.strip_elements(root, etree.Comment, *self.JUNK_TAGS, with_tail=False)
+        for el in root.xpath(self.JUNK_HEADERS):
+            if el.getparent() is not None: el.drop_tree()
+        for el in root.xpath("//*[@role]"):
+            if el.get("role") in self.JUNK_ROLES and el.getparent() is not None:
+                el.drop_tree()
+
+        body = root.find("body")
+        if body is None: body = root
+        main = self._main_block(body)
+        return self._text(main if main is not None else body)
+
+    def _text(self, el) -> str:
+        """Text of `el`, one line per block element; other whitespace (source newlines too) becomes one space."""
+        parts = []
+        for event, node in etree.iterwalk(el, events=("start", "end")):
+            if node.tag in self.BLOCK_TAGS: parts.append("\n")
+            text = (node.text if isinstance(node.tag, str) else None) if event == "start" else \
+                   (node.tail if node is not el else None)
+            if text: parts.append(WHITESPACE.sub(" ", text))
+        lines = (" ".join(line.split()) for line in "".join(parts).split("\n"))
+        return "\n".join(line for line in lines if line)
+
+    def _main_block(self, body):
+        total = len(body.text_content()) or 1
+        # Explicit landmarks first, unless one only wraps a teaser or a sidebar widget
+        for path in ("//article", "//main", "//*[@role='main']"):
+            found = body.xpath(path)
+            if len(found) == 1 and len(found[0].text_content()) / total >= self.MIN_MAIN_SHARE: return found[0]
+
+        scores = {}
+        for p in body.iter(*self.PARAGRAPH_TAGS):
+            text = p.text_content().strip()
+            if len(text) < self.MIN_PARAGRAPH_CHARS: continue
+            score = 1 + text.count(",") + min(len(text) / 100, 3)
+            parent = p.getparent()
+            if parent is None: continue
+            scores[parent] = scores.get(parent, 0) + score
+            grand = parent.getparent()
+            if grand is not None: scores[grand] = scores.get(grand, 0) + score / 2
+        if not scores: return None
+
+        def adjusted(el):
+            text_len = len(el.text_content()) or 1
+            link_len = sum(len(a.text_content()) for a in el.iter("a"))
+            return scores[el] * (1 - link_len / text_len)
+
+        best = max(scores, key=adjusted)
+        if len(best.text_content()) / total < self.MIN_MAIN_SHARE: return None
+        return best
 
 class SemanticChunker:
-    """Splits text into chunks using tokenizer."""
+    """Splits text into overlapping token windows that end on natural breaks.
+
+    With a fast tokenizer the token offsets slice chunks straight out of the
+    source text (no decode pass), and each window end snaps back to the
+    last paragraph or sentence break in its final `chunk_overlap` tokens,
+    failing that to a word start. The token ids are returned alongside so
+    the model does not tokenize the chunks again.
+    """
+    # Token start positions that open a paragraph / sentence
+    PARAGRAPH_BREAK = re.compile(r"\n\s*")
+    SENTENCE_BREAK = re.compile(r"[.!?][\"'\u201d)\]]*\s+")
+
     def __init__(self, tokenizer, chunk_size=400, chunk_overlap=80):
         self.tokenizer = tokenizer
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.has_offsets = getattr(tokenizer, "is_fast", False)
         
     def chunk(self, text: str) -> List[str]:
-        if not text: return []
+        return self.chunk_tokens(text)[0]
+
+    def chunk_tokens(self, text: str):
+        """Chunks of `text` and, when the tokenizer gives offsets, each chunk's token ids (else None)."""
+        if not text: return [], None
+        if not self.has_offsets: return self._chunk_decoded(text), None
+        encoded = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                 return_attention_mask=False, return_token_type_ids=False)
+        ids = encoded["input_ids"]
+        if len(ids) <= self.chunk_size:
+            return [text], [ids]
+        offsets = np.asarray(encoded["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+        levels = self._break_levels(text, offsets)
+
+        chunks, token_ids = [], []
+        n, start = len(ids), 0
+        while True:
+            end = min(start + self.chunk_size, n)
+            if end < n:
+                end = self._snap(levels, end - self.chunk_overlap + 1, end + 1, latest=True) or end
+            chunks.append(text[offsets[start, 0] : offsets[end - 1, 1]])
+            token_ids.append(ids[start:end])
+            if end >= n: break
+            # Overlap: the next window opens on the earliest break within chunk_overlap of the end
+            next_start = max(end - self.chunk_overlap, start + 1)
+            start = self._snap(levels, next_start, end, latest=False) or next_start
+        return chunks, token_ids
+
+    def _break_levels(self, text: str, offsets: np.ndarray) -> np.ndarray:
+        """Per token: 3 opens a paragraph, 2 a sentence, 1 a word, 0 continues a word."""
+        starts = offsets[:, 0]
+        levels = np.zeros(len(offsets), dtype=np.int8)
+        levels[1:][starts[1:] > offsets[:-1, 1]] = 1
+        for level, pattern in ((2, self.SENTENCE_BREAK), (3, self.PARAGRAPH_BREAK)):
+            positions = np.fromiter((m.end() for m in pattern.finditer(text)), dtype=np.int64)
+            tokens = np.searchsorted(starts, positions)
+            tokens = tokens[tokens < len(starts)]
+            tokens = tokens[starts[tokens] == positions[: len(tokens)]]
+            levels[tokens] = level
+        levels[0] = 0
+        return levels
+
+    @staticmethod
+    def _snap(levels: np.ndarray, lo: int, hi: int, latest: bool) -> int:
+        """Token in [lo, hi) that opens the strongest break (the latest or earliest of them); 0 if none."""
+        window = levels[lo:hi]
+        if not len(window) or window.max() == 0: return 0
+        hits = np.flatnonzero(window == window.max())
+        return lo + int(hits[-1] if latest else hits[0])
+
+    def _chunk_decoded(self, text: str) -> List[str]:
+        """Fixed windows decoded back to text, for slow tokenizers without offsets."""
         tokens = self.tokenizer.encode(text, add_special_tokens=False)
         if len(tokens) <= self.chunk_size:
             return [text]
@@ -150,39 +694,260 @@ class SemanticChunker:
             if i + self.chunk_size >= len(tokens): break
         return chunks
 
+class TorchBackend:
+    """sentence-transformers on PyTorch; the reference the other backends are checked against."""
+    def __init__(self, path: str):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if EMBED_THREADS: torch.set_num_threads(EMBED_THREADS)
+        self.model = SentenceTransformer(path)
+        self.tokenizer = self.model.tokenizer
+        self.max_length = self.model.max_seq_length
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False)
+
+    def encode_ids(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """One forward pass over padded token ids, as model.encode would run it."""
+        import torch
+        device = self.model.device
+        features = {"input_ids": torch.from_numpy(input_ids).to(device),
+                    "attention_mask": torch.from_numpy(attention_mask).to(device)}
+        with torch.inference_mode():
+            vecs = self.model(features)["sentence_embedding"]
+        return torch.nn.functional.normalize(vecs, dim=1).float().cpu().numpy()
+
+class OnnxBackend:
+    """The model's transformer on ONNX Runtime, with pooling and normalization in NumPy.
+
+    Uses the ONNX export shipped in the model folder (onnx/model.onnx) when
+    there is one, otherwise exports it once with torch into DATA_DIR/onnx.
+    With `quantize`, weights are dynamically quantized to int8 (also once).
+    """
+    def __init__(self, path: str, quantize: bool = False):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.source = path
+        if not Path(path).is_dir():
+            from huggingface_hub import snapshot_download
+            path = snapshot_download(path, allow_patterns=["*.json", "*.txt", "onnx/model.onnx"])
+        self.path = Path(path)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.max_length = self._read_json("sentence_bert_config.json").get("max_seq_length", 512)
+        pooling = self._read_json("1_Pooling/config.json")
+        self.mean_pooling = pooling.get("pooling_mode") == "mean" or pooling.get("pooling_mode_mean_tokens", False)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if EMBED_THREADS: options.intra_op_num_threads = EMBED_THREADS
+        self.session = ort.InferenceSession(str(self._model_file(quantize)), options,
+                                            providers=["CPUExecutionProvider"])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+        self.dim = self.session.get_outputs()[0].shape[-1]
+
+    def _read_json(self, name: str) -> Dict[str, Any]:
+        path = self.path / name
+        if not path.exists(): return {}
+        with open(path, "r") as f: return json.load(f)
+
+    def _model_file(self, quantize: bool) -> Path:
+        name = "model_int8.onnx" if quantize else "model.onnx"
+        for folder in (self.path / "onnx", DATA_DIR / "onnx" / self.path.name):
+            if (folder / name).exists(): return folder / name
+        out = DATA_DIR / "onnx" / self.path.name
+        out.mkdir(parents=True, exist_ok=True)
+        fp32 = self.path / "onnx" / "model.onnx"
+        if not fp32.exists():
+            fp32 = out / "model.onnx"
+            if not fp32.exists(): self._export(fp32)
+        if not quantize: return fp32
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        logger.info(f"Quantizing {fp32} to int8")
+        quantize_dynamic(str(fp32), str(out / name), weight_type=QuantType.QInt8)
+        return out / name
+
+    def _export(self, out: Path):
+        import torch
+        from transformers import AutoModel
+        logger.info(f"Exporting {self.path} to ONNX (one-time)")
+        model = AutoModel.from_pretrained(self.source).eval()
+        sample = self.tokenizer(["export"], return_tensors="pt")
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+        axes = {n: {0: "batch", 1: "tokens"} for n in names}
+        axes["last_hidden_state"] = {0: "batch", 1: "tokens"}
+        torch.onnx.export(model, tuple(sample[n] for n in names), str(out), input_names=names,
+                          output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=17)
+
+    def encode(self, texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), batch_size):
+            enc = self.tokenizer(texts[start : start + batch_size], padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+            out.append(self.encode_ids(enc["input_ids"], enc["attention_mask"]))
+        return np.concatenate(out) if out else np.zeros((0, self.dim), dtype='float32')
+
+    def encode_ids(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        feeds = {"input_ids": input_ids.astype(np.int64), "attention_mask": attention_mask.astype(np.int64)}
+        if "token_type_ids" in self.inputs: feeds["token_type_ids"] = np.zeros_like(feeds["input_ids"])
+        hidden = self.session.run(None, feeds)[0]
+        if self.mean_pooling:
+            mask = feeds["attention_mask"][..., None].astype('float32')
+            vecs = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        else:
+            vecs = hidden[:, 0]
+        return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype('float32')
+
+EMBEDDING_BACKENDS = {
+    "torch": TorchBackend,
+    "onnx": lambda path: OnnxBackend(path),
+    "onnx-int8": lambda path: OnnxBackend(path, quantize=True),
+}
+
 class EmbeddingEngine:
     """Handles model loading and embedding."""
-    def __init__(self, model_name: str = MODEL_NAME):
+    def __init__(self, model_name: str = MODEL_NAME, backend: str = EMBEDDING_BACKEND,
+                 model_dir: Optional[str] = MODEL_DIR):
         self.model_name = model_name
+        self.backend = backend
+        self.model_dir = model_dir
         self.model = None
         self.tokenizer = None
-        self._is_loading = False
+        self._lowercase = None # Whether the tokenizer lowercases, once it is loaded
+        self.state = "idle" # idle | loading | ready | failed
+        self.load_error = None
+        self.ready = threading.Event()
+        self._state_changed = threading.Condition()
+        self.query_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
 
     def load(self):
-        if self.model is not None or self._is_loading: return
-        self._is_loading = True
+        """Load synchronously; if another thread is already loading, wait for it instead."""
+        with self._state_changed:
+            if self.state == "loading":
+                self._state_changed.wait_for(lambda: self.state != "loading")
+                return
+            if self.state == "ready": return
+            self.state = "loading"
+        self._load()
+
+    def start_loading(self):
+        """Load in a background thread (retrying a failed load); returns at once."""
+        with self._state_changed:
+            if self.state in ("loading", "ready"): return
+            self.state = "loading"
+        threading.Thread(target=self._load, name="memory-model-load", daemon=True).start()
+
+    def _load(self):
+        model, error = None, None
         try:
-            logger.info(f"Loading embedding model: {self.model_name}")
-            self.model = SentenceTransformer(self.model_name)
-            self.tokenizer = self.model.tokenizer
-            logger.info(f"Model loaded. Dim: {EMBEDDING_DIM}")
+            if self.backend not in EMBEDDING_BACKENDS:
+                raise ValueError(f"Unknown embedding backend {self.backend!r}")
+            path = self.model_dir or self.model_name
+            logger.info(f"Loading embedding model: {path} ({self.backend})")
+            start = time.perf_counter()
+            model = EMBEDDING_BACKENDS[self.backend](path)
+            if model.dim != EMBEDDING_DIM:
+                raise ValueError(f"{path} gives {model.dim}-dim vectors, the store expects {EMBEDDING_DIM} "
+                                 f"(set MEMORY_EMBEDDING_DIM and re-embed with bulk_import.py --reembed)")
+            model.encode(["warm-up"], 1) # First inference allocates buffers and picks kernels
+            logger.info(f"Model loaded in {time.perf_counter() - start:.1f}s. Dim: {EMBEDDING_DIM}")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
-            self.model = None
-        finally:
-            self._is_loading = False
+            model, error = None, str(e)
+        with self._state_changed:
+            if model is not None:
+                self.tokenizer, self.model = model.tokenizer, model
+                self.ready.set()
+            self.load_error = error
+            self.state = "ready" if model is not None else "failed"
+            self._state_changed.notify_all()
+
+    def wait_ready(self, timeout: Optional[float] = MODEL_READY_TIMEOUT):
+        """Block until the model can embed, starting the load if needed. Raises a 503 on timeout or failure."""
+        if self.ready.is_set(): return
+        self.start_loading()
+        with self._state_changed:
+            if not self._state_changed.wait_for(lambda: self.state != "loading", timeout):
+                raise HTTPException(status_code=503, detail="Embedding model is still loading",
+                                    headers={"Retry-After": "5"})
+        if not self.ready.is_set():
+            raise HTTPException(status_code=503, detail=f"Embedding model failed to load: {self.load_error}")
 
     def is_ready(self) -> bool:
-        return self.model is not None
+        return self.ready.is_set()
 
     def embed_passage(self, text: str) -> np.ndarray:
-        if not self.model: self.load()
-        return self.model.encode(text, normalize_embeddings=True)
+        return self.embed_passages([text])[0]
+
+    def embed_passages(self, texts: List[str], batch_size: int = EMBED_BATCH_SIZE,
+                       token_ids: Optional[List[List[int]]] = None) -> np.ndarray:
+        """Embed many passages at once. Rows of the result follow the input order.
+
+        `token_ids` (from SemanticChunker.chunk_tokens) skips tokenizing the
+        texts again when the model can take ids directly.
+        """
+        self.wait_ready()
+        if not texts: return np.zeros((0, EMBEDDING_DIM), dtype='float32')
+        with metrics.timer("embed"):
+            return self._embed_passages(texts, batch_size, token_ids)
+
+    def _embed_passages(self, texts: List[str], batch_size: int, token_ids: Optional[List[List[int]]]) -> np.ndarray:
+        use_ids = token_ids is not None and self.accepts_token_ids()
+
+        # Longest first so each batch pads to a similar length
+        lengths = [len(t) for t in (token_ids if use_ids else texts)]
+        order = np.argsort([-n for n in lengths], kind='stable')
+        out = np.empty((len(texts), EMBEDDING_DIM), dtype='float32')
+        for start in range(0, len(texts), batch_size):
+            idx = order[start : start + batch_size]
+            metrics.observe("memory_embed_batch_size", len(idx), buckets=BATCH_BUCKETS)
+            if use_ids:
+                out[idx] = self.model.encode_ids(*self._pad_ids([token_ids[i] for i in idx]))
+            else:
+                out[idx] = self.model.encode([texts[i] for i in idx], batch_size)
+        return out
+
+    def accepts_token_ids(self) -> bool:
+        # Ids are wrapped BERT-style, [CLS] ... [SEP]
+        return (getattr(self.tokenizer, "is_fast", False) and getattr(self.tokenizer, "cls_token_id", None) is not None
+                and getattr(self.tokenizer, "sep_token_id", None) is not None)
+
+    def _pad_ids(self, token_ids: List[List[int]]):
+        """Padded input ids and attention mask for chunk token ids."""
+        limit = self.model.max_length - 2 # [CLS] and [SEP]
+        cls, sep = [self.tokenizer.cls_token_id], [self.tokenizer.sep_token_id]
+        rows = [cls + ids[:limit] + sep for ids in token_ids]
+        input_ids = np.full((len(rows), max(map(len, rows))), self.tokenizer.pad_token_id, dtype=np.int64)
+        mask = np.zeros_like(input_ids)
+        for i, row in enumerate(rows):
+            input_ids[i, : len(row)] = row
+            mask[i, : len(row)] = 1
+        return input_ids, mask
+
+    def query_key(self, text: str) -> str:
+        """normalize_query() for this model; only spacing is normalized until it is loaded."""
+        if self._lowercase is None and self.tokenizer is not None:
+            self._lowercase = tokenizer_lowercases(self.tokenizer)
+        return normalize_query(text, bool(self._lowercase))
 
     def embed_query(self, text: str) -> np.ndarray:
-        if not self.model: self.load()
-        instruction = "Represent this sentence for searching relevant passages: "
-        return self.model.encode(instruction + text, normalize_embeddings=True)
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """One vector per query, in order. Cache misses share one model batch."""
+        if texts: self.wait_ready() # The keys depend on the tokenizer
+        keys = [self.query_key(t) for t in texts]
+        vecs = {key: self.query_cache.get(key) for key in keys}
+        missing = [key for key, vec in vecs.items() if vec is None]
+        if missing:
+            with metrics.timer("embed_query"):
+                encoded = self.model.encode([QUERY_INSTRUCTION + key for key in missing])
+            for key, vec in zip(missing, encoded):
+                vec.flags.writeable = False # Shared by every caller that hits the cache
+                self.query_cache.put(key, vec)
+                vecs[key] = vec
+        return np.stack([vecs[key] for key in keys]) if keys else np.zeros((0, EMBEDDING_DIM), dtype='float32')
 
 class MemoryStore:
     """FAISS-based Vector Store."""
@@ -254,142 +1019,2013 @@ class MemoryStore:
     pass
 
 # COMPLETE STORE IMPLEMENTATION
+INDEX_KINDS = {
+    "IndexFlatIP": "flat",
+    "IndexFlatL2": "flat",
+    "IndexScalarQuantizer": "flat",
+    "IndexPQ": "flat",
+    "IndexIVFFlat": "ivf_flat",
+    "IndexIVFScalarQuantizer": "ivf_flat",
+    "IndexIVFPQ": "ivf_pq",
+    "IndexHNSWFlat": "hnsw",
+    "IndexHNSWSQ": "hnsw",
+    "IndexHNSWPQ": "hnsw",
+}
+
+# Scalar quantizer per VECTOR_STORAGE value
+SQ_TYPES = {"float16": "QT_fp16", "int8": "QT_8bit"}
+
+def _is_id_map(index) -> bool:
+    return type(index).__name__.startswith("IndexIDMap")
+
+def index_kind(index) -> str:
+    if _is_id_map(index): index = faiss.downcast_index(index.index)
+    return INDEX_KINDS.get(type(index).__name__, "flat")
+
+def index_storage(index) -> str:
+    """How the index holds vectors: float32, float16, int8 or pq."""
+    if _is_id_map(index): index = faiss.downcast_index(index.index)
+    name = type(index).__name__
+    if name.endswith("PQ"): return "pq"
+    if name == "IndexHNSWSQ": index = faiss.downcast_index(index.storage)
+    if hasattr(index, "sq"):
+        return "float16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "float32"
+
+def index_has_ids(index) -> bool:
+    """True if the index is addressed by our stable vids rather than insertion order."""
+    return _is_id_map(index) or index_kind(index).startswith("ivf")
+
+def index_supports_remove(index) -> bool:
+    # HNSW graphs cannot drop nodes; deleted vids are tombstoned until the next rebuild
+    return index_kind(index) != "hnsw"
+
+def ivf_nlist(n: int) -> int:
+    return int(min(65536, max(1, 4 * np.sqrt(n))))
+
+def target_index_kind(n: int, total: Optional[int] = None) -> str:
+    """Index type for n chunks in a store of `total` (n by default): ANN once the store passes ANN_THRESHOLD."""
+    total = n if total is None else total
+    kind = INDEX_BACKEND if INDEX_BACKEND != "auto" else (ANN_BACKEND if total >= ANN_THRESHOLD else "flat")
+    if kind.startswith("ivf") and n < IVF_MIN_ROWS: return "flat"
+    return kind
+
+def target_index(n: int, total: Optional[int] = None):
+    """(kind, storage) for n chunks in a store of `total` (n by default).
+
+    The store's size decides when to switch to ANN and compressed codes, so
+    a time shard follows the whole store; the index's own size decides
+    whether there is enough to train them on.
+    """
+    total = n if total is None else total
+    kind, storage = target_index_kind(n, total), VECTOR_STORAGE
+    if storage in ("int8", "pq") and total < QUANTIZE_MIN_ROWS: storage = "float32" # Too little to train on
+    if storage == "pq" and n < PQ_MIN_ROWS: storage = "float32"
+    if kind == "ivf_pq" or (kind == "ivf_flat" and storage == "pq"): return "ivf_pq", "pq"
+    return kind, storage
+
+def index_needs_rebuild(index, n: int, tombstones: int = 0, total: Optional[int] = None) -> bool:
+    kind, storage = target_index(n, total)
+    if (index_kind(index), index_storage(index)) != (kind, storage): return True
+    if index.metric_type != faiss.METRIC_INNER_PRODUCT: return True
+    if tombstones > TOMBSTONE_REBUILD_RATIO * max(1, index.ntotal): return True
+    # IVF lists are sized at training time; retrain once the store has grown well past that
+    return kind.startswith("ivf") and ivf_nlist(n) >= 2 * index.nlist
+
+def create_index(kind: str, n: int = 0, train: Optional[np.ndarray] = None, storage: str = "float32"):
+    """Empty index of the given kind and storage that accepts add_with_ids.
+
+    IVF indexes store ids in their inverted lists; flat and HNSW are wrapped
+    in IndexIDMap. Trained on `train` when the kind or storage needs it. All
+    use inner product, which is cosine similarity on the normalised embeddings.
+    """
+    ip = faiss.METRIC_INNER_PRODUCT
+    sq = getattr(faiss.ScalarQuantizer, SQ_TYPES[storage]) if storage in SQ_TYPES else None
+    if kind in ("ivf_flat", "ivf_pq"):
+        quantizer = faiss.IndexFlatIP(EMBEDDING_DIM)
+        if kind == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, EMBEDDING_DIM, ivf_nlist(n), PQ_M, 8, ip)
+        elif sq is not None:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, EMBEDDING_DIM, ivf_nlist(n), sq, ip)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, EMBEDDING_DIM, ivf_nlist(n), ip)
+        index.train(train)
+        index.nprobe = DEFAULT_NPROBE
+        return index
+    if kind == "hnsw":
+        if sq is not None: index = faiss.IndexHNSWSQ(EMBEDDING_DIM, sq, HNSW_M, ip)
+        elif storage == "pq": index = faiss.IndexHNSWPQ(EMBEDDING_DIM, PQ_M, HNSW_M, 8, ip)
+        else: index = faiss.IndexHNSWFlat(EMBEDDING_DIM, HNSW_M, ip)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = DEFAULT_EF_SEARCH
+    elif sq is not None:
+        index = faiss.IndexScalarQuantizer(EMBEDDING_DIM, sq, ip)
+    elif storage == "pq":
+        index = faiss.IndexPQ(EMBEDDING_DIM, PQ_M, 8, ip)
+    else:
+        index = faiss.IndexFlatIP(EMBEDDING_DIM)
+    if not index.is_trained: index.train(train)
+    return faiss.IndexIDMap(index)
+
+def search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None, sel=None):
+    """Per-call FAISS parameters, so concurrent searches don't mutate the index.
+
+    `sel` is an optional faiss.IDSelector restricting the ids searched.
+    """
+    kind = index_kind(index)
+    extra = {"sel": sel} if sel is not None else {}
+    if kind.startswith("ivf"):
+        return faiss.SearchParametersIVF(nprobe=nprobe or DEFAULT_NPROBE, **extra)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or DEFAULT_EF_SEARCH, **extra)
+    return faiss.SearchParameters(**extra) if extra else None
+
+class VectorBuffer:
+    """Growable contiguous array with amortised O(1) appends.
+
+    Holds rows of `dim` values, or scalars when `dim` is None.
+    """
+    def __init__(self, dim: Optional[int] = EMBEDDING_DIM, capacity: int = 256, dtype: str = 'float32'):
+        self._shape = (dim,) if dim else ()
+        self._data = np.empty((capacity,) + self._shape, dtype=dtype)
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=self._data.dtype).reshape((-1,) + self._shape)
+        needed = self._len + len(rows)
+        if needed > len(self._data):
+            grown = np.empty((max(needed, 2 * len(self._data)),) + self._shape, dtype=self._data.dtype)
+            grown[: self._len] = self._data[: self._len]
+            self._data = grown
+        self._data[self._len : needed] = rows
+        self._len = needed
+
+    def view(self) -> np.ndarray:
+        return self._data[: self._len]
+
+    def clear(self):
+        self._data = np.empty((256,) + self._shape, dtype=self._data.dtype)
+        self._len = 0
+
+    def replace(self, rows: np.ndarray):
+        self.clear()
+        self.append(rows)
+
+class BM25Index:
+    """In-memory inverted index over chunk text with BM25 scoring.
+
+    Postings as of the last save() are held flat, CSR style: per-term
+    offsets into one uint32 vid array and one uint8 term-frequency array
+    (about 5 bytes per posting). Chunks added since then go to small
+    per-term append buffers that save() merges into the flat arrays.
+    Deleted vids are masked at query time and dropped by save().
+    Vids must fit in 32 bits.
+    """
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1, self.b = k1, b
+        self._terms = {} # term -> position in _offsets
+        self._offsets = np.zeros(1, dtype='int64')
+        self._vids = np.zeros(0, dtype='uint32')
+        self._tfs = np.zeros(0, dtype='uint8')
+        self._delta = {} # term -> (array of vids, array of tfs) added since save()
+        self._doc_vids = VectorBuffer(None, dtype='uint32') # Ascending, like the store's rows
+        self._doc_lens = VectorBuffer(None, dtype='uint16')
+        self._dead = set()
+        self._dead_sorted = None
+        self.doc_count = 0 # Live documents
+        self._total_len = 0 # Tokens over live documents
+        self.max_vid = -1
+
+    def add(self, vid: int, text: str):
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            postings = self._delta.get(term)
+            if postings is None: postings = self._delta[term] = (array('I'), array('B'))
+            postings[0].append(vid)
+            postings[1].append(min(tf, 255))
+        self._doc_vids.append([vid])
+        self._doc_lens.append([min(len(tokens), 65535)])
+        self.doc_count += 1
+        self._total_len += min(len(tokens), 65535)
+        self.max_vid = max(self.max_vid, vid)
+
+    def remove(self, vids):
+        vids = np.asarray(vids, dtype='int64')
+        lens = self._doc_len(vids)
+        for vid, length in zip(vids.tolist(), lens.tolist()):
+            if length < 0 or vid in self._dead: continue
+            self._dead.add(vid)
+            self.doc_count -= 1
+            self._total_len -= length
+        self._dead_sorted = None
+
+    def doc_vids(self) -> np.ndarray:
+        return self._doc_vids.view().astype('int64')
+
+    def _doc_len(self, vids: np.ndarray) -> np.ndarray:
+        """Token counts for vids; -1 for vids never added."""
+        doc_vids = self._doc_vids.view()
+        if not len(doc_vids): return np.full(len(vids), -1, dtype='int64')
+        pos = np.minimum(np.searchsorted(doc_vids, vids), len(doc_vids) - 1)
+        return np.where(doc_vids[pos] == vids, self._doc_lens.view()[pos].astype('int64'), -1)
+
+    def _postings(self, term: str):
+        parts_v, parts_tf = [], []
+        tid = self._terms.get(term)
+        if tid is not None:
+            start, stop = self._offsets[tid], self._offsets[tid + 1]
+            parts_v.append(self._vids[start:stop])
+            parts_tf.append(self._tfs[start:stop])
+        delta = self._delta.get(term)
+        if delta is not None:
+            # Copies, so the arrays are not left exporting buffers (which blocks appends)
+            parts_v.append(np.frombuffer(delta[0], dtype='uint32').copy())
+            parts_tf.append(np.frombuffer(delta[1], dtype='uint8').copy())
+        if not parts_v: return None, None
+        if len(parts_v) == 1: return parts_v[0], parts_tf[0]
+        return np.concatenate(parts_v), np.concatenate(parts_tf)
+
+    def _dead_vids(self) -> np.ndarray:
+        if self._dead_sorted is None: self._dead_sorted = np.array(sorted(self._dead), dtype='uint32')
+        return self._dead_sorted
+
+    def stats(self, text: str) -> Dict[str, Any]:
+        """Corpus statistics search() scores `text` with; add them up to score several indexes as one.
+
+        Only live documents count, so scores neither depend on deletes save()
+        has not dropped yet nor on how the documents are split into indexes.
+        """
+        df = {}
+        for term in set(tokenize(text)):
+            vids, _ = self._postings(term)
+            if vids is None: continue
+            n = len(vids)
+            if self._dead: n -= int(np.isin(vids, self._dead_vids(), assume_unique=True).sum())
+            if n: df[term] = n
+        return {"docs": self.doc_count, "length": self._total_len, "df": df}
+
+    @staticmethod
+    def merge_stats(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Statistics of several indexes taken as one."""
+        df = Counter()
+        for part in parts: df.update(part["df"])
+        return {"docs": sum(p["docs"] for p in parts), "length": sum(p["length"] for p in parts), "df": dict(df)}
+
+    def search(self, text: str, k: int, allowed: Optional[np.ndarray] = None, stats: Optional[Dict[str, Any]] = None):
+        """Top-k live vids by BM25 score, best first, with their scores.
+
+        `allowed` optionally restricts results to a sorted array of vids.
+        `stats` (see stats()) replaces this index's own corpus statistics.
+        """
+        empty = np.zeros(0, dtype='int64'), np.zeros(0, dtype='float32')
+        stats = self.stats(text) if stats is None else stats
+        if self.doc_count <= 0 or stats["docs"] <= 0: return empty
+        docs = stats["docs"]
+        avgdl = max(stats["length"] / docs, 1.0)
+        # Terms only deleted documents hold have no df, and nothing live to score
+        postings = [(t, *p) for t, p in ((t, self._postings(t)) for t in set(tokenize(text)) if t in stats["df"])
+                    if p[0] is not None]
+        if not postings: return empty
+        # Decided on the merged statistics, so every index drops the same terms
+        rare = {t for t, df in stats["df"].items() if df <= BM25_MAX_DF_RATIO * docs}
+        if rare: postings = [p for p in postings if p[0] in rare]
+        if not postings: return empty
+
+        all_vids, all_scores = [], []
+        for term, vids, tfs in postings:
+            df = stats["df"][term]
+            idf = math.log(1.0 + (docs - df + 0.5) / (df + 0.5))
+            tf = tfs.astype('float32')
+            norm = self.k1 * (1.0 - self.b + self.b * self._doc_len(vids.astype('int64')) / avgdl)
+            all_vids.append(vids)
+            all_scores.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        vids, inverse = np.unique(np.concatenate(all_vids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if self._dead:
+            live = ~np.isin(vids, self._dead_vids(), assume_unique=True)
+            vids, scores = vids[live], scores[live]
+        if allowed is not None:
+            keep = np.isin(vids, allowed, assume_unique=True)
+            vids, scores = vids[keep], scores[keep]
+        if len(vids) > k:
+            # Keep every tie of the k-th score, so ties break by vid (ascending here) below
+            keep = scores >= np.partition(scores, len(scores) - k)[len(scores) - k]
+            vids, scores = vids[keep], scores[keep]
+        order = np.argsort(-scores, kind='stable')[:k]
+        return vids[order].astype('int64'), scores[order].astype('float32')
+
+    def _merge(self):
+        """Fold the append buffers into the flat arrays and drop deleted documents."""
+        terms = list(self._terms)
+        tids = [np.repeat(np.arange(len(terms), dtype='int64'), np.diff(self._offsets))]
+        vids, tfs = [self._vids], [self._tfs]
+        for term, (delta_vids, delta_tfs) in self._delta.items():
+            tid = self._terms.get(term)
+            if tid is None:
+                tid = self._terms[term] = len(terms)
+                terms.append(term)
+            tids.append(np.full(len(delta_vids), tid, dtype='int64'))
+            vids.append(np.frombuffer(delta_vids, dtype='uint32').copy())
+            tfs.append(np.frombuffer(delta_tfs, dtype='uint8').copy())
+        tids, vids, tfs = np.concatenate(tids), np.concatenate(vids), np.concatenate(tfs)
+
+        doc_vids, doc_lens = self._doc_vids.view(), self._doc_lens.view()
+        if self._dead:
+            dead = np.array(sorted(self._dead), dtype='uint32')
+            keep = ~np.isin(vids, dead)
+            tids, vids, tfs = tids[keep], vids[keep], tfs[keep]
+            keep = ~np.isin(doc_vids, dead)
+            doc_vids, doc_lens = doc_vids[keep], doc_lens[keep]
+
+        # Stable sort keeps each term's postings in vid order; unused terms are dropped
+        order = np.argsort(tids, kind='stable')
+        counts = np.bincount(tids, minlength=len(terms))
+        used = counts > 0
+        self._terms = {t: i for i, t in enumerate(t for t, u in zip(terms, used) if u)}
+        self._offsets = np.concatenate([[0], np.cumsum(counts[used])]).astype('int64')
+        self._vids, self._tfs = vids[order], tfs[order]
+        self._delta = {}
+        self._doc_vids.replace(doc_vids)
+        self._doc_lens.replace(doc_lens)
+        self._dead, self._dead_sorted = set(), None
+
+    def save(self, f):
+        self._merge()
+        terms = np.frombuffer("\n".join(self._terms).encode("utf-8"), dtype='uint8')
+        np.savez(f, terms=terms, offsets=self._offsets, vids=self._vids, tfs=self._tfs,
+                 doc_vids=self._doc_vids.view(), doc_lens=self._doc_lens.view(),
+                 max_vid=np.array([self.max_vid], dtype='int64'))
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        index = cls()
+        with np.load(path) as data:
+            text = data['terms'].tobytes().decode("utf-8")
+            index._terms = {t: i for i, t in enumerate(text.split("\n"))} if text else {}
+            index._offsets, index._vids, index._tfs = data['offsets'], data['vids'], data['tfs']
+            index._doc_vids.replace(data['doc_vids'])
+            index._doc_lens.replace(data['doc_lens'])
+            index.max_vid = int(data['max_vid'][0])
+        index.doc_count = len(index._doc_vids)
+        index._total_len = int(index._doc_lens.view().sum())
+        return index
+
+# Per-chunk fields kept in RAM as arrays, aligned with vector rows
+HOT_COLUMNS = {
+    "vid": "int64",
+    "timestamp": "int64",
+    "engagement": "float32",
+    "chunk_index": "int32",
+    "url_id": "int32",
+    "domain_id": "int32",
+    "parent_idx": "int32",
+    "alive": "bool",
+}
+
+# Columns of the chunks table, in insert order
+CHUNK_FIELDS = ("vid", "id", "parent_id", "url", "title", "summary", "content",
+                "engagement_score", "timestamp", "chunk_index", "total_chunks", "content_hash")
+
+CHUNK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    vid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    parent_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    title TEXT,
+    summary TEXT,
+    content TEXT,
+    engagement_score REAL,
+    timestamp INTEGER,
+    chunk_index INTEGER,
+    total_chunks INTEGER,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_parent ON chunks(parent_id);
+CREATE INDEX IF NOT EXISTS chunks_url ON chunks(url);
+
+-- One row per stored page, for listing pages rather than chunks
+CREATE TABLE IF NOT EXISTS pages (
+    parent_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    domain TEXT,
+    title TEXT,
+    summary TEXT,
+    engagement_score REAL,
+    timestamp INTEGER,
+    total_chunks INTEGER
+);
+CREATE INDEX IF NOT EXISTS pages_time ON pages(timestamp, parent_id);
+CREATE INDEX IF NOT EXISTS pages_domain ON pages(domain, timestamp, parent_id);
+"""
+
+PAGE_FIELDS = ("parent_id", "url", "domain", "title", "summary", "engagement_score", "timestamp", "total_chunks")
+
+def written_ms(directory: Path) -> Optional[int]:
+    """When a store's chunks.db was last written (ms). Writes land in the WAL until a checkpoint."""
+    written = [p.stat().st_mtime for p in (directory / CHUNK_DB_FILE, directory / (CHUNK_DB_FILE + "-wal"))
+               if p.exists()]
+    return int(max(written) * 1000) if written else None
+
+FIND_PAGE_SQL = f"SELECT {', '.join(CHUNK_FIELDS)} FROM chunks WHERE url = ? ORDER BY chunk_index LIMIT 1"
+
+def page_query(limit: int, cursor: Optional[str] = None, offset: int = 0, domain: Optional[str] = None,
+               since: Optional[int] = None, until: Optional[int] = None):
+    """(sql, args) listing pages newest first; raises ValueError for a malformed cursor."""
+    where, args = [], []
+    if domain:
+        where.append("domain = ?")
+        args.append(normalize_domain(domain))
+    if since is not None:
+        where.append("timestamp >= ?")
+        args.append(since)
+    if until is not None:
+        where.append("timestamp <= ?")
+        args.append(until)
+    if cursor:
+        ts, parent_id = cursor.split(":", 1)
+        where.append("(timestamp, parent_id) < (?, ?)")
+        args += [int(ts), parent_id]
+    sql = (f"SELECT {', '.join(PAGE_FIELDS)} FROM pages"
+           + (" WHERE " + " AND ".join(where) if where else "")
+           + " ORDER BY timestamp DESC, parent_id DESC LIMIT ? OFFSET ?")
+    return sql, args + [limit, offset]
+
 class SimpleMemoryStore:
-    def __init__(self):
-        self.ids = [] # List of IDs matching index order
-        self.metadata = {} # ID -> Dict
-        self.vectors = [] # List of numpy arrays
-        self.index = faiss.IndexFlatL2(EMBEDDING_DIM)
+    """Vector store: FAISS index, vector files and a SQLite chunk table.
+
+    Vectors: vectors.npy + vids.npy snapshot (rewritten on compaction and
+    swapped in as a pair, see write_snapshot) and
+    vectors.seg + vids.seg, raw rows appended by flush() in between, so
+    write cost follows the data changed rather than the size of the store.
+    Snapshot and segment vectors are memory-mapped, so full-precision vectors
+    cost page cache rather than heap; only rows not yet flushed are held in
+    a contiguous in-memory tail buffer. With VECTOR_STORAGE set to float16,
+    int8 or pq the index holds compressed codes instead, and hits are
+    re-scored against the full vectors (see _dense_search).
+
+    Chunk metadata and text live in chunks.db. Only the hot fields needed
+    for filtering and stats are held in RAM, as numpy columns aligned with
+    vector rows (HOT_COLUMNS); text is read back for returned hits only.
+    A pages table, indexed by time and domain, backs the /memories listing.
+    Chunk text is also kept in an in-memory BM25 index (BM25Index) for
+    keyword matches, written to lexical.npz on compaction; chunks added
+    since are re-indexed from chunks.db on load.
+    Changes are written inside a SQLite transaction committed by flush(),
+    after the vectors they describe, so a crash never leaves a chunk row
+    without its vector.
+
+    Every chunk has a stable integer vid used as its FAISS id. Rows are
+    always in ascending vid order, so vid -> row is a binary search. Deleted
+    rows stay in place (alive=False) until compaction drops them.
+
+    The index starts exact (flat) and is rebuilt as IVF/HNSW on a background
+    thread once the store passes ANN_THRESHOLD (see target_index_kind).
+
+    All files live in `directory` (DATA_DIR by default); ShardedMemoryStore
+    keeps one of these per time shard, passing `store_size` (the whole
+    store's chunk count) so index thresholds follow the whole store.
+    """
+    def __init__(self, directory: Optional[Path] = None, store_size: Optional[Callable[[], int]] = None):
+        self.dir = Path(directory or DATA_DIR)
+        self.store_size = store_size
+        self.index_path = self.dir / INDEX_PATH.name
+        self._cols = {name: VectorBuffer(None, dtype=dtype) for name, dtype in HOT_COLUMNS.items()}
+        self._urls, self._url_ids = [], {} # Interned per page, not per chunk
+        self._domains, self._domain_ids = [], {}
+        self._url_domain_ids = [] # url_id -> domain_id
+        self._parents, self._parent_ids = [], {}
+        self._url_live = {} # url_id -> live chunk count
+        self.live_count = 0
+        self._next_vid = 0
+        self._tombstones = set() # vids deleted but still inside an HNSW index
+        self._base = np.zeros((0, EMBEDDING_DIM), dtype='float32') # Snapshot rows (memmap)
+        self._seg = np.zeros((0, EMBEDDING_DIM), dtype='float32') # Rows flushed to vectors.seg (memmap)
+        self._seg_start = 0 # First row of vectors.seg not already in the snapshot
+        self._tail = VectorBuffer() # Rows not yet flushed
+        self.index = create_index("flat", storage=target_index(0)[1])
+        self.lexical = BM25Index()
+        self._log_rows = 0 # Adds and deletes since the last compaction
+        self._db = None
+        self._lock = threading.RLock()
+        self._rebuild_thread = None
+        self._removed_during_rebuild = []
+        self.generation = 0 # Bumped on every change that can alter search results
+        self.last_update = None # ms of the last add or delete
         self.load()
+        self.maybe_rebuild_index()
+
+    @property
+    def vector_count(self) -> int:
+        return len(self._base) + len(self._seg) + len(self._tail)
+
+    def _col(self, name: str) -> np.ndarray:
+        return self._cols[name].view()
+
+    def get_vectors(self, positions) -> np.ndarray:
+        """Gather full-precision rows by index position from the snapshot, segment and tail."""
+        positions = np.asarray(positions, dtype='int64')
+        out = np.empty((len(positions), EMBEDDING_DIM), dtype='float32')
+        seg_start = len(self._base)
+        tail_start = seg_start + len(self._seg)
+        in_base = positions < seg_start
+        in_tail = positions >= tail_start
+        in_seg = ~in_base & ~in_tail
+        out[in_base] = self._base[positions[in_base]]
+        out[in_seg] = self._seg[positions[in_seg] - seg_start]
+        out[in_tail] = self._tail.view()[positions[in_tail] - tail_start]
+        return out
+
+    def _map_segment(self, rows: Optional[int] = None):
+        """Map the rows of vectors.seg that follow the snapshot (the first `rows` rows of the file at most)."""
+        path = self.dir / VECTOR_SEGMENT_FILE
+        file_rows = path.stat().st_size // (4 * EMBEDDING_DIM) if path.exists() else 0
+        rows = file_rows if rows is None else min(rows, file_rows)
+        if rows <= self._seg_start:
+            self._seg = np.zeros((0, EMBEDDING_DIM), dtype='float32')
+            return
+        self._seg = np.memmap(path, dtype='float32', mode='r', shape=(rows, EMBEDDING_DIM))[self._seg_start:]
+
+    def _rows_of(self, vids) -> np.ndarray:
+        """Row positions of live vids; unknown or deleted vids map to -1."""
+        vids = np.asarray(vids, dtype='int64')
+        all_vids = self._col('vid')
+        if not len(all_vids): return np.full(len(vids), -1, dtype='int64')
+        rows = np.minimum(np.searchsorted(all_vids, vids), len(all_vids) - 1)
+        found = (all_vids[rows] == vids) & self._col('alive')[rows]
+        return np.where(found, rows, -1)
+
+    def _intern(self, value: str, values: List[str], ids: Dict[str, int]) -> int:
+        idx = ids.get(value)
+        if idx is None:
+            idx = ids[value] = len(values)
+            values.append(value)
+        return idx
+
+    def _intern_url(self, url: str) -> int:
+        url_id = self._intern(url, self._urls, self._url_ids)
+        if url_id == len(self._url_domain_ids):
+            self._url_domain_ids.append(self._intern(url_domain(url), self._domains, self._domain_ids))
+        return url_id
+
+    def _append_columns(self, metas: List[Dict[str, Any]]):
+        url_ids = [self._intern_url(m['url']) for m in metas]
+        for url_id in url_ids: self._url_live[url_id] = self._url_live.get(url_id, 0) + 1
+        self._cols['vid'].append([m['vid'] for m in metas])
+        self._cols['timestamp'].append([m['timestamp'] for m in metas])
+        self._cols['engagement'].append([m['engagement_score'] for m in metas])
+        self._cols['chunk_index'].append([m['chunk_index'] for m in metas])
+        self._cols['url_id'].append(url_ids)
+        self._cols['domain_id'].append([self._url_domain_ids[u] for u in url_ids])
+        self._cols['parent_idx'].append([self._intern(m['parent_id'], self._parents, self._parent_ids) for m in metas])
+        self._cols['alive'].append(np.ones(len(metas), dtype=bool))
+        self.live_count += len(metas)
+        if metas: self._next_vid = max(self._next_vid, int(metas[-1]['vid']) + 1)
+
+    # ------------------------------------------------------------------ load
+
+    def _open_db(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.dir / CHUNK_DB_FILE), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.create_function("url_domain", 1, url_domain, deterministic=True)
+        db.executescript(CHUNK_SCHEMA)
+        if db.execute("SELECT 1 FROM pages LIMIT 1").fetchone() is None:
+            # Stores written before the pages table existed
+            db.execute("""
+                INSERT OR IGNORE INTO pages
+                SELECT parent_id, url, url_domain(url), title, summary, engagement_score, timestamp, total_chunks
+                FROM chunks WHERE vid IN (SELECT MIN(vid) FROM chunks GROUP BY parent_id)
+            """)
+        return db
 
     def load(self):
-        if DATA_DIR.exists():
+        snapshot = self.dir / "vectors.npy"
+        if snapshot.exists() and np.load(snapshot, mmap_mode='r').shape[1] != EMBEDDING_DIM:
+            # Appending another model's vectors would corrupt the segments; refuse to start
+            raise RuntimeError(f"{snapshot} does not hold {EMBEDDING_DIM}-dim vectors from {MODEL_DIR or MODEL_NAME}; "
+                               f"run bulk_import.py --reembed")
+        try:
+            finish_snapshot(self.dir)
+            self.last_update = written_ms(self.dir)
+            self._db = self._open_db()
+            self._migrate_json()
+            if (self.dir / TOMBSTONES_FILE).exists():
+                with open(self.dir / TOMBSTONES_FILE, "r") as f: self._tombstones = set(json.load(f))
+            base_vids = np.zeros(0, dtype='int64')
+            if (self.dir / "vectors.npy").exists() and (self.dir / VID_SNAPSHOT_FILE).exists():
+                self._base = np.load(self.dir / "vectors.npy", mmap_mode='r')
+                base_vids = np.load(self.dir / VID_SNAPSHOT_FILE)
+                if len(self._base) != len(base_vids):
+                    raise RuntimeError(f"vectors.npy has {len(self._base)} rows but {VID_SNAPSHOT_FILE} "
+                                       f"{len(base_vids)}; the snapshot is inconsistent")
+            seg_vids, torn = self._read_segments(base_vids)
+            row_vids = np.concatenate([base_vids, seg_vids])
+            self._load_columns(row_vids)
+            self.index = self._load_index(base_vids)
+            if len(seg_vids):
+                rows = self._rows_of(seg_vids)
+                live = rows >= 0
+                if live.any(): self.index.add_with_ids(self.get_vectors(rows[live]), seg_vids[live])
+            self._load_lexical()
+            self._log_rows = len(seg_vids)
+            logger.info(f"Loaded store with {self.live_count} items ({self._log_rows} appended since snapshot)")
+            if torn:
+                logger.warning("Discarding torn tail of vector segment")
+                self.compact()
+        except Exception as e:
+            # Serving, or appending to, a store read wrongly would pair chunks with the wrong vectors
+            logger.error(f"Load failed: {e}")
+            if self._db is not None: self._db.close()
+            raise
+
+    def _read_segments(self, base_vids: np.ndarray):
+        """Map rows appended since the last compaction; returns their vids and whether the files disagree."""
+        seg_path, vid_path = self.dir / VECTOR_SEGMENT_FILE, self.dir / VID_SEGMENT_FILE
+        self._seg_start = 0
+        if not seg_path.exists() or not vid_path.exists():
+            self._map_segment(0)
+            return np.zeros(0, dtype='int64'), False
+        vec_rows = seg_path.stat().st_size / (4 * EMBEDDING_DIM)
+        vids = np.fromfile(vid_path, dtype='int64')
+        # A crash mid-flush can leave the two files at different lengths
+        rows = min(int(vec_rows), len(vids))
+        torn = rows != vec_rows or rows != len(vids)
+        vids = vids[:rows]
+        # Crash between snapshot rename and truncation: rows already in the snapshot
+        if len(base_vids):
+            self._seg_start = int(np.searchsorted(vids, base_vids[-1], side='right'))
+        self._map_segment(rows)
+        return vids[self._seg_start:], torn
+
+    def _load_columns(self, row_vids: np.ndarray):
+        """Fill the hot columns from chunks.db, aligned with the vector rows."""
+        n = len(row_vids)
+        self._cols['vid'].replace(row_vids)
+        self._cols['alive'].replace(np.zeros(n, dtype=bool))
+        for name in ("timestamp", "engagement", "chunk_index", "url_id", "domain_id", "parent_idx"):
+            self._cols[name].replace(np.zeros(n, dtype=HOT_COLUMNS[name]))
+        if n: self._next_vid = int(row_vids[-1]) + 1
+
+        orphans = []
+        cursor = self._db.execute(
+            "SELECT vid, url, parent_id, timestamp, engagement_score, chunk_index FROM chunks ORDER BY vid")
+        while True:
+            batch = cursor.fetchmany(65536)
+            if not batch: break
+            vids = np.fromiter((r[0] for r in batch), dtype='int64', count=len(batch))
+            rows = np.minimum(np.searchsorted(row_vids, vids), max(n - 1, 0))
+            ok = (row_vids[rows] == vids) if n else np.zeros(len(vids), dtype=bool)
+            for r, row, good in zip(batch, rows, ok):
+                if not good:
+                    orphans.append(r[0])
+                    continue
+                url_id = self._intern_url(r[1])
+                self._url_live[url_id] = self._url_live.get(url_id, 0) + 1
+                self._col('url_id')[row] = url_id
+                self._col('domain_id')[row] = self._url_domain_ids[url_id]
+                self._col('parent_idx')[row] = self._intern(r[2], self._parents, self._parent_ids)
+                self._col('timestamp')[row] = r[3] or 0
+                self._col('engagement')[row] = r[4] or 0.0
+                self._col('chunk_index')[row] = r[5] or 0
+                self._col('alive')[row] = True
+        self.live_count = int(self._col('alive').sum())
+        if orphans:
+            # Chunk rows whose vectors never reached disk
+            logger.warning(f"Dropping {len(orphans)} chunks without vectors")
+            self._db.executemany("DELETE FROM chunks WHERE vid = ?", [(v,) for v in orphans])
+
+    def _load_index(self, base_vids: np.ndarray):
+        """Read the persisted index, rebuilding it from the snapshot if stale."""
+        if self.index_path.exists():
+            index = faiss.read_index(str(self.index_path))
+            if (index_has_ids(index) and index.ntotal == len(base_vids) + len(self._tombstones)
+                    and index.metric_type == faiss.METRIC_INNER_PRODUCT):
+                # Snapshot rows deleted since the index was written
+                dead = base_vids[~self._col('alive')[: len(base_vids)]]
+                if len(dead):
+                    if index_supports_remove(index): index.remove_ids(dead)
+                    else: self._tombstones.update(int(v) for v in dead)
+                return index
+            logger.warning(f"Index ({index.ntotal} vectors, metric {index.metric_type}) does not match the snapshot "
+                           f"({len(base_vids)} rows, inner product); rebuilding")
+        # Flat is always valid; maybe_rebuild_index() upgrades it in the background
+        self._tombstones = set()
+        index = create_index("flat", storage=target_index(0)[1])
+        alive = self._col('alive')
+        # Blocks keep the temporary copy out of the memmap small
+        for start in range(0, len(self._base), 65536):
+            stop = start + 65536
+            keep = alive[start:stop]
+            index.add_with_ids(np.ascontiguousarray(self._base[start:stop][keep]), base_vids[start:stop][keep])
+        return index
+
+    def _load_lexical(self):
+        """Read the keyword index and bring it up to date with chunks.db."""
+        path = self.dir / LEXICAL_INDEX_FILE
+        if path.exists():
             try:
-                if (DATA_DIR / "ids.json").exists():
-                    with open(DATA_DIR / "ids.json", "r") as f: self.ids = json.load(f)
-                if (DATA_DIR / "metadata.json").exists():
-                    with open(DATA_DIR / "metadata.json", "r") as f: self.metadata = json.load(f)
-                if (DATA_DIR / "vectors.npy").exists():
-                    self.vectors = list(np.load(DATA_DIR / "vectors.npy"))
-                    # Rebuild index
-                    self.index = faiss.IndexFlatL2(EMBEDDING_DIM)
-                    if self.vectors:
-                        matrix = np.array(self.vectors).astype('float32')
-                        self.index.add(matrix)
-                logger.info(f"Loaded store with {len(self.ids)} items")
+                self.lexical = BM25Index.load(path)
             except Exception as e:
-                logger.error(f"Load failed: {e}")
+                logger.warning(f"Keyword index unreadable, rebuilding: {e}")
+                self.lexical = BM25Index()
+        indexed = self.lexical.doc_vids()
+        self.lexical.remove(indexed[self._rows_of(indexed) < 0])
+        # Chunks added since the index was written (all of them for older stores)
+        cursor = self._db.execute(
+            "SELECT vid, title, content FROM chunks WHERE vid > ? ORDER BY vid", (self.lexical.max_vid,))
+        added = 0
+        while True:
+            batch = cursor.fetchmany(4096)
+            if not batch: break
+            for vid, title, content in batch: self.lexical.add(vid, f"{title or ''} {content or ''}")
+            added += len(batch)
+        if added > COMPACT_MIN_ROWS: logger.info(f"Indexed {added} chunks for keyword search")
+
+    def _migrate_json(self):
+        """Import a store written before chunks.db existed (metadata.json + metadata.log)."""
+        if not (self.dir / "metadata.json").exists(): return
+        if self._db.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is not None: return
+        logger.info("Migrating JSON metadata to chunks.db")
+        ids, metadata = [], {}
+        if (self.dir / "ids.json").exists():
+            with open(self.dir / "ids.json", "r") as f: ids = json.load(f)
+        with open(self.dir / "metadata.json", "r") as f: metadata = json.load(f)
+        vectors = np.zeros((0, EMBEDDING_DIM), dtype='float32')
+        if (self.dir / "vectors.npy").exists():
+            vectors = np.load(self.dir / "vectors.npy")
+        rows = [] # (meta, vector)
+        for row, mem_id in enumerate(ids):
+            meta = metadata[mem_id]
+            meta.setdefault('vid', row)
+            rows.append((meta, vectors[row]))
+
+        seg_path, log_path = self.dir / VECTOR_SEGMENT_FILE, self.dir / METADATA_LOG_FILE
+        if seg_path.exists() and log_path.exists():
+            seg = np.fromfile(seg_path, dtype='float32')
+            seg = seg[: len(seg) - len(seg) % EMBEDDING_DIM].reshape(-1, EMBEDDING_DIM)
+            with open(log_path, "r", encoding="utf-8") as f:
+                lines = f.read().split("\n")[:-1]
+            cursor = 0
+            for line in lines:
+                try: rec = json.loads(line)
+                except json.JSONDecodeError: break
+                if rec.get('op') == 'delete':
+                    gone = set(rec['ids'])
+                    rows = [r for r in rows if r[0]['id'] not in gone]
+                    continue
+                if cursor >= len(seg): break
+                if rec['id'] not in metadata: # Otherwise already folded into the snapshot
+                    rec.setdefault('vid', max((m['vid'] for m, _ in rows), default=-1) + 1)
+                    rows.append((rec, seg[cursor]))
+                cursor += 1
+
+        rows.sort(key=lambda r: r[0]['vid'])
+        np.save(self.dir / "vectors.npy", np.array([v for _, v in rows], dtype='float32').reshape(-1, EMBEDDING_DIM))
+        np.save(self.dir / VID_SNAPSHOT_FILE, np.array([m['vid'] for m, _ in rows], dtype='int64'))
+        self._db.execute("BEGIN")
+        self._db.executemany(
+            f"INSERT OR REPLACE INTO chunks ({', '.join(CHUNK_FIELDS)}) VALUES ({', '.join('?' * len(CHUNK_FIELDS))})",
+            [tuple(m.get(f) for f in CHUNK_FIELDS) for m, _ in rows],
+        )
+        self._db.execute("COMMIT")
+        for name in ("ids.json", "metadata.json", METADATA_LOG_FILE, VECTOR_SEGMENT_FILE,
+                     TOMBSTONES_FILE, self.index_path.name):
+            (self.dir / name).unlink(missing_ok=True)
+        logger.info(f"Migrated {len(rows)} chunks")
+
+    # ----------------------------------------------------------- persistence
+
+    def _begin(self):
+        if not self._db.in_transaction: self._db.execute("BEGIN")
 
     def save(self):
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
-        with open(DATA_DIR / "ids.json", "w") as f: json.dump(self.ids, f)
-        with open(DATA_DIR / "metadata.json", "w") as f: json.dump(self.metadata, f)
-        np.save(DATA_DIR / "vectors.npy", np.array(self.vectors).astype('float32'))
+        """Write a full snapshot atomically. Prefer flush() for incremental writes."""
+        self.compact()
+
+    def _save(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        live = np.flatnonzero(self._col('alive'))
+
+        # Stream live rows into a new file without materialising the store in RAM
+        path = self.dir / "vectors.npy"
+        tmp = path.with_name(path.name + ".tmp")
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype='float32', shape=(len(live), EMBEDDING_DIM))
+        for start in range(0, len(live), 65536):
+            out[start : start + 65536] = self.get_vectors(live[start : start + 65536])
+        out.flush()
+        del out
+        # Windows cannot replace a file that is still mapped
+        self._base = np.zeros((0, EMBEDDING_DIM), dtype='float32')
+        write_snapshot(self.dir, tmp, self._col('vid')[live])
+        self._base = np.load(path, mmap_mode='r')
+        self._seg = np.zeros((0, EMBEDDING_DIM), dtype='float32')
+        self._seg_start = 0
+        self._tail.clear()
+
+        # Deleted rows are gone from disk now, so row positions shift
+        for name, col in self._cols.items():
+            col.replace(col.view()[live])
+
+        index_tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        faiss.write_index(self.index, str(index_tmp))
+        os.replace(index_tmp, self.index_path)
+        _atomic_write(self.dir / TOMBSTONES_FILE, lambda f: f.write(json.dumps(sorted(self._tombstones)).encode()))
+        _atomic_write(self.dir / LEXICAL_INDEX_FILE, self.lexical.save)
+        if self._db.in_transaction: self._db.execute("COMMIT")
+
+    def compact(self):
+        """Fold appended rows into a fresh snapshot and truncate the segments."""
+        with self._lock:
+            self._save()
+            for name in (VECTOR_SEGMENT_FILE, VID_SEGMENT_FILE):
+                (self.dir / name).unlink(missing_ok=True)
+            self._log_rows = 0
+
+    @metrics.timer("persist")
+    def flush(self):
+        """Persist buffered changes, compacting once they outgrow the snapshot."""
+        with self._lock:
+            if len(self._tail):
+                vids = self._col('vid')[-len(self._tail):]
+                # Unmapped while appending (Windows); remapped below, after which the tail is on disk
+                self._seg = np.zeros((0, EMBEDDING_DIM), dtype='float32')
+                # Vectors first: on load a chunk row without its vector is dropped
+                with open(self.dir / VECTOR_SEGMENT_FILE, "ab") as f: f.write(self._tail.view().tobytes())
+                with open(self.dir / VID_SEGMENT_FILE, "ab") as f: f.write(vids.tobytes())
+                self._map_segment()
+                self._tail.clear()
+            if self._db.in_transaction: self._db.execute("COMMIT")
+
+            # Doubling threshold keeps compaction amortised O(1) per chunk
+            if self._log_rows >= max(COMPACT_MIN_ROWS, self.live_count - self._log_rows):
+                self.compact()
+        self.maybe_rebuild_index()
+
+    # ----------------------------------------------------------------- index
+
+    def maybe_rebuild_index(self):
+        """Start a background rebuild if the store has outgrown its index type."""
+        with self._lock:
+            if self._rebuild_thread is not None: return
+            n = self.live_count
+            total = self.store_size() if self.store_size is not None else n
+            if not index_needs_rebuild(self.index, n, len(self._tombstones), total): return
+            self._removed_during_rebuild = []
+            self._rebuild_thread = threading.Thread(
+                target=self._rebuild_index, args=target_index(n, total),
+                name="memory-index-rebuild", daemon=True,
+            )
+            self._rebuild_thread.start()
+
+    def _live_vectors(self, vids: np.ndarray):
+        """Vectors for the given vids that are still live, with those vids."""
+        vids = np.asarray(vids, dtype='int64')
+        rows = self._rows_of(vids)
+        live = rows >= 0
+        return self.get_vectors(rows[live]), vids[live]
+
+    def _rebuild_index(self, kind: str, storage: str = "float32"):
+        """Build a new index off the request path, then swap it in under the lock."""
+        start_time = time.perf_counter()
+        try:
+            # Work by vid: compaction may move rows while we build
+            with self._lock:
+                vids = self._col('vid')[self._col('alive')].copy()
+                last_vid = self._next_vid
+            train = None
+            train_rows = ivf_nlist(len(vids)) * IVF_TRAIN_PER_LIST if kind.startswith("ivf") else 0
+            if storage in ("int8", "pq"): train_rows = max(train_rows, QUANTIZE_TRAIN_ROWS)
+            if train_rows:
+                rng = np.random.default_rng(0)
+                sample = np.sort(rng.choice(vids, min(len(vids), train_rows), replace=False))
+                with self._lock: train, _ = self._live_vectors(sample)
+            index = create_index(kind, len(vids), train, storage)
+            for start in range(0, len(vids), 65536):
+                with self._lock: block, block_vids = self._live_vectors(vids[start : start + 65536])
+                if len(block_vids): index.add_with_ids(block, block_vids)
+
+            with self._lock:
+                # Rows that arrived while we were building
+                all_vids = self._col('vid')
+                new_vids = all_vids[(all_vids >= last_vid) & self._col('alive')]
+                if len(new_vids): index.add_with_ids(*self._live_vectors(new_vids))
+                tombstones = set()
+                if self._removed_during_rebuild:
+                    removed = np.asarray(self._removed_during_rebuild, dtype='int64')
+                    if index_supports_remove(index): index.remove_ids(removed)
+                    else: tombstones = set(self._removed_during_rebuild)
+                self.index = index
+                self._tombstones = tombstones
+                self.generation += 1
+                self.compact() # Persist the new index alongside a matching snapshot
+            logger.info(f"Rebuilt index as {kind} ({storage}) over {len(vids)} vectors "
+                        f"in {time.perf_counter() - start_time:.1f}s")
+        except Exception as e:
+            logger.error(f"Index rebuild failed: {e}")
+        finally:
+            self._rebuild_thread = None
+
+    # ---------------------------------------------------------------- writes
 
     def add(self, vector: np.ndarray, meta: Dict[str, Any]):
-        self.vectors.append(vector)
-        self.ids.append(meta['id'])
-        self.metadata[meta['id']] = meta
-        
-        v = np.array([vector]).astype('float32')
-        self.index.add(v)
-        self.save()
+        self.add_batch(np.asarray(vector)[None, :], [meta])
 
-    def search(self, query_vec: np.ndarray, k: int) -> List[Dict[str, Any]]:
-        if self.index.ntotal == 0: return []
-        
-        q = np.array([query_vec]).astype('float32')
-        D, I = self.index.search(q, k)
-        
+    @metrics.timer("index_add")
+    def add_batch(self, vectors: np.ndarray, metas: List[Dict[str, Any]], vids: Optional[List[int]] = None):
+        """Add several chunks with one index call. Call flush() to persist.
+
+        Vids continue from the store's last one unless given (ascending and
+        past it; ShardedMemoryStore allocates them across shards).
+        """
+        if len(metas) == 0: return
+        matrix = np.array(vectors, dtype='float32').reshape(-1, EMBEDDING_DIM)
+        # Unit length, so inner product is cosine similarity
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            if vids is None: vids = range(self._next_vid, self._next_vid + len(metas))
+            elif vids[0] < self._next_vid: raise ValueError(f"vid {vids[0]} is not past the last one")
+            for meta, vid in zip(metas, vids): meta['vid'] = int(vid)
+            self._next_vid = int(vids[-1]) + 1
+            self._begin()
+            self._db.executemany(
+                f"INSERT INTO chunks ({', '.join(CHUNK_FIELDS)}) VALUES ({', '.join('?' * len(CHUNK_FIELDS))})",
+                [tuple(m.get(f) for f in CHUNK_FIELDS) for m in metas],
+            )
+            firsts = {}
+            for m in metas: firsts.setdefault(m['parent_id'], m)
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO pages ({', '.join(PAGE_FIELDS)}) VALUES ({', '.join('?' * len(PAGE_FIELDS))})",
+                [tuple(url_domain(m['url']) if f == "domain" else m.get(f) for f in PAGE_FIELDS) for m in firsts.values()],
+            )
+            self._append_columns(metas)
+            for m in metas: self.lexical.add(m['vid'], f"{m.get('title') or ''} {m.get('content') or ''}")
+            self._tail.append(matrix)
+            self._log_rows += len(metas)
+            self.generation += 1
+            self.last_update = int(time.time() * 1000)
+            self.index.add_with_ids(matrix, np.asarray([m['vid'] for m in metas], dtype='int64'))
+
+    def delete(self, memory_id: str) -> List[str]:
+        """Delete a chunk by its ID, or every chunk of a page by parent ID. Call flush() to persist."""
+        with self._lock:
+            rows = self._db.execute("SELECT vid, id FROM chunks WHERE parent_id = ?", (memory_id,)).fetchall()
+            if not rows:
+                rows = self._db.execute("SELECT vid, id FROM chunks WHERE id = ?", (memory_id,)).fetchall()
+            if not rows: return []
+            self._remove([r[0] for r in rows])
+            return [r[1] for r in rows]
+
+    def _remove(self, vids: List[int]):
+        rows = self._rows_of(vids)
+        rows = rows[rows >= 0]
+        vids = self._col('vid')[rows]
+        if not len(vids): return
+        self._col('alive')[rows] = False
+        self.live_count -= len(rows)
+        for url_id in self._col('url_id')[rows]:
+            self._url_live[url_id] -= 1
+            if not self._url_live[url_id]: del self._url_live[url_id]
+
+        self._begin()
+        self._db.executemany("DELETE FROM chunks WHERE vid = ?", [(int(v),) for v in vids])
+        parents = {self._parents[p] for p in self._col('parent_idx')[rows]}
+        self._db.executemany(
+            "DELETE FROM pages WHERE parent_id = ? AND NOT EXISTS (SELECT 1 FROM chunks WHERE parent_id = ?)",
+            [(p, p) for p in parents],
+        )
+        self.lexical.remove(vids)
+        if index_supports_remove(self.index):
+            self.index.remove_ids(vids)
+        else:
+            self._tombstones.update(int(v) for v in vids)
+        if self._rebuild_thread is not None: self._removed_during_rebuild.extend(int(v) for v in vids)
+        self._log_rows += len(vids)
+        self.generation += 1
+        self.last_update = int(time.time() * 1000)
+
+    # ----------------------------------------------------------------- reads
+
+    def get_metas(self, vids) -> List[Dict[str, Any]]:
+        """Full chunk metadata (including text) for the given vids, in order."""
+        vids = [int(v) for v in vids]
+        if not vids: return []
+        with self._lock:
+            found = {}
+            for start in range(0, len(vids), 500): # SQLite variable limit
+                part = vids[start : start + 500]
+                cursor = self._db.execute(
+                    f"SELECT {', '.join(CHUNK_FIELDS)} FROM chunks WHERE vid IN ({', '.join('?' * len(part))})", part)
+                for row in cursor: found[row[0]] = dict(zip(CHUNK_FIELDS, row))
+        return [found[v] for v in vids if v in found]
+
+    def find_page(self, url: str) -> Optional[Dict[str, Any]]:
+        """First chunk of the stored version of a URL, if any."""
+        with self._lock:
+            row = self._db.execute(FIND_PAGE_SQL, (url,)).fetchone()
+        return dict(zip(CHUNK_FIELDS, row)) if row else None
+
+    def _filter_rows(self, since: Optional[int] = None, until: Optional[int] = None,
+                     domain: Optional[str] = None, min_engagement: Optional[float] = None) -> np.ndarray:
+        """Positions of live rows matching every given filter, ascending."""
+        mask = self._col('alive').copy()
+        if since is not None: mask &= self._col('timestamp') >= since
+        if until is not None: mask &= self._col('timestamp') <= until
+        if min_engagement is not None: mask &= self._col('engagement') >= min_engagement
+        if domain is not None:
+            domain_id = self._domain_ids.get(normalize_domain(domain))
+            if domain_id is None: return np.zeros(0, dtype='int64')
+            mask &= self._col('domain_id') == domain_id
+        return np.flatnonzero(mask)
+
+    def _exact_search(self, rows: np.ndarray, queries: np.ndarray, k: int):
+        """Brute-force nearest neighbours among the given rows, in blocks; (vids, sims) per query."""
+        sims = np.empty((len(queries), len(rows)), dtype='float32')
+        for start in range(0, len(rows), 8192):
+            sims[:, start : start + 8192] = queries @ self.get_vectors(rows[start : start + 8192]).T
         results = []
-        for i, idx in enumerate(I[0]):
-            if idx != -1 and idx < len(self.ids):
-                mem_id = self.ids[idx]
-                if mem_id in self.metadata:
-                    item = self.metadata[mem_id].copy()
-                    item['similarity'] = float(1.0 - D[0][i]) # Approx
-                    results.append(item)
+        for row_sims in sims:
+            top = np.arange(len(rows)) if len(rows) <= k else np.argpartition(-row_sims, k)[:k]
+            top = top[np.argsort(-row_sims[top], kind='stable')]
+            results.append((self._col('vid')[rows[top]], row_sims[top]))
         return results
-        
+
+    def _dense_search(self, queries: np.ndarray, k: int, nprobe: Optional[int], ef_search: Optional[int],
+                      rows: Optional[np.ndarray] = None):
+        """Nearest live vids and their scores, best first, per query row, optionally only among `rows`.
+
+        Quantized indexes only approximate the vectors: they are asked for
+        RESCORE_FACTOR times as many candidates, re-ranked by exact cosine
+        against the full-precision vectors on disk.
+        """
+        if rows is not None and len(rows) <= FILTER_EXACT_ROWS:
+            return self._exact_search(rows, queries, k)
+        if RESCORE_FACTOR <= 1 or index_storage(self.index) == "float32":
+            return self._index_search(queries, k, nprobe, ef_search, rows)
+        results = []
+        for q, (vids, _) in zip(queries, self._index_search(queries, k * RESCORE_FACTOR, nprobe, ef_search, rows)):
+            sims = self.get_vectors(self._rows_of(vids)) @ q
+            order = np.argsort(-sims, kind='stable')[:k]
+            results.append((vids[order], sims[order]))
+        return results
+
+    def _index_search(self, queries: np.ndarray, k: int, nprobe: Optional[int], ef_search: Optional[int],
+                      rows: Optional[np.ndarray] = None):
+        if rows is None and self._tombstones:
+            # Tombstoned vids are still in the graph; a bitmap of live rows skips them while searching
+            rows = np.flatnonzero(self._col('alive'))
+        if rows is None:
+            D, I = self.index.search(queries, k, params=search_params(self.index, nprobe, ef_search))
+            results = []
+            for scores, vids in zip(D, I):
+                keep = self._rows_of(vids) >= 0 # Drops missing (-1) ids and any deleted mid-search
+                results.append((vids[keep], scores[keep]))
+            return results
+        # Bit per vid; tombstoned and filtered-out vids are simply never set
+        bitmap = np.zeros(self._next_vid, dtype=bool)
+        bitmap[self._col('vid')[rows]] = True
+        packed = np.packbits(bitmap, bitorder='little')
+        sel = faiss.IDSelectorBitmap(len(packed), faiss.swig_ptr(packed)) # Length in bytes
+        D, I = self.index.search(queries, k, params=search_params(self.index, nprobe, ef_search, sel))
+        results = []
+        for q, scores, vids in zip(queries, D, I):
+            found = vids >= 0
+            if found.sum() < min(k, len(rows)):
+                # Selective filters can leave probed IVF lists / the HNSW walk short of k
+                results += self._exact_search(rows, q[None, :], k)
+            else:
+                results.append((vids[found], scores[found]))
+        return results
+
+    def search(self, query_vec: np.ndarray, k: int, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None, query_text: Optional[str] = None,
+               min_score: Optional[float] = None, rerank: bool = False) -> List[Dict[str, Any]]:
+        """Best k chunks for a query, each with its cosine `similarity`.
+
+        Candidates come from the vector index, plus BM25 when `query_text`
+        is given (merged by reciprocal rank fusion). `filters` takes since /
+        until / domain / min_engagement. Candidates under `min_score` cosine
+        are dropped. With `rerank`, a larger candidate set is reordered by
+        relevance, engagement and recency (rerank_scores) and diversified
+        with MMR, keeping one chunk per page.
+        """
+        query = dict(k=k, nprobe=nprobe, ef_search=ef_search, filters=filters, query_text=query_text,
+                     min_score=min_score)
+        return self.search_batch(np.asarray(query_vec)[None, :], [query], rerank=rerank)[0]
+
+    def search_batch(self, query_vecs: np.ndarray, queries: List[Dict[str, Any]],
+                     rerank: bool = False) -> List[List[Dict[str, Any]]]:
+        """search() for several queries at once; `queries[i]` holds the search() arguments for row i.
+
+        Queries with the same filters and index parameters share one
+        multi-row index search. Candidate vectors and chunk metadata are read
+        once for the whole batch; re-ranking and MMR stay per query.
+        """
+        return search_stores([(self, list(range(len(queries))))], query_vecs, queries, rerank)
+
+    def keyword_stats(self, texts: Dict[int, str]) -> Dict[int, Dict[str, Any]]:
+        """BM25 corpus statistics for each query text (see BM25Index.stats)."""
+        with self._lock:
+            return {i: self.lexical.stats(text) for i, text in texts.items()}
+
+    def search_candidates(self, Q: np.ndarray, queries: List[Dict[str, Any]], fetches: List[int],
+                          stats: Optional[List[Optional[Dict[str, Any]]]] = None):
+        """Dense and keyword candidates per (normalised) query row: ((vids, sims), (vids, scores) or None).
+
+        Both lists are best first and cut to `fetches[i]`. `stats[i]` are the
+        BM25 statistics to score query i's text with, if not this index's own.
+        """
+        groups = {}
+        for i, q in enumerate(queries):
+            filters = q.get('filters')
+            key = (tuple(sorted(filters.items())) if filters else None, q.get('nprobe'), q.get('ef_search'))
+            groups.setdefault(key, []).append(i)
+        candidates = [None] * len(queries)
+        with self._lock:
+            for (filters, nprobe, ef_search), members in groups.items():
+                rows = self._filter_rows(**dict(filters)) if filters else None
+                allowed = self._col('vid')[rows] if rows is not None else None
+                dense = self._dense_search(Q[members], max(fetches[i] for i in members), nprobe, ef_search, rows)
+                for i, (vids, sims) in zip(members, dense):
+                    text, keyword = queries[i].get('query_text'), None
+                    if text: keyword = self.lexical.search(text, fetches[i], allowed, stats[i] if stats else None)
+                    candidates[i] = ((vids[: fetches[i]], sims[: fetches[i]]), keyword)
+        return candidates
+
+    def rank_features(self, vids: np.ndarray):
+        """For the vids live in this store: a mask of them, and their vectors, engagement, timestamps and URLs."""
+        with self._lock:
+            rows = self._rows_of(vids)
+            found = rows >= 0
+            rows = rows[found]
+            urls = [self._urls[u] for u in self._col('url_id')[rows].tolist()]
+            return found, self.get_vectors(rows), self._col('engagement')[rows], self._col('timestamp')[rows], urls
+
+    def list_pages(self, limit: int, cursor: Optional[str] = None, offset: int = 0, domain: Optional[str] = None,
+                   since: Optional[int] = None, until: Optional[int] = None):
+        """Stored pages, newest first, served from the pages indexes.
+
+        `cursor` is the opaque value returned with the previous page. Returns
+        (pages, next_cursor); next_cursor is None on the last page. Raises
+        ValueError for a malformed cursor.
+        """
+        sql, args = page_query(limit + 1, cursor, offset, domain, since, until)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        pages = [dict(zip(PAGE_FIELDS, row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = f"{pages[-1]['timestamp']}:{pages[-1]['parent_id']}"
+        return pages, next_cursor
+
+    @property
+    def page_count(self) -> int:
+        return len(self._url_live)
+
+    @property
+    def index_vectors(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def tombstone_count(self) -> int:
+        return len(self._tombstones)
+
+    def close(self):
+        """Persist pending changes and release the database and vector files."""
+        with self._lock:
+            self.flush()
+            self._db.close()
+            self._base = np.zeros((0, EMBEDDING_DIM), dtype='float32')
+            self._seg = np.zeros((0, EMBEDDING_DIM), dtype='float32')
+
     def get_stats(self) -> MemoryStats:
         return MemoryStats(
-            total_memories=len(set(m['url'] for m in self.metadata.values())),
-            total_chunks=len(self.metadata),
-            last_update=int(datetime.now().timestamp()*1000)
+            total_memories=self.page_count,
+            total_chunks=self.live_count,
+            last_update=self.last_update
         )
 
+def _merge_ranked(lists, k: int):
+    """Best k (vids, scores) of lists each sorted best first (ties by vid), by a heap merge."""
+    if len(lists) == 1: return lists[0][0][:k], lists[0][1][:k]
+    merged = list(itertools.islice(heapq.merge(*(zip(v.tolist(), s.tolist()) for v, s in lists),
+                                               key=lambda hit: (-hit[1], hit[0])), k))
+    return np.array([v for v, _ in merged], dtype='int64'), np.array([s for _, s in merged], dtype='float32')
+
+def search_stores(parts, query_vecs: np.ndarray, queries: List[Dict[str, Any]], rerank: bool = False,
+                  pool: Optional[ThreadPoolExecutor] = None,
+                  fetches: Optional[List[int]] = None) -> List[List[Dict[str, Any]]]:
+    """SimpleMemoryStore.search_batch over several stores as if they were one.
+
+    `parts` pairs each store with the positions of the queries it serves;
+    vids must be unique across the stores. Every store returns its best
+    dense and keyword candidates, the keyword ones scored with BM25
+    statistics summed over the stores the query reaches, so heap-merging
+    the per-store lists gives the lists one store holding everything would.
+    Fusion, exact re-scoring, re-ranking and MMR then run once over the
+    merged candidates. With a `pool`, the candidate searches run in
+    parallel; the other per-store steps are cheaper than a thread hop.
+
+    MMR keeps one chunk per page, so a re-ranked query whose candidates
+    span fewer than k pages is searched again with twice the candidates
+    (`fetches`, per query), until it has k or the stores run out.
+    """
+    Q = np.array(query_vecs, dtype='float32').reshape(-1, EMBEDDING_DIM)
+    Q /= np.maximum(np.linalg.norm(Q, axis=1, keepdims=True), 1e-12)
+    if fetches is None: fetches = [q['k'] * RERANK_CANDIDATES if rerank else q['k'] for q in queries]
+    parts = [(store, members) for store, members in parts if members and store.live_count]
+    if not parts: return [[] for _ in queries]
+    start = time.perf_counter()
+
+    stats = [None] * len(queries)
+    texts = {i: q['query_text'] for i, q in enumerate(queries) if q.get('query_text')}
+    if len(parts) > 1 and texts:
+        per_store = [store.keyword_stats({i: texts[i] for i in members if i in texts}) for store, members in parts]
+        for i in texts: stats[i] = BM25Index.merge_stats([found[i] for found in per_store if i in found])
+
+    def candidates_of(part):
+        store, members = part
+        return store.search_candidates(Q[members], [queries[i] for i in members], [fetches[i] for i in members],
+                                       [stats[i] for i in members])
+    parallel = pool is not None and len(parts) > 1
+    found = list(pool.map(candidates_of, parts) if parallel else map(candidates_of, parts))
+    dense, keyword = [[] for _ in queries], [[] for _ in queries]
+    returned = [[] for _ in parts] # Candidate vids from each store
+    more = [False] * len(queries) # Some store filled its list, so may hold further candidates
+    for p, ((_, members), lists) in enumerate(zip(parts, found)):
+        for i, (hits, keyword_hits) in zip(members, lists):
+            dense[i].append(hits)
+            returned[p].append(hits[0])
+            more[i] |= len(hits[0]) >= fetches[i]
+            if keyword_hits is not None:
+                keyword[i].append(keyword_hits)
+                returned[p].append(keyword_hits[0])
+                more[i] |= len(keyword_hits[0]) >= fetches[i]
+
+    candidates, empty = [], np.zeros(0, dtype='int64')
+    for i, q in enumerate(queries):
+        vids, fused = _merge_ranked(dense[i], fetches[i])[0] if dense[i] else empty, None
+        if q.get('query_text'):
+            keyword_vids = _merge_ranked(keyword[i], fetches[i])[0] if keyword[i] else empty
+            vids, fused = reciprocal_rank_fusion([vids, keyword_vids])
+            vids, fused = vids[: fetches[i]], fused[: fetches[i]]
+        candidates.append((vids, fused))
+
+    # Exact cosine for every candidate: keyword-only hits have no index score,
+    # and quantized indexes only approximate it
+    all_vids = np.unique(np.concatenate([vids for vids, _ in candidates]))
+    owner = np.full(len(all_vids), -1, dtype='int64') # Position in parts of the store holding each vid
+    vectors = np.zeros((len(all_vids), EMBEDDING_DIM), dtype='float32')
+    engagement = np.zeros(len(all_vids), dtype='float32')
+    timestamps = np.zeros(len(all_vids), dtype='int64')
+    urls = [""] * len(all_vids)
+    for p, (store, _) in enumerate(parts):
+        mine = np.intersect1d(np.concatenate(returned[p]), all_vids) # Those still among the candidates
+        if not len(mine): continue
+        held, vecs, eng, ts, part_urls = store.rank_features(mine)
+        where = np.searchsorted(all_vids, mine[held])
+        owner[where], vectors[where], engagement[where], timestamps[where] = p, vecs, eng, ts
+        for j, url in zip(where.tolist(), part_urls): urls[j] = url
+    url_ids = np.unique(np.array(urls, dtype=object), return_inverse=True)[1] if urls else empty
+    ranked = []
+    for i, (vids, fused) in enumerate(candidates):
+        pos = np.searchsorted(all_vids, vids)
+        held = owner[pos] >= 0 # Deleted since the candidates were found
+        vids, pos = vids[held], pos[held]
+        if fused is not None: fused = fused[held]
+        sims = vectors[pos] @ Q[i]
+        min_score = queries[i].get('min_score')
+        if min_score is not None:
+            keep = sims >= min_score
+            vids, pos, sims = vids[keep], pos[keep], sims[keep]
+            if fused is not None: fused = fused[keep]
+        ranked.append((vids, pos, sims, fused))
+    metrics.observe("memory_stage_seconds", time.perf_counter() - start, stage="search")
+
+    picks = []
+    with metrics.timer("rerank") if rerank else nullcontext():
+        for (vids, pos, sims, fused), q in zip(ranked, queries):
+            if rerank:
+                # RRF scores scaled so a top hit in both lists is 1, comparable to cosine
+                relevance = sims if fused is None else fused * (RRF_K + 1) / 2
+                scores = rerank_scores(relevance, engagement[pos], timestamps[pos])
+                order = mmr_select(scores, vectors[pos], q['k'], groups=url_ids[pos])
+            else:
+                order = np.arange(min(q['k'], len(vids)))
+            picks.append(dict(zip(vids[order].tolist(), sims[order].tolist())))
+    with metrics.timer("fetch"):
+        picked = list(dict.fromkeys(v for p in picks for v in p))
+        owners = owner[np.searchsorted(all_vids, picked)].tolist()
+        wanted = [(store, [v for v, o in zip(picked, owners) if o == p]) for p, (store, _) in enumerate(parts)]
+        metas = {m['vid']: m for store, vids in wanted if vids for m in store.get_metas(vids)}
+    results = [[dict(metas[vid], similarity=float(sim)) for vid, sim in p.items() if vid in metas] for p in picks]
+
+    short = [i for i, q in enumerate(queries) if rerank and more[i] and len(results[i]) < q['k']]
+    if short:
+        again = {i: j for j, i in enumerate(short)}
+        redone = search_stores([(store, [again[i] for i in members if i in again]) for store, members in parts],
+                               Q[short], [queries[i] for i in short], rerank, pool, [fetches[i] * 2 for i in short])
+        for i, hits in zip(short, redone): results[i] = hits
+    return results
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ALL_TIME = (-2 ** 62, 2 ** 62)
+
+def shard_key(timestamp: int, period: Optional[str] = None) -> str:
+    """Name of the shard holding chunks from this time (ms, UTC): "2026-10" by month, "2026-W42" by ISO week."""
+    day = EPOCH + timedelta(milliseconds=int(timestamp))
+    if (period or SHARD_PERIOD) == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return f"{day.year:04d}-{day.month:02d}"
+
+def shard_span(name: str):
+    """(start, stop) ms of the times a shard_key() name covers, or None for other names."""
+    try:
+        if "-W" in name:
+            year, week = name.split("-W")
+            start = datetime.fromisocalendar(int(year), int(week), 1).replace(tzinfo=timezone.utc)
+            stop = start + timedelta(weeks=1)
+        else:
+            start = datetime.strptime(name, "%Y-%m").replace(tzinfo=timezone.utc)
+            stop = (start + timedelta(days=32)).replace(day=1)
+    except ValueError:
+        return None
+    ms = lambda t: int((t - EPOCH) / timedelta(milliseconds=1))
+    return ms(start), ms(stop)
+
+SHARD_INDEX_SCHEMA = """
+-- Vids [start, stop) were allocated to the chunks of `shard`, recorded before
+-- any of them is written, so MAX(stop) is past every vid ever handed out
+CREATE TABLE IF NOT EXISTS vid_runs (
+    start INTEGER PRIMARY KEY,
+    stop INTEGER NOT NULL,
+    shard TEXT NOT NULL
+);
+-- Shards with chunks of a URL, added before the chunks are written; a shard
+-- left without them is dropped after its delete is flushed
+CREATE TABLE IF NOT EXISTS page_shards (
+    url TEXT NOT NULL,
+    shard TEXT NOT NULL,
+    PRIMARY KEY (url, shard)
+) WITHOUT ROWID;
+"""
+
+def stored_vids(directory: Path) -> np.ndarray:
+    """Sorted vids of every vector row in a store's files, deleted ones not yet compacted away included."""
+    parts = []
+    if (directory / VID_SNAPSHOT_FILE).exists(): parts.append(np.load(directory / VID_SNAPSHOT_FILE))
+    segment = directory / VID_SEGMENT_FILE
+    if segment.exists(): parts.append(np.fromfile(segment, dtype='int64', count=segment.stat().st_size // 8))
+    return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype='int64')
+
+class Shard:
+    """One time shard: its directory, and its SimpleMemoryStore while loaded."""
+    def __init__(self, name: str, directory: Path, span):
+        self.name, self.dir = name, directory
+        self.start, self.stop = span
+        self.store = None
+        self.pins = 0 # Operations using the store; it is never unloaded while pinned
+        self.dirty = False # Changes not flushed yet
+        self.last_used = 0.0
+        self.chunks = self.pages = 0 # As of the last unload; the loaded store has live counts
+        self.gone_urls = set() # URLs with chunks deleted since the last flush
+        self.load_lock = threading.Lock()
+
+    @property
+    def live_count(self) -> int:
+        store = self.store
+        return store.live_count if store is not None else self.chunks
+
+    @property
+    def page_count(self) -> int:
+        store = self.store
+        return store.page_count if store is not None else self.pages
+
+class ShardedMemoryStore:
+    """The memory store, split by time into shards of SimpleMemoryStore.
+
+    A chunk goes to the shard of its timestamp (SHARD_PERIOD month or
+    week), in shards/<name> under `directory` (DATA_DIR by default), with
+    its own index, vector files, keyword index and chunks.db. A store
+    written before shards existed (or every chunk, with SHARD_PERIOD none)
+    stays in `directory` itself as a shard spanning all time. Vids are
+    allocated across shards in arrival order, so they are unique and the
+    same as one store would give. shards.db records the runs of vids and
+    the URLs each shard holds, so get_metas() and find_page() go straight
+    to the right shards.
+
+    Searches reach only the shards a query's since/until overlap and fan
+    out over them on a thread pool; search_stores() heap-merges and ranks
+    the results as one store would (BM25 statistics cover the shards
+    reached, so time-bounded keyword scores are relative to that range).
+
+    Only queries bounded in time leave old shards unloaded; one without
+    since/until reaches every shard, so sharding is opt-in (SHARD_PERIOD
+    defaults to none) for clients whose searches are mostly recent.
+
+    Shards load when a search or write reaches them. Past SHARDS_LOADED
+    loaded shards, the least recently used are unloaded once unused for
+    SHARD_IDLE_SECONDS, so searches that keep reaching old shards do not
+    reload them each time, while shards only the occasional old-range
+    query reaches drop out again. Unloaded shards cost only their files;
+    URL lookups, deletes and page listings read their chunks.db directly
+    and load nothing.
+    """
+    def __init__(self, directory: Optional[Path] = None):
+        self.dir = Path(directory or DATA_DIR)
+        self.shards: Dict[str, Shard] = {}
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock() # Writes reach shards in vid order
+        self._pool = ThreadPoolExecutor(max_workers=SHARD_SEARCH_THREADS, thread_name_prefix="memory-shard")
+        self._next_vid = 0
+        self._index = None # shards.db
+        self._run_starts, self._run_stops, self._run_shards = [], [], [] # vid_runs, by start
+        self._retired_generations = 0 # Generations of unloaded stores, so `generation` never goes back
+        self.last_update = None
+        self._open()
+
+    # ------------------------------------------------------------------ shards
+
+    def _open(self):
+        if ((self.dir / CHUNK_DB_FILE).exists() or (self.dir / "metadata.json").exists()
+                or (SHARD_PERIOD == "none" and not (self.dir / SHARDS_DIR).exists())):
+            self.shards[""] = Shard("", self.dir, ALL_TIME)
+        if (self.dir / SHARDS_DIR).exists():
+            for path in sorted((self.dir / SHARDS_DIR).iterdir()):
+                span = shard_span(path.name) if path.is_dir() else None
+                if span is not None: self.shards[path.name] = Shard(path.name, path, span)
+        for shard in self.shards.values():
+            if (shard.dir / CHUNK_DB_FILE).exists():
+                (shard.chunks,), (shard.pages,) = self._read(shard, lambda db: (
+                    db.execute("SELECT COUNT(*) FROM chunks").fetchone(),
+                    db.execute("SELECT COUNT(DISTINCT url) FROM pages").fetchone(),
+                ))
+            updated = written_ms(shard.dir)
+            if updated is not None: self.last_update = max(self.last_update or 0, updated)
+        # Newest first, up to the budget: the shards most writes and searches reach
+        warm = sorted(self.shards.values(), key=lambda s: s.stop, reverse=True)[: max(SHARDS_LOADED, 1)]
+        for shard in warm: self._next_vid = max(self._next_vid, self._load(shard)._next_vid)
+        self._open_index()
+        if self._run_stops: self._next_vid = max(self._next_vid, self._run_stops[-1])
+        logger.info(f"Opened {len(self.shards)} shards ({self.live_count} items), {len(warm)} loaded")
+
+    def _open_index(self):
+        """Open shards.db and read the vid runs, building it from the shards' files the first time."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._index = sqlite3.connect(str(self.dir / SHARD_INDEX_FILE), check_same_thread=False, isolation_level=None)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute("PRAGMA synchronous=NORMAL")
+        self._index.executescript(SHARD_INDEX_SCHEMA)
+        if self._index.execute("PRAGMA user_version").fetchone()[0] == 0:
+            # Shards written before shards.db (a store from before sharding is the root shard)
+            shards = list(self.shards.values())
+            vids = [stored_vids(shard.dir) for shard in shards]
+            owners = np.repeat(np.arange(len(shards)), [len(v) for v in vids])
+            vids = np.concatenate(vids) if vids else np.zeros(0, dtype='int64')
+            order = np.argsort(vids)
+            vids, owners = vids[order], owners[order]
+            # A run ends where the vids skip or the owning shard changes
+            breaks = np.flatnonzero((np.diff(vids) != 1) | (np.diff(owners) != 0)) + 1
+            starts, stops = np.r_[0, breaks], np.r_[breaks, len(vids)]
+            self._index.execute("BEGIN")
+            self._index.executemany("INSERT INTO vid_runs VALUES (?, ?, ?)", [
+                (int(vids[a]), int(vids[b - 1]) + 1, shards[owners[a]].name) for a, b in zip(starts, stops) if a < b])
+            for shard in shards:
+                urls = self._read(shard, lambda db: db.execute("SELECT DISTINCT url FROM chunks").fetchall())
+                self._index.executemany("INSERT OR IGNORE INTO page_shards VALUES (?, ?)",
+                                        [(url, shard.name) for url, in urls])
+            self._index.execute("PRAGMA user_version = 1")
+            self._index.execute("COMMIT")
+        for start, stop, name in self._index.execute("SELECT start, stop, shard FROM vid_runs ORDER BY start"):
+            self._run_starts.append(start)
+            self._run_stops.append(stop)
+            self._run_shards.append(name)
+
+    def _record(self, runs, pages):
+        """Persist (start, stop, shard name) vid allocations, extending the last run where they continue
+        it, and the (url, shard name) pairs of the chunks about to be written."""
+        with self._lock:
+            starts, stops, names = self._run_starts, self._run_stops, self._run_shards
+            self._index.execute("BEGIN")
+            try:
+                for start, stop, name in runs:
+                    if stops and stops[-1] == start and names[-1] == name:
+                        self._index.execute("UPDATE vid_runs SET stop = ? WHERE start = ?", (stop, starts[-1]))
+                        stops[-1] = stop
+                    else:
+                        self._index.execute("INSERT INTO vid_runs VALUES (?, ?, ?)", (start, stop, name))
+                        starts.append(start)
+                        stops.append(stop)
+                        names.append(name)
+                self._index.executemany("INSERT OR IGNORE INTO page_shards VALUES (?, ?)", pages)
+                self._index.execute("COMMIT")
+            except BaseException:
+                self._index.execute("ROLLBACK")
+                raise
+
+    def _load(self, shard: Shard) -> SimpleMemoryStore:
+        with shard.load_lock:
+            if shard.store is None:
+                start = time.perf_counter()
+                store = shard.store = SimpleMemoryStore(shard.dir, lambda: self.live_count)
+                metrics.inc("memory_shard_loads_total")
+                logger.info(f"Loaded shard {shard.name or '(root)'} ({store.live_count} items) "
+                            f"in {time.perf_counter() - start:.2f}s")
+            return shard.store
+
+    def _unload(self, shard: Shard):
+        store = shard.store
+        shard.chunks, shard.pages = store.live_count, store.page_count
+        shard.store = None
+        self._retired_generations += store.generation + 1
+        store.close()
+        logger.info(f"Unloaded shard {shard.name or '(root)'}")
+
+    def _evict(self):
+        """Unload idle shards, least recently used first, down to SHARDS_LOADED; the root store always stays."""
+        with self._lock:
+            loaded = [s for s in self.shards.values() if s.store is not None and s.name]
+            excess = sum(s.store is not None for s in self.shards.values()) - max(SHARDS_LOADED, 1)
+            idle_since = time.monotonic() - SHARD_IDLE_SECONDS
+            for shard in sorted(loaded, key=lambda s: s.last_used)[: max(excess, 0)]:
+                if shard.last_used > idle_since: break
+                if shard.pins or shard.dirty or shard.store._rebuild_thread is not None: continue
+                self._unload(shard)
+
+    @contextmanager
+    def _using(self, shards: List[Shard]):
+        """Load the shards (in parallel) and keep them loaded for the duration."""
+        with self._lock:
+            for shard in shards:
+                shard.pins += 1
+                shard.last_used = time.monotonic()
+        try:
+            cold = [s for s in shards if s.store is None]
+            if len(cold) > 1: list(self._pool.map(self._load, cold))
+            yield [self._load(s) for s in shards]
+        finally:
+            with self._lock:
+                for shard in shards: shard.pins -= 1
+            self._evict()
+
+    def _shard_for(self, timestamp: Optional[int]) -> Shard:
+        name = "" if SHARD_PERIOD == "none" else shard_key(timestamp if timestamp is not None else time.time() * 1000)
+        with self._lock:
+            shard = self.shards.get(name)
+            if shard is None:
+                directory = self.dir / SHARDS_DIR / name if name else self.dir
+                shard = self.shards[name] = Shard(name, directory, shard_span(name) if name else ALL_TIME)
+            return shard
+
+    def _shards_between(self, since: Optional[int] = None, until: Optional[int] = None) -> List[Shard]:
+        """Shards with chunks whose span overlaps [since, until], newest first (the root store leads)."""
+        with self._lock:
+            shards = [s for s in self.shards.values() if s.live_count > 0
+                      and (since is None or s.stop > since) and (until is None or s.start <= until)]
+        return sorted(shards, key=lambda s: s.stop, reverse=True)
+
+    def _read(self, shard: Shard, fn):
+        """fn(connection) on a shard's chunks.db: the loaded store's (kept loaded meanwhile), else its own."""
+        with self._lock:
+            store = shard.store
+            if store is not None: shard.pins += 1
+        if store is None:
+            db = sqlite3.connect(str(shard.dir / CHUNK_DB_FILE))
+            try:
+                return fn(db)
+            finally:
+                db.close()
+        try:
+            with store._lock: return fn(store._db)
+        finally:
+            with self._lock: shard.pins -= 1
+
+    # ------------------------------------------------------------------ stats
+
+    @property
+    def live_count(self) -> int:
+        return sum(s.live_count for s in list(self.shards.values()))
+
+    @property
+    def page_count(self) -> int:
+        return sum(s.page_count for s in list(self.shards.values()))
+
+    @property
+    def generation(self) -> int:
+        """Bumped on every change that can alter search results, including shard loads and unloads."""
+        loaded = [s.store for s in list(self.shards.values()) if s.store is not None]
+        return self._retired_generations + sum(store.generation for store in loaded if store is not None)
+
+    @property
+    def loaded_shards(self) -> List[SimpleMemoryStore]:
+        return [s.store for s in list(self.shards.values()) if s.store is not None]
+
+    @property
+    def index_vectors(self) -> int:
+        return sum(store.index_vectors for store in self.loaded_shards)
+
+    @property
+    def tombstone_count(self) -> int:
+        return sum(store.tombstone_count for store in self.loaded_shards)
+
+    def get_stats(self) -> MemoryStats:
+        return MemoryStats(total_memories=self.page_count, total_chunks=self.live_count, last_update=self.last_update)
+
+    # ----------------------------------------------------------------- writes
+
+    def add_batch(self, vectors: np.ndarray, metas: List[Dict[str, Any]]):
+        """Add chunks to the shards of their timestamps. Call flush() to persist."""
+        if len(metas) == 0: return
+        vectors = np.asarray(vectors, dtype='float32').reshape(-1, EMBEDDING_DIM)
+        owners = [self._shard_for(meta.get('timestamp')) for meta in metas]
+        by_shard = {}
+        for i, shard in enumerate(owners): by_shard.setdefault(shard, []).append(i)
+        with self._write_lock, self._using(list(by_shard)) as stores:
+            first, runs = self._next_vid, []
+            for shard, run in itertools.groupby(owners):
+                start = runs[-1][1] if runs else first
+                runs.append((start, start + len(list(run)), shard.name))
+            # Before any chunk is written: no vid is handed out twice and no URL is missed
+            self._record(runs, {(meta['url'], shard.name) for meta, shard in zip(metas, owners)})
+            self._next_vid += len(metas)
+            for (shard, members), store in zip(by_shard.items(), stores):
+                with store._lock: # With the dirty mark, so flush() cannot clear it in between
+                    store.add_batch(vectors[members], [metas[i] for i in members], vids=[first + i for i in members])
+                    shard.dirty = True
+        self.last_update = int(time.time() * 1000)
+
+    def add(self, vector: np.ndarray, meta: Dict[str, Any]):
+        self.add_batch(np.asarray(vector)[None, :], [meta])
+
+    def delete(self, memory_id: str) -> List[str]:
+        """Delete a chunk by its ID, or every chunk of a page by parent ID. Call flush() to persist."""
+        for shard in self._shards_between():
+            urls = self._read(shard, lambda db: db.execute(
+                "SELECT DISTINCT url FROM chunks WHERE parent_id = ? OR id = ?", (memory_id, memory_id)).fetchall())
+            if not urls: continue
+            with self._using([shard]) as (store,), store._lock:
+                deleted = store.delete(memory_id)
+                if deleted:
+                    shard.dirty = True
+                    shard.gone_urls.update(url for url, in urls)
+                    self.last_update = int(time.time() * 1000)
+                return deleted
+        return []
+
+    def flush(self):
+        """Persist every shard with pending changes, then unload shards over the budget."""
+        gone = {}
+        for shard in list(self.shards.values()):
+            with self._lock:
+                store = shard.store
+                if not shard.dirty or store is None: continue
+                shard.pins += 1 # Not unloaded while its changes are being written
+            try:
+                with store._lock:
+                    store.flush()
+                    shard.dirty = False
+                    if shard.gone_urls: gone[shard], shard.gone_urls = shard.gone_urls, set()
+            finally:
+                with self._lock: shard.pins -= 1
+        if gone:
+            # No adds meanwhile, so a URL found nowhere in the shard cannot be on its way back in
+            with self._write_lock:
+                for shard, urls in gone.items():
+                    kept = self._read(shard, lambda db: {url for url in urls if db.execute(
+                        "SELECT 1 FROM chunks WHERE url = ? LIMIT 1", (url,)).fetchone()})
+                    with self._lock:
+                        self._index.executemany("DELETE FROM page_shards WHERE url = ? AND shard = ?",
+                                                [(url, shard.name) for url in urls - kept])
+        with self._lock:
+            # The store's growth can take shards that were not written past an index threshold
+            for store in self.loaded_shards: store.maybe_rebuild_index()
+        self._evict()
+
+    def compact(self):
+        for store in self.loaded_shards: store.compact()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            for shard in self.shards.values():
+                if shard.store is not None:
+                    if shard.store._rebuild_thread is not None: shard.store._rebuild_thread.join()
+                    self._unload(shard)
+        self._pool.shutdown()
+        self._index.close()
+
+    # ------------------------------------------------------------------ reads
+
+    def find_page(self, url: str) -> Optional[Dict[str, Any]]:
+        """First chunk of the stored version of a URL, if any."""
+        with self._lock:
+            names = [name for name, in self._index.execute("SELECT shard FROM page_shards WHERE url = ?", (url,))]
+            shards = sorted((self.shards[n] for n in names if n in self.shards), key=lambda s: s.stop, reverse=True)
+        for shard in shards:
+            row = self._read(shard, lambda db: db.execute(FIND_PAGE_SQL, (url,)).fetchone())
+            if row is not None: return dict(zip(CHUNK_FIELDS, row))
+        return None
+
+    def get_metas(self, vids) -> List[Dict[str, Any]]:
+        """Full chunk metadata for the given vids, in order, from whichever shards hold them."""
+        vids = [int(v) for v in vids]
+        by_shard = {}
+        with self._lock:
+            for vid in vids:
+                run = bisect.bisect_right(self._run_starts, vid) - 1
+                shard = self.shards.get(self._run_shards[run]) if run >= 0 and vid < self._run_stops[run] else None
+                if shard is not None: by_shard.setdefault(shard, []).append(vid)
+        found = {}
+        for shard, shard_vids in by_shard.items():
+            for start in range(0, len(shard_vids), 500): # SQLite variable limit
+                part = shard_vids[start : start + 500]
+                sql = f"SELECT {', '.join(CHUNK_FIELDS)} FROM chunks WHERE vid IN ({', '.join('?' * len(part))})"
+                for row in self._read(shard, lambda db: db.execute(sql, part).fetchall()):
+                    found[row[0]] = dict(zip(CHUNK_FIELDS, row))
+        return [found[v] for v in vids if v in found]
+
+    def search(self, query_vec: np.ndarray, k: int, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None, query_text: Optional[str] = None,
+               min_score: Optional[float] = None, rerank: bool = False) -> List[Dict[str, Any]]:
+        """SimpleMemoryStore.search across the shards the filters' time range reaches."""
+        query = dict(k=k, nprobe=nprobe, ef_search=ef_search, filters=filters, query_text=query_text,
+                     min_score=min_score)
+        return self.search_batch(np.asarray(query_vec)[None, :], [query], rerank=rerank)[0]
+
+    def search_batch(self, query_vecs: np.ndarray, queries: List[Dict[str, Any]],
+                     rerank: bool = False) -> List[List[Dict[str, Any]]]:
+        """SimpleMemoryStore.search_batch, each query reaching only the shards its time range overlaps."""
+        reach = []
+        for q in queries:
+            filters = q.get('filters') or {}
+            reach.append(self._shards_between(filters.get('since'), filters.get('until')))
+        shards = list({id(s): s for shards in reach for s in shards}.values())
+        with self._using(shards) as stores:
+            parts = [(store, [i for i, r in enumerate(reach) if shard in r]) for shard, store in zip(shards, stores)]
+            return search_stores(parts, query_vecs, queries, rerank, self._pool if SHARD_SEARCH_THREADS > 1 else None)
+
+    def list_pages(self, limit: int, cursor: Optional[str] = None, offset: int = 0, domain: Optional[str] = None,
+                   since: Optional[int] = None, until: Optional[int] = None):
+        """SimpleMemoryStore.list_pages over the shards, newest first, stopping once older shards cannot matter."""
+        page_query(limit, cursor, offset, domain, since, until) # Rejects a malformed cursor up front
+        newest = min(ALL_TIME[1] if until is None else until, int(cursor.split(":", 1)[0]) if cursor else ALL_TIME[1])
+        want = offset + limit + 1
+        key = lambda p: (p['timestamp'] is not None, p['timestamp'] or 0, p['parent_id'])
+        pages = []
+        for shard in self._shards_between(since, newest):
+            # Shards come by descending end; once this one ends before the last page we keep, so do the rest
+            if len(pages) >= want and shard.stop <= (pages[-1]['timestamp'] or 0): break
+            if shard.page_count == 0: continue
+            sql, args = page_query(want, cursor, 0, domain, since, until)
+            rows = self._read(shard, lambda db: db.execute(sql, args).fetchall())
+            pages += [dict(zip(PAGE_FIELDS, row)) for row in rows]
+            pages = sorted(pages, key=key, reverse=True)[:want]
+        next_cursor = None
+        if len(pages) > offset + limit:
+            last = pages[offset + limit - 1]
+            next_cursor = f"{last['timestamp']}:{last['parent_id']}"
+        return pages[offset : offset + limit], next_cursor
+
+class BoundedExecutor:
+    """Thread pool that rejects new work once `max_pending` jobs are queued or running."""
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _release(self, _future):
+        with self._lock: self._pending -= 1
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self._max_pending:
+                raise HTTPException(status_code=503, detail="Memory engine busy", headers={"Retry-After": "1"})
+            self._pending += 1
+        # Released when the job finishes, even if the awaiting request is cancelled
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+class IngestJob:
+    """One queued page and its outcome."""
+    def __init__(self, page: PageContent):
+        self.id = uuid.uuid4().hex
+        self.page = page
+        self.status = "queued"
+        self.memory_id = None
+        self.error = None
+        self.created = int(time.time() * 1000)
+        self.finished = None
+        self.future = Future()
+
+    def finish(self, result):
+        self.finished = int(time.time() * 1000)
+        if isinstance(result, Exception):
+            self.status = "failed"
+            self.error = str(getattr(result, 'detail', result))
+            self.future.set_exception(result)
+        else:
+            self.status = "done"
+            self.memory_id = result['id']
+            self.future.set_result(result)
+
+    def to_status(self) -> IngestJobStatus:
+        return IngestJobStatus(
+            job_id=self.id, url=self.page.url, status=self.status, memory_id=self.memory_id,
+            error=self.error, created=self.created, finished=self.finished,
+        )
+
+class IngestQueue:
+    """Background ingest: a worker thread coalesces queued pages into micro-batches.
+
+    `process_batch` takes a list of pages and returns, per page, the stored
+    metadata or the exception that rejected it.
+    """
+    def __init__(self, process_batch, max_pending: int, batch_pages: int, batch_wait_ms: int):
+        self._process_batch = process_batch
+        self._max_pending = max_pending
+        self._batch_pages = batch_pages
+        self._batch_wait = batch_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict() # job_id -> IngestJob, oldest first
+        self._lock = threading.Lock()
+        self._worker = None
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self._batched_pages = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, page: PageContent) -> IngestJob:
+        with self._lock:
+            if self._queue.qsize() >= self._max_pending:
+                raise HTTPException(status_code=503, detail="Memory engine busy", headers={"Retry-After": "1"})
+            job = IngestJob(page)
+            self._jobs[job.id] = job
+            while len(self._jobs) > JOB_HISTORY:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.finished is None: break
+                self._jobs.popitem(last=False)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="memory-ingest-queue", daemon=True)
+                self._worker.start()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> IngestQueueStats:
+        return IngestQueueStats(
+            queued=self.depth, running=self.running, completed=self.completed, failed=self.failed,
+            batches=self.batches, avg_batch_pages=self._batched_pages / self.batches if self.batches else 0.0,
+        )
+
+    def _next_batch(self) -> List[IngestJob]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._batch_wait
+        while len(batch) < self._batch_pages:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0: break
+            try: batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty: break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            for job in batch: job.status = "running"
+            self.running = len(batch)
+            try:
+                results = self._process_batch([job.page for job in batch])
+            except Exception as e:
+                logger.error(f"Ingest batch failed: {e}")
+                results = [e] * len(batch)
+            for job, result in zip(batch, results):
+                job.finish(result)
+                if job.status == "done": self.completed += 1
+                else: self.failed += 1
+            self.running = 0
+            self.batches += 1
+            self._batched_pages += len(batch)
+
+def _atomic_write(path: Path, write):
+    """Write via a temp file and rename, so readers never see a partial file."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f: write(f)
+    os.replace(tmp, path)
+
+def write_snapshot(directory: Path, vectors_tmp: Path, vids: np.ndarray):
+    """Swap in vectors_tmp as vectors.npy together with its vids.
+
+    The two renames cannot be atomic together, so a pending marker is
+    written once both files are complete; finish_snapshot() rolls an
+    interrupted swap forward on the next load.
+    """
+    vids_tmp = directory / (VID_SNAPSHOT_FILE + ".tmp")
+    with open(vids_tmp, "wb") as f: np.save(f, vids)
+    pending = {"vectors.npy": vectors_tmp.name, VID_SNAPSHOT_FILE: vids_tmp.name}
+    _atomic_write(directory / SNAPSHOT_PENDING_FILE, lambda f: f.write(json.dumps(pending).encode()))
+    finish_snapshot(directory)
+
+def finish_snapshot(directory: Path):
+    """Complete the renames of a snapshot pair marked pending by write_snapshot()."""
+    marker = directory / SNAPSHOT_PENDING_FILE
+    if not marker.exists(): return
+    with open(marker, "r") as f: pending = json.load(f)
+    for name, tmp in pending.items():
+        if (directory / tmp).exists(): os.replace(directory / tmp, directory / name)
+    marker.unlink()
+
 # ============================================================================
 # Globals
 # ============================================================================
 embedding_engine = None
 memory_store = None
 content_extractor = ContentExtractor()
+write_executor = BoundedExecutor("memory-write", 1, INGEST_QUEUE_LIMIT) # Deletes
+# ingest_pages is defined below; the lambda resolves it when the worker runs
+ingest_queue = IngestQueue(lambda pages: ingest_pages(pages), INGEST_QUEUE_LIMIT, INGEST_BATCH_PAGES, INGEST_BATCH_WAIT_MS)
+result_cache = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+search_executor = BoundedExecutor("memory-search", SEARCH_WORKERS, SEARCH_QUEUE_LIMIT)
+
+_engine_lock = threading.Lock()
+_store_lock = threading.Lock()
 
 def get_embedding_engine():
     global embedding_engine
-    if embedding_engine is None:
-        embedding_engine = EmbeddingEngine()
+    with _engine_lock:
+        if embedding_engine is None:
+            embedding_engine = EmbeddingEngine()
     return embedding_engine
 
 def get_memory_store():
     global memory_store
-    if memory_store is None:
-        memory_store = SimpleMemoryStore()
+    # Held while the store loads, so concurrent first requests wait for one load
+    with _store_lock:
+        if memory_store is None:
+            memory_store = ShardedMemoryStore()
     return memory_store
 
 def get_chunker():
     engine = get_embedding_engine()
+    engine.wait_ready()
     return SemanticChunker(engine.tokenizer)
 
+def warm_up():
+    """Load the model (in its own thread) and the store, so the first requests do not pay for it."""
+    get_embedding_engine().start_loading()
+    start = time.perf_counter()
+    get_memory_store()
+    logger.info(f"Store ready in {time.perf_counter() - start:.1f}s")
+
 # ============================================================================
-# Routes
+# Pipeline (runs on executor threads)
 # ============================================================================
 
-@app.get("/health")
-def health_check():
-    engine = get_embedding_engine()
-    return {
-        "status": "online", 
-        "model": MODEL_NAME,
-        "ai_ready": engine.is_ready()
-    }
-
-@app.post("/init")
-async def init_engine():
-    """Trigger model loading in background."""
-    engine = get_embedding_engine()
-    if not engine.is_ready():
-        engine.load()
-    return {"status": "ready"}
-
-@app.get("/stats", response_model=MemoryStats)
-async def get_stats():
-    return get_memory_store().get_stats()
-
-@app.post("/store", response_model=Memory)
-async def store_memory(page: PageContent):
-    store = get_memory_store()
-    engine = get_embedding_engine()
-    chunker = get_chunker()
-    # For simplified store, deletion is hard without rebuild. 
-    # For MVP, we ignore deletion or implement soft delete.
-    # Let's just append new ones for now to avoid complexity in this file drop.
-    
+def page_text(page: PageContent):
+    """Readable text of a page and its content hash. Raises a 400 if there is too little text."""
     content = page.content
     if page.is_html:
-        content = content_extractor.extract(content)
+        with metrics.timer("extract"):
+            content = content_extractor.extract(content)
         
     if len(content) < 50:
         raise HTTPException(status_code=400, detail="Content too short")
-        
-    chunks = chunker.chunk(content)
+    return content, hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def prepare_page(page: PageContent, store: ShardedMemoryStore, chunker: SemanticChunker) -> Dict[str, Any]:
+    """Extract and chunk a page, or return its stored metadata if it is unchanged."""
+    content, content_hash = page_text(page)
+    # Revisits of an unchanged page are common; skip them before touching the model
+    previous = store.find_page(page.url)
+    if previous is not None and previous.get('content_hash') == content_hash:
+        return {"unchanged": previous}
+    with metrics.timer("chunk"):
+        chunks, token_ids = chunker.chunk_tokens(content)
+    return {"page": page, "chunks": chunks, "token_ids": token_ids, "content_hash": content_hash, "previous": previous}
+
+def build_chunk_metas(prepared: Dict[str, Any]) -> List[Dict[str, Any]]:
+    page, chunks = prepared['page'], prepared['chunks']
     base_id = str(uuid.uuid4())
     timestamp = page.timestamp or int(datetime.now().timestamp() * 1000)
-    
-    first_meta = None
+    metas = []
     
     for i, chunk_text in enumerate(chunks):
-        embedding = engine.embed_passage(chunk_text)
         chunk_id = f"{base_id}_{i}"
         
         meta = {
@@ -402,45 +3038,220 @@ async def store_memory(page: PageContent):
             "engagement_score": page.engagement_score,
             "timestamp": timestamp,
             "chunk_index": i,
-            "total_chunks": len(chunks)
+            "total_chunks": len(chunks),
+            "content_hash": prepared['content_hash']
         }
-        
-        store.add(embedding, meta)
-        if i == 0: first_meta = meta
-        
-    return Memory(**first_meta)
+        metas.append(meta)
+    return metas
 
-@app.post("/search", response_model=List[Memory])
-async def search_memories(query: SearchQuery):
+@profiled("ingest")
+def ingest_pages(pages: List[PageContent]) -> List[Any]:
+    """Ingest pages with a single batched embedding pass and one store flush.
+
+    Returns, per page, the first stored chunk's metadata or the exception
+    that rejected the page.
+    """
     store = get_memory_store()
     engine = get_embedding_engine()
-    
-    q_vec = engine.embed_query(query.query)
-    # Get more to diversify
-    results = store.search(q_vec, query.top_k * 3)
-    
-    # Diversity filter
-    seen_urls = set()
-    diverse = []
-    for r in results:
-        if r['url'] in seen_urls: continue
-        seen_urls.add(r['url'])
-        diverse.append(r)
-        if len(diverse) >= query.top_k: break
-        
-    return [Memory(**r) for r in diverse]
+    chunker = get_chunker()
+    results = [None] * len(pages)
 
-@app.get("/memories", response_model=List[Memory])
-async def list_memories(limit: int = 50, offset: int = 0):
+    # The same URL twice in one batch: only the latest version is stored
+    latest = {page.url: i for i, page in enumerate(pages)}
+    prepared = {}
+    for i in sorted(latest.values()):
+        try:
+            prepared[i] = prepare_page(pages[i], store, chunker)
+        except Exception as e:
+            results[i] = e
+    to_embed = {i: p for i, p in prepared.items() if "unchanged" not in p}
+
+    all_chunks = [c for p in to_embed.values() for c in p['chunks']]
+    token_ids = None
+    if all(p['token_ids'] is not None for p in to_embed.values()):
+        token_ids = [ids for p in to_embed.values() for ids in p['token_ids']]
+    embeddings = engine.embed_passages(all_chunks, token_ids=token_ids)
+    offset = 0
+    for i, p in prepared.items():
+        if i not in to_embed:
+            results[i] = p['unchanged']
+            continue
+        metas = build_chunk_metas(p)
+        store.add_batch(embeddings[offset : offset + len(metas)], metas)
+        offset += len(metas)
+        if p['previous'] is not None:
+            store.delete(p['previous']['parent_id']) # Page changed: replace its old chunks
+        results[i] = metas[0]
+    store.flush()
+    metrics.inc("memory_pages_total", len(to_embed), result="stored")
+    metrics.inc("memory_pages_total", len(prepared) - len(to_embed), result="unchanged")
+    metrics.inc("memory_pages_total", len(latest) - len(prepared), result="rejected")
+    metrics.inc("memory_chunks_stored_total", len(all_chunks))
+
+    for i, page in enumerate(pages):
+        results[i] = results[latest[page.url]]
+    return results
+
+def ingest_page(page: PageContent) -> Dict[str, Any]:
+    """Ingest a single page synchronously. Returns the first chunk's metadata."""
+    result = ingest_pages([page])[0]
+    if isinstance(result, Exception): raise result
+    return result
+
+def run_search(query: SearchQuery) -> List[Dict[str, Any]]:
+    """Embed the query and return diversified hits."""
+    return run_searches([query])[0]
+
+@profiled("search")
+def run_searches(queries: List[SearchQuery]) -> List[List[Dict[str, Any]]]:
+    """Hits for each query, in order: cache misses share one model batch and one store pass."""
+    store = get_memory_store()
+    engine = get_embedding_engine()
+
+    # Entries from an older store generation are stale
+    generation = store.generation
+    results, pending = [None] * len(queries), {} # cache key -> (positions, query, hybrid, filters)
+    for i, query in enumerate(queries):
+        hybrid = HYBRID_SEARCH if query.hybrid is None else query.hybrid
+        filters = query.filters()
+        key = (engine.query_key(query.query), query.top_k, query.min_score, query.nprobe, query.ef_search, hybrid,
+               tuple(sorted(filters.items())) if filters else None)
+        cached = result_cache.get(key)
+        if cached is not None and cached[0] == generation: results[i] = cached[1]
+        elif key in pending: pending[key][0].append(i)
+        else: pending[key] = ([i], query, hybrid, filters)
+    if not pending: return results
+
+    todo = list(pending.items())
+    q_vecs = engine.embed_queries([query.query for _, (_, query, _, _) in todo])
+    found = store.search_batch(q_vecs, [
+        dict(k=query.top_k, nprobe=query.nprobe, ef_search=query.ef_search, filters=filters,
+             query_text=query.query if hybrid else None, min_score=query.min_score)
+        for _, (_, query, hybrid, filters) in todo
+    ], rerank=True)
+    for (key, (positions, _, _, _)), hits in zip(todo, found):
+        result_cache.put(key, (generation, hits))
+        for i in positions: results[i] = hits
+    return results
+
+def remove_memory(memory_id: str) -> int:
     store = get_memory_store()
-    all_mems = list(store.metadata.values())
-    all_mems.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
-    return [Memory(**m) for m in all_mems[offset : offset + limit]]
+    deleted = store.delete(memory_id)
+    store.flush()
+    return len(deleted)
+
+# ============================================================================
+# Routes
+# ============================================================================
+
+@app.get("/health")
+def health_check():
+    engine = get_embedding_engine()
+    return {
+        "status": "online", 
+        "model": MODEL_NAME,
+        "backend": EMBEDDING_BACKEND,
+        "ai_ready": engine.is_ready(),
+        "model_state": engine.state,
+        "store_ready": memory_store is not None,
+        "ingest_queue": ingest_queue.depth,
+        "search_queue": search_executor.pending
+    }
+
+@app.post("/init")
+async def init_engine(wait: bool = False):
+    """Start loading the model in the background. With ?wait=true, respond once it is ready."""
+    engine = get_embedding_engine()
+    engine.start_loading()
+    if wait:
+        await asyncio.get_running_loop().run_in_executor(None, engine.wait_ready)
+    return {"status": engine.state}
+
+@app.get("/stats", response_model=MemoryStats)
+async def get_stats():
+    # Off the event loop: the first call may still be loading the store
+    return await search_executor.run(lambda: get_memory_store().get_stats())
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition: stage latencies, counters and current gauges."""
+    engine, store = get_embedding_engine(), memory_store # Never loads the store
+    gauges = {
+        "memory_model_ready": int(engine.is_ready()),
+        "memory_ingest_queue_depth": ingest_queue.depth,
+        "memory_ingest_running": ingest_queue.running,
+        ("memory_ingest_jobs_total", (("status", "done"),)): ingest_queue.completed,
+        ("memory_ingest_jobs_total", (("status", "failed"),)): ingest_queue.failed,
+        "memory_search_pending": search_executor.pending,
+        "memory_process_rss_bytes": process_rss_bytes(),
+    }
+    for cache, lru in (("query", engine.query_cache), ("result", result_cache)):
+        gauges[("memory_cache_requests_total", (("cache", cache), ("result", "hit")))] = lru.hits
+        gauges[("memory_cache_requests_total", (("cache", cache), ("result", "miss")))] = lru.misses
+    if store is not None:
+        gauges.update({
+            "memory_chunks": store.live_count,
+            "memory_pages": store.page_count,
+            "memory_index_vectors": store.index_vectors,
+            "memory_index_tombstones": store.tombstone_count,
+            "memory_last_update_timestamp_ms": store.last_update,
+            "memory_shards": len(store.shards),
+            "memory_shards_loaded": len(store.loaded_shards),
+        })
+    return Response(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.post("/store", response_model=IngestJobStatus, status_code=202)
+async def store_memory(page: PageContent, response: Response, wait: bool = False):
+    """Queue a page for ingest. With ?wait=true, respond once it is stored."""
+    job = ingest_queue.submit(page)
+    if wait:
+        await asyncio.wrap_future(job.future)
+        response.status_code = 200
+    return job.to_status()
+
+@app.get("/jobs", response_model=IngestQueueStats)
+async def ingest_stats():
+    return ingest_queue.stats()
+
+@app.get("/jobs/{job_id}", response_model=IngestJobStatus)
+async def job_status(job_id: str):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_status()
+
+@app.post("/search", response_model=List[Memory])
+async def search_memories(query: SearchQuery):
+    return [Memory(**r) for r in await search_executor.run(run_search, query)]
+
+@app.post("/search/batch", response_model=List[List[Memory]])
+async def search_batch(queries: List[SearchQuery]):
+    """Several searches in one request, answered in order with one model batch and one index pass."""
+    if len(queries) > SEARCH_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {SEARCH_BATCH_LIMIT} queries per batch")
+    return [[Memory(**r) for r in hits] for hits in await search_executor.run(run_searches, queries)]
+
+@app.get("/memories", response_model=List[Memory])
+async def list_memories(response: Response, limit: int = 50, offset: int = 0, cursor: Optional[str] = None,
+                        domain: Optional[str] = None, since: Optional[int] = None, until: Optional[int] = None):
+    """Stored pages, newest first. Pass the X-Next-Cursor header back as `cursor` to continue."""
+    limit = max(1, min(limit, 500))
+    try:
+        pages, next_cursor = await search_executor.run(
+            get_memory_store().list_pages, limit, cursor, offset, domain, since, until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor: response.headers["X-Next-Cursor"] = next_cursor
+    # A page is listed by its parent ID, which DELETE /memory accepts
+    return [Memory(id=p['parent_id'], content=p['summary'] or "", **p) for p in pages]
 
 @app.delete("/memory/{memory_id}")
 async def delete_memory(memory_id: str):
-    # Not implemented fully in SimpleStore for MVP
-    return {"status": "not_implemented_yet"}
+    """Delete one chunk by its ID, or a whole page by its parent ID."""
+    deleted = await write_executor.run(remove_memory, memory_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Memory not found")
+    return {"status": "deleted", "deleted": deleted}
 
 if __name__ == "__main__":
     import uvicorn
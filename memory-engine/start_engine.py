@@ -7,17 +7,16 @@ Starts the memory engine with proper initialization.
 import subprocess
 import sys
 import os
+import importlib.util
 from pathlib import Path
 
 def check_dependencies():
-    """Check if required packages are installed."""
-    required = ['fastapi', 'uvicorn', 'sentence_transformers', 'faiss', 'bs4']
+    """Check if required packages are installed (without importing them, which takes seconds)."""
+    required = ['fastapi', 'uvicorn', 'sentence_transformers', 'faiss', 'lxml']
     missing = []
     
     for pkg in required:
-        try:
-            __import__(pkg)
-        except ImportError:
+        if importlib.util.find_spec(pkg) is None:
             missing.append(pkg)
     
     if missing: